@@ -1,37 +1,271 @@
 # AgentRegistryService のエントリポイント（AIAgentの登録・管理API）
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
+import asyncio
+import base64
+import binascii
 import json
+import logging
 import os
+import sys
+import time
 import uuid
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
+from storage import create_store, migrate_legacy_file
+from registry_index import RegistryIndex
+from change_feed import ChangeFeed
+# ローカル実行時は src/common の共通モジュールを参照する（コンテナでは /common にマウント）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from telemetry import Telemetry, TelemetryMiddleware
 
 app = FastAPI()
+# 永続化・一覧のシリアライズ等の所要時間を /metrics で公開し、X-Request-ID ごとのスパンを /traces で返す
+telemetry = Telemetry("agent_registry_service")
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
 
-REGISTRY_FILE = '/work/agents.json'
+# 永続化先ディレクトリとバックエンド（journal: 追記型ジャーナル / sqlite: SQLite WAL）
+REGISTRY_DIR = os.environ.get("REGISTRY_DIR", "/work")
+REGISTRY_STORAGE = os.environ.get("REGISTRY_STORAGE", "journal")
+# 旧形式（全件を書き直すJSONファイル）。ストアが空の場合のみ起動時に取り込む
+REGISTRY_FILE = os.path.join(REGISTRY_DIR, 'agents.json')
+# watchで差分を返せる変更履歴の件数・long-pollの最大待ち時間（秒）
+WATCH_HISTORY = int(os.environ.get("WATCH_HISTORY", "1000"))
+WATCH_MAX_TIMEOUT = float(os.environ.get("WATCH_MAX_TIMEOUT", "60"))
+# 登録のリース期間（秒）。登録時の lease_ttl で上書き可能。0 で期限切れ判定を無効化
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "30"))
+# リース切れを確認する間隔（秒）
+LEASE_SWEEP_INTERVAL = float(os.environ.get("LEASE_SWEEP_INTERVAL", "5"))
+# リース切れのまま残ったインスタンスを登録解除するまでの時間（リース期限からの秒数）。0 で登録解除しない
+LEASE_PRUNE_AFTER = float(os.environ.get("LEASE_PRUNE_AFTER", "600"))
 
-def load_agents() -> Dict[str, dict]:
-    if os.path.exists(REGISTRY_FILE):
-        with open(REGISTRY_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+store = create_store(REGISTRY_STORAGE, REGISTRY_DIR)
+agents: Dict[str, dict] = migrate_legacy_file(store, store.load(), REGISTRY_FILE)
+index = RegistryIndex()
+index.rebuild(agents)
+feed = ChangeFeed(revision=store.revision, history=WATCH_HISTORY)
+# 全件一覧のシリアライズ結果（リビジョン, bytes）。書き込みがあるまで使い回す
+_list_cache = (None, b"")
+# (artifactID, endpoint) ごとのリース期限（time.monotonic基準）。ハートビートはメモリ上でのみ更新する
+leases: Dict[Tuple[str, str], float] = {}
+telemetry.callback("registry_revision", "レジストリのリビジョン", lambda: feed.revision)
+telemetry.callback("registry_instances", "状態ごとのインスタンス数",
+                   lambda: {status: sum(1 for a in agents.values() for i in instances_of(a) if i.get('status') == status)
+                            for status in ('active', 'expired')}, label="status")
 
-def save_agents(agents: Dict[str, dict]):
-    with open(REGISTRY_FILE, 'w') as f:
-        json.dump(agents, f, ensure_ascii=False, indent=2)
+def lease_ttl_of(agent: dict) -> float:
+    ttl = agent.get('lease_ttl')
+    return float(ttl) if isinstance(ttl, (int, float)) and ttl >= 0 else LEASE_TTL
 
-agents = load_agents()
+def normalize_tasks(tasks: list) -> List[dict]:
+    """
+    タスク定義のキャッシュ関連メタデータを正規化する。
+    idempotent は bool、cache_ttl は0以上の秒数とし、idempotent でないタスクの cache_ttl は0にする
+    （副作用のあるタスクの結果を呼び出し側で使い回さないため）。type を持たない要素は除く。
+    """
+    normalized = []
+    for task in tasks:
+        if not isinstance(task, dict) or not task.get('type'):
+            continue
+        idempotent = task.get('idempotent') is True
+        ttl = task.get('cache_ttl')
+        ttl = float(ttl) if isinstance(ttl, (int, float)) and not isinstance(ttl, bool) and ttl > 0 else 0.0
+        normalized.append({**task, 'idempotent': idempotent, 'cache_ttl': ttl if idempotent else 0.0})
+    return normalized
 
+def instances_of(agent: dict) -> List[dict]:
+    """
+    エージェントのインスタンス（レプリカ）一覧。instances を持たない旧形式は endpoint を1件として扱う。
+    """
+    if isinstance(agent.get('instances'), list):
+        return agent['instances']
+    return [{'endpoint': agent.get('endpoint'), 'status': agent.get('status', 'active')}]
+
+def renew_lease(agent_id: str, endpoint: str):
+    ttl = lease_ttl_of(agents[agent_id])
+    leases[(agent_id, endpoint)] = time.monotonic() + ttl if ttl > 0 else float('inf')
+
+# 再起動直後は全インスタンスに1期間分の猶予を与え、その間のハートビートで生存を確認する
+for _agent_id, _agent in agents.items():
+    for _instance in instances_of(_agent):
+        renew_lease(_agent_id, _instance['endpoint'])
+
+def save_agent(artifact_id: str, data: dict, op: str) -> int:
+    """
+    永続化・索引・変更履歴をまとめて更新し、新しいリビジョンを返す。
+    """
+    with telemetry.stage("store_put", backend=REGISTRY_STORAGE):
+        store.put(artifact_id, data, revision=feed.revision + 1)
+    agents[artifact_id] = data
+    index.add(artifact_id, data)
+    return feed.record(op, artifact_id, data)
+
+def with_instances(agent: dict, instances: List[dict]) -> dict:
+    """
+    インスタンス一覧からエージェント全体の status と代表 endpoint を決め直した新しいdictを返す。
+    いずれかのインスタンスが active ならエージェントも active。
+    """
+    live = [i for i in instances if i['status'] == 'active']
+    primary = (live or instances)[0]['endpoint'] if instances else agent.get('endpoint')
+    return {**agent, 'instances': instances, 'endpoint': primary, 'status': 'active' if live else 'expired'}
+
+def set_instance_status(agent_id: str, endpoint: str, status: str):
+    agent = agents[agent_id]
+    instances = instances_of(agent)
+    if all(i['status'] == status for i in instances if i['endpoint'] == endpoint):
+        return
+    logging.info(f"[AgentRegistryService] {agent_id} ({endpoint}) のstatusを {status} に変更")
+    instances = [{**i, 'status': status} if i['endpoint'] == endpoint else i for i in instances]
+    save_agent(agent_id, with_instances(agent, instances), 'status')
+
+def expire_leases() -> int:
+    """
+    リース期限を過ぎた active なインスタンスを expired にし、件数を返す。
+    """
+    now = time.monotonic()
+    expired = []
+    for (agent_id, endpoint), deadline in leases.items():
+        if deadline >= now or agent_id not in agents:
+            continue
+        if any(i['endpoint'] == endpoint and i['status'] == 'active' for i in instances_of(agents[agent_id])):
+            expired.append((agent_id, endpoint))
+    for agent_id, endpoint in expired:
+        set_instance_status(agent_id, endpoint, 'expired')
+    return len(expired)
+
+def prune_leases() -> int:
+    """
+    リース期限から LEASE_PRUNE_AFTER 秒を過ぎても expired のままのインスタンスを登録解除し、件数を返す。
+    最後のインスタンスが外れたエージェントは削除する。対応するエージェントが無いリースも捨てる。
+    """
+    if LEASE_PRUNE_AFTER <= 0:
+        return 0
+    threshold = time.monotonic() - LEASE_PRUNE_AFTER
+    stale = [key for key, deadline in leases.items() if deadline < threshold]
+    pruned = 0
+    for agent_id, endpoint in stale:
+        agent = agents.get(agent_id)
+        if agent is None:
+            leases.pop((agent_id, endpoint), None)
+            continue
+        if any(i['endpoint'] == endpoint and i['status'] == 'expired' for i in instances_of(agent)):
+            logging.info(f"[AgentRegistryService] リース切れが続いた {agent_id} ({endpoint}) を登録解除")
+            remove_instance(agent_id, endpoint)
+            pruned += 1
+    return pruned
+
+async def lease_sweeper():
+    while True:
+        await asyncio.sleep(LEASE_SWEEP_INTERVAL)
+        try:
+            expire_leases()
+            prune_leases()
+        except Exception as e:
+            logging.error(f"[AgentRegistryService] リース確認で例外発生: {e}")
+
+_sweeper_task = None
+
+@app.on_event("startup")
+async def start_lease_sweeper():
+    global _sweeper_task
+    _sweeper_task = asyncio.create_task(lease_sweeper())
+
+@app.on_event("shutdown")
+def close_store():
+    if _sweeper_task:
+        _sweeper_task.cancel()
+    store.close()
+
+def encode_cursor(agent_id: str) -> str:
+    return base64.urlsafe_b64encode(agent_id.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+def current_etag() -> str:
+    return f'"{feed.revision}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+def serialized_agent_list() -> bytes:
+    global _list_cache
+    if _list_cache[0] != feed.revision:
+        with telemetry.stage("serialize_list"):
+            body = json.dumps(list(agents.values()), ensure_ascii=False).encode("utf-8")
+        _list_cache = (feed.revision, body)
+    return _list_cache[1]
+
+def project(agent: dict, fields: Optional[list]) -> dict:
+    if fields is None:
+        return agent
+    return {k: agent[k] for k in ["artifactID", *fields] if k in agent}
+
+@app.get("/agents/watch")
+async def watch_agents(since: int, timeout: float = 30.0):
+    """
+    since より後の登録・更新・削除の差分を返すlong-poll API。
+    差分が無ければ最大timeout秒待ち、変更があった時点で返す（タイムアウト時は changes が空）。
+    履歴から差分を復元できないほど古いsinceの場合は 410 を返すので、GET /agents で全件を取り直す。
+    """
+    changes = await feed.wait(since, min(max(timeout, 0.0), WATCH_MAX_TIMEOUT))
+    if changes is None:
+        return JSONResponse(status_code=410, content={"error": "revision too old, resync required", "revision": feed.revision})
+    return JSONResponse(
+        content={"revision": feed.revision, "changes": changes},
+        headers={"ETag": current_etag()},
+    )
+
+# 一覧・詳細の参照はメモリ上の処理だけなので async def でイベントループ上で実行する。
+# 同期 def だとスレッドプールで動き、イベントループ上の登録・ハートビート・削除と agents / index を同時に触るため
+# （途中で消えたIDの KeyError や、ETag と本文のリビジョンのずれが起きうる）
 @app.get("/agents")
-def list_agents():
-    """AIAgentの一覧を返すAPI"""
-    return list(agents.values())
+async def list_agents(
+    request: Request,
+    response: Response,
+    name: Optional[str] = None,
+    capability: Optional[str] = None,
+    task: Optional[str] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    AIAgentの一覧を返すAPI
+    - name / capability / task: 二次索引による絞り込み（AND条件）
+    - fields: 返す項目をカンマ区切りで指定（artifactIDは常に含む）例: fields=name,endpoint
+    - limit / cursor: artifactID順のページング。続きがある場合は X-Next-Cursor ヘッダで次のcursorを返す
+    ETagはレジストリのリビジョンで、If-None-Match が一致すれば 304 を返す。
+    """
+    etag = current_etag()
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    ids = index.query(name=name, capability=capability, task=task)
+    field_list = [f for f in fields.split(",") if f] if fields else None
+    if ids is None and limit is None and cursor is None and field_list is None:
+        return Response(content=serialized_agent_list(), media_type="application/json", headers={"ETag": etag})
+    page, last = index.page(ids, decode_cursor(cursor) if cursor else None, limit)
+    response.headers["ETag"] = etag
+    if last is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(last)
+    return [project(agents[i], field_list) for i in page]
 
-@app.get("/agents/{agent_id}")
-def get_agent(agent_id: str):
-    """AIAgentの詳細を返すAPI"""
+@app.get("/agents/{agent_id:path}")
+async def get_agent(agent_id: str, request: Request, response: Response):
+    """AIAgentの詳細を返すAPI（ETag/If-None-Match対応）"""
     agent = agents.get(agent_id)
     if agent:
+        etag = current_etag()
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return agent
     raise HTTPException(status_code=404, detail="not found")
 
@@ -45,20 +279,84 @@ async def register_agent(request: Request):
         return JSONResponse(status_code=400, content={'error': 'artifactID, name, description, capabilities(list), endpoint are required'})
     if 'tasks' not in data or not isinstance(data['tasks'], list):
         data['tasks'] = []
-    agents[artifact_id] = data
-    save_agents(agents)
-    return {'result': 'ok', 'artifactID': artifact_id}
+    data['tasks'] = normalize_tasks(data['tasks'])
+    # 同じartifactIDで別endpointから登録された場合はレプリカとしてインスタンスに追加する
+    # 登録直後は生存扱い。以降はハートビートが途絶えるとリース切れで expired になる
+    endpoint = data['endpoint']
+    existing = agents.get(artifact_id)
+    instances = [i for i in instances_of(existing) if i['endpoint'] != endpoint] if existing else []
+    instances.append({'endpoint': endpoint, 'status': 'active'})
+    op = 'update' if existing else 'register'
+    revision = save_agent(artifact_id, with_instances(data, instances), op)
+    renew_lease(artifact_id, endpoint)
+    return {'result': 'ok', 'artifactID': artifact_id, 'revision': revision, 'lease_ttl': lease_ttl_of(data)}
+
+@app.post("/agents/{agent_id:path}/heartbeat")
+async def heartbeat(agent_id: str, request: Request):
+    """
+    リースを更新するハートビートAPI。本文の {"endpoint": ...} でインスタンスを指定する
+    （省略時は全インスタンス）。未登録の場合は404を返すので、エージェントは再登録する。
+    リース切れ（expired）だったインスタンスは active に戻す。
+    """
+    body = await request.body()
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="body must be JSON")
+    endpoint = payload.get('endpoint') if isinstance(payload, dict) else None
+    if not isinstance(payload, dict) or not isinstance(endpoint, (str, type(None))):
+        raise HTTPException(status_code=400, detail='body must be {"endpoint": string}')
+    agent = agents.get(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="not found")
+    endpoints = [i['endpoint'] for i in instances_of(agent)]
+    if endpoint is not None:
+        if endpoint not in endpoints:
+            raise HTTPException(status_code=404, detail="instance not found")
+        endpoints = [endpoint]
+    for ep in endpoints:
+        renew_lease(agent_id, ep)
+        set_instance_status(agent_id, ep, 'active')
+    return {'result': 'ok', 'lease_ttl': lease_ttl_of(agents[agent_id])}
 
-@app.delete("/agents/{agent_id}")
-def delete_agent(agent_id: str):
+@app.delete("/agents/{agent_id:path}/instances")
+async def delete_instance(agent_id: str, endpoint: str):
+    """
+    レプリカを1つ登録解除するAPI。最後のインスタンスを外した場合はエージェントごと削除する。
+    """
+    agent = agents.get(agent_id)
+    instances = instances_of(agent) if agent else []
+    if not any(i['endpoint'] == endpoint for i in instances):
+        raise HTTPException(status_code=404, detail="not found")
+    return {'result': 'deleted', 'revision': remove_instance(agent_id, endpoint)}
+
+@app.delete("/agents/{agent_id:path}")
+async def delete_agent(agent_id: str):
     """AIAgentの削除API"""
     # artifactIDで削除できるようにキー名を変更
     if agent_id in agents:
-        del agents[agent_id]
-        save_agents(agents)
-        return {'result': 'deleted'}
+        return {'result': 'deleted', 'revision': remove_agent(agent_id)}
     raise HTTPException(status_code=404, detail="not found")
 
+def remove_instance(agent_id: str, endpoint: str) -> int:
+    """
+    インスタンスを1つ外して新しいリビジョンを返す。最後の1つならエージェントごと削除する。
+    """
+    leases.pop((agent_id, endpoint), None)
+    remaining = [i for i in instances_of(agents[agent_id]) if i['endpoint'] != endpoint]
+    if not remaining:
+        return remove_agent(agent_id)
+    return save_agent(agent_id, with_instances(agents[agent_id], remaining), 'update')
+
+def remove_agent(agent_id: str) -> int:
+    with telemetry.stage("store_delete", backend=REGISTRY_STORAGE):
+        store.delete(agent_id, revision=feed.revision + 1)
+    for instance in instances_of(agents[agent_id]):
+        leases.pop((agent_id, instance['endpoint']), None)
+    del agents[agent_id]
+    index.remove(agent_id)
+    return feed.record('delete', agent_id, None)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5002, reload=True)
@@ -0,0 +1,132 @@
+# 永続化バックエンドごとの登録・削除レイテンシを登録件数別に計測するベンチマーク
+# 使い方: python bench_storage.py [--sizes 10,100,1000,10000] [--ops 200]
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from storage import JournalStore, SqliteStore
+
+
+def make_agent(i: int) -> dict:
+    return {
+        "artifactID": f"bench.example.com/agent_{i}",
+        "name": f"BenchAgent{i}",
+        "description": "ベンチマーク用のダミーAIAgent。" * 4,
+        "capabilities": ["list_metrics", "get_cpu_metrics", "get_memory_metrics"],
+        "endpoint": f"http://agent_{i}:5000",
+        "tasks": [
+            {"type": "get_cpu_metrics", "parameters": {}, "requires_consent": False},
+            {"type": "get_memory_metrics", "parameters": {}, "requires_consent": False},
+        ],
+    }
+
+
+class LegacyFileStore:
+    """
+    比較用: 変更のたびに全件を indent=2 で書き直す旧実装。
+    """
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, "agents.json")
+        self.agents = {}
+
+    def load(self):
+        return {}
+
+    def _save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.agents, f, ensure_ascii=False, indent=2)
+
+    def put(self, agent_id, data):
+        self.agents[agent_id] = data
+        self._save()
+
+    def delete(self, agent_id):
+        self.agents.pop(agent_id, None)
+        self._save()
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "journal": lambda d: JournalStore(d),
+    "sqlite": lambda d: SqliteStore(os.path.join(d, "agents.db")),
+    "legacy": lambda d: LegacyFileStore(d),
+}
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+
+def bench(backend: str, size: int, ops: int) -> dict:
+    directory = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+    try:
+        store = BACKENDS[backend](directory)
+        store.load()
+        # 事前投入（計測対象外）。旧実装は1回の書き出しで済ませる
+        if isinstance(store, LegacyFileStore):
+            store.agents = {make_agent(i)["artifactID"]: make_agent(i) for i in range(size)}
+        else:
+            for i in range(size):
+                agent = make_agent(i)
+                store.put(agent["artifactID"], agent)
+        put_samples, delete_samples = [], []
+        for i in range(size, size + ops):
+            agent = make_agent(i)
+            t = time.perf_counter()
+            store.put(agent["artifactID"], agent)
+            put_samples.append(time.perf_counter() - t)
+        for i in range(size, size + ops):
+            t = time.perf_counter()
+            store.delete(make_agent(i)["artifactID"])
+            delete_samples.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        reopened = BACKENDS[backend](directory)
+        loaded = len(reopened.load()) if not isinstance(reopened, LegacyFileStore) else size
+        recovery = time.perf_counter() - t
+        store.close()
+        reopened.close()
+        return {
+            "backend": backend,
+            "agents": size,
+            "register": summarize(put_samples),
+            "delete": summarize(delete_samples),
+            "recovery_ms": round(recovery * 1000, 3),
+            "recovered": loaded,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--backends", default="journal,sqlite,legacy")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+    results = []
+    for backend in args.backends.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.append(bench(backend, size, args.ops))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':8} {'agents':>7} {'reg p50':>9} {'reg p99':>9} {'del p50':>9} {'del p99':>9} {'recovery':>9}  (ms)")
+    for r in results:
+        print(f"{r['backend']:8} {r['agents']:>7} {r['register']['p50_ms']:>9} {r['register']['p99_ms']:>9} "
+              f"{r['delete']['p50_ms']:>9} {r['delete']['p99_ms']:>9} {r['recovery_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
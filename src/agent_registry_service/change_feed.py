@@ -0,0 +1,54 @@
+# レジストリの変更履歴（リビジョン付き）と、変更を待ち受けるwatch用の通知
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+class ChangeFeed:
+    """
+    登録・更新・削除のたびにリビジョンを1つ進め、直近 history 件の差分を保持する。
+    watch は指定リビジョン以降の差分を返し、差分が無ければ次の変更まで待つ。
+    """
+    def __init__(self, revision: int = 0, history: int = 1000):
+        self.revision = revision
+        self._changes: deque = deque(maxlen=history)
+        self._event = asyncio.Event()
+
+    def record(self, op: str, agent_id: str, agent: Optional[dict]) -> int:
+        """
+        op は register / update / delete / status（リースによる状態変化）のいずれか。
+        """
+        self.revision += 1
+        self._changes.append({"revision": self.revision, "op": op, "artifactID": agent_id, "agent": agent})
+        # 待機中のwatchを起こし、次の変更用に新しいEventに差し替える
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+        return self.revision
+
+    def oldest_available(self) -> int:
+        """
+        差分を返せる最も古いsinceの値。これより古い場合は全件の再取得が必要。
+        """
+        if not self._changes:
+            return self.revision
+        return self._changes[0]["revision"] - 1
+
+    def since(self, revision: int) -> Optional[List[Dict[str, Any]]]:
+        if revision < self.oldest_available():
+            return None
+        return [c for c in self._changes if c["revision"] > revision]
+
+    async def wait(self, revision: int, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """
+        revision より後の差分を返す。無ければ最大timeout秒待つ（タイムアウト時は空リスト）。
+        履歴から差分を復元できない場合はNone。
+        """
+        changes = self.since(revision)
+        if changes is None or changes:
+            return changes
+        event = self._event
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+        return self.since(revision)
@@ -0,0 +1,92 @@
+# AgentRegistryService の二次索引（name / capability / task type）とページング用の順序付きID一覧
+import bisect
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def _task_types(data: dict) -> Iterable[str]:
+    return [t.get("type") for t in data.get("tasks") or [] if isinstance(t, dict) and t.get("type")]
+
+
+class RegistryIndex:
+    """
+    登録・削除のたびに更新する二次索引。
+    name/capability/task type からartifactIDの集合をO(1)で引け、
+    ページング用にartifactIDをソート済みで保持する。
+    """
+    def __init__(self):
+        self.by_name: Dict[str, Set[str]] = {}
+        self.by_capability: Dict[str, Set[str]] = {}
+        self.by_task: Dict[str, Set[str]] = {}
+        self.sorted_ids: List[str] = []
+        self._entries: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _keys(data: dict) -> tuple:
+        return (
+            [data.get("name")] if data.get("name") else [],
+            [c for c in data.get("capabilities") or [] if isinstance(c, str)],
+            list(_task_types(data)),
+        )
+
+    def add(self, agent_id: str, data: dict):
+        self.remove(agent_id)
+        keys = self._keys(data)
+        for index, values in zip((self.by_name, self.by_capability, self.by_task), keys):
+            for v in values:
+                index.setdefault(v, set()).add(agent_id)
+        self._entries[agent_id] = keys
+        bisect.insort(self.sorted_ids, agent_id)
+
+    def remove(self, agent_id: str):
+        keys = self._entries.pop(agent_id, None)
+        if keys is None:
+            return
+        for index, values in zip((self.by_name, self.by_capability, self.by_task), keys):
+            for v in values:
+                ids = index.get(v)
+                if ids is not None:
+                    ids.discard(agent_id)
+                    if not ids:
+                        del index[v]
+        pos = bisect.bisect_left(self.sorted_ids, agent_id)
+        if pos < len(self.sorted_ids) and self.sorted_ids[pos] == agent_id:
+            del self.sorted_ids[pos]
+
+    def rebuild(self, agents: Dict[str, dict]):
+        self.by_name, self.by_capability, self.by_task = {}, {}, {}
+        self.sorted_ids, self._entries = [], {}
+        for agent_id, data in agents.items():
+            self.add(agent_id, data)
+
+    def query(self, name: Optional[str] = None, capability: Optional[str] = None,
+              task: Optional[str] = None) -> Optional[Set[str]]:
+        """
+        条件に一致するartifactIDの集合を返す。条件が無い場合はNone（全件）。
+        """
+        sets = []
+        if name is not None:
+            sets.append(self.by_name.get(name, set()))
+        if capability is not None:
+            sets.append(self.by_capability.get(capability, set()))
+        if task is not None:
+            sets.append(self.by_task.get(task, set()))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def page(self, ids: Optional[Set[str]], after: Optional[str], limit: Optional[int]) -> tuple:
+        """
+        artifactID順に after より後ろの最大limit件と、続きがある場合の最後のIDを返す。
+        """
+        if ids is None:
+            ordered = self.sorted_ids
+            start = bisect.bisect_right(ordered, after) if after is not None else 0
+            end = len(ordered) if limit is None else start + limit
+            page = ordered[start:end]
+            has_more = end < len(ordered)
+        else:
+            ordered = sorted(i for i in ids if after is None or i > after)
+            page = ordered if limit is None else ordered[:limit]
+            has_more = limit is not None and len(ordered) > limit
+        return page, (page[-1] if has_more and page else None)
@@ -0,0 +1,227 @@
+# AgentRegistryService の永続化バックエンド（追記型ジャーナル / SQLite WAL）
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+
+class AgentStore(ABC):
+    """
+    エージェント情報の永続化インタフェース。
+    put/delete は1件単位で原子的かつ永続的に書き込み、登録件数に比例したコストを掛けない。
+    revision にはレジストリのリビジョン番号を保持し、load() 後に最新値が入る。
+    """
+    revision = 0
+
+    @abstractmethod
+    def load(self) -> Dict[str, dict]:
+        """
+        永続化済みの全エージェントを返す（起動時の復旧用）。
+        """
+        pass
+
+    @abstractmethod
+    def put(self, agent_id: str, data: dict, revision: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, agent_id: str, revision: Optional[int] = None):
+        pass
+
+    def close(self):
+        pass
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JournalStore(AgentStore):
+    """
+    追記型ジャーナル + スナップショットによるストア。
+    書き込みは1行のJSONを追記してfsyncするだけなので件数に依存しない。
+    ジャーナルが登録件数に対して十分大きくなったら、スナップショットを一時ファイルに
+    書いて os.replace で置き換え（原子的）、ジャーナルを空にする（コンパクション）。
+    起動時はスナップショットを読み、ジャーナルを再生する。書き込み途中で途切れた
+    末尾行は無視する。
+    """
+    def __init__(self, directory: str, compact_min_entries: int = 1000, compact_ratio: float = 2.0):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "agents.snapshot.json")
+        self.journal_path = os.path.join(directory, "agents.journal")
+        self.compact_min_entries = compact_min_entries
+        self.compact_ratio = compact_ratio
+        self._agents: Dict[str, dict] = {}
+        self._journal_entries = 0
+        self._journal = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self) -> Dict[str, dict]:
+        with self._lock:
+            agents: Dict[str, dict] = {}
+            revision = 0
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r") as f:
+                    snapshot = json.load(f)
+                agents = snapshot["agents"]
+                revision = snapshot.get("revision", 0)
+            entries = 0
+            valid_size = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "rb") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            logging.warning("[JournalStore] 途中で途切れたジャーナル行を破棄します")
+                            break
+                        if record.get("op") == "put":
+                            agents[record["id"]] = record["data"]
+                        elif record.get("op") == "del":
+                            agents.pop(record["id"], None)
+                        revision = max(revision, record.get("rev", 0))
+                        entries += 1
+                        valid_size += len(line)
+                # 壊れた末尾行があれば切り詰めてから追記を再開する
+                if valid_size != os.path.getsize(self.journal_path):
+                    with open(self.journal_path, "r+b") as f:
+                        f.truncate(valid_size)
+            self._agents = agents
+            self.revision = revision
+            self._journal_entries = entries
+            self._journal = open(self.journal_path, "ab")
+            self._maybe_compact()
+            return dict(agents)
+
+    def _append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._journal.write(line)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_entries += 1
+
+    def put(self, agent_id: str, data: dict, revision: Optional[int] = None):
+        with self._lock:
+            self.revision = self.revision if revision is None else revision
+            self._append({"op": "put", "id": agent_id, "data": data, "rev": self.revision})
+            self._agents[agent_id] = data
+            self._maybe_compact()
+
+    def delete(self, agent_id: str, revision: Optional[int] = None):
+        with self._lock:
+            self.revision = self.revision if revision is None else revision
+            self._append({"op": "del", "id": agent_id, "rev": self.revision})
+            self._agents.pop(agent_id, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        threshold = max(self.compact_min_entries, int(len(self._agents) * self.compact_ratio))
+        if self._journal_entries >= threshold:
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"revision": self.revision, "agents": self._agents}, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_dir(self.directory)
+        # スナップショット確定後にジャーナルを空にする（途中で落ちても再生は冪等）
+        self._journal.close()
+        self._journal = open(self.journal_path, "wb")
+        os.fsync(self._journal.fileno())
+        self._journal_entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+
+class SqliteStore(AgentStore):
+    """
+    SQLite（WALモード）によるストア。1件ごとにトランザクションをコミットする。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 登録・削除のハンドラ（async def）からイベントループ上で呼ばれる。接続は呼び出し元のスレッドを問わず
+        # 使えるようにし（check_same_thread=False）、データ行とリビジョンの更新はロックで直列化する
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS agents (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM agents").fetchall()
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        self.revision = row[0] if row else 0
+        return {agent_id: json.loads(data) for agent_id, data in rows}
+
+    def _write(self, sql: str, params: tuple, revision: Optional[int]):
+        # データ行とリビジョンを同一トランザクションで更新する
+        with self._lock:
+            self.revision = self.revision if revision is None else revision
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(sql, params)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)", (self.revision,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def put(self, agent_id: str, data: dict, revision: Optional[int] = None):
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        self._write("INSERT OR REPLACE INTO agents (id, data) VALUES (?, ?)", (agent_id, body), revision)
+
+    def delete(self, agent_id: str, revision: Optional[int] = None):
+        self._write("DELETE FROM agents WHERE id = ?", (agent_id,), revision)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_store(kind: str, directory: str) -> AgentStore:
+    """
+    REGISTRY_STORAGE の値（journal | sqlite）に応じたストアを返す。
+    """
+    if kind == "sqlite":
+        return SqliteStore(os.path.join(directory, "agents.db"))
+    if kind == "journal":
+        return JournalStore(directory)
+    raise ValueError(f"Unknown registry storage: {kind}")
+
+
+def migrate_legacy_file(store: AgentStore, agents: Dict[str, dict], legacy_path: str) -> Dict[str, dict]:
+    """
+    旧形式の agents.json があり、ストアが空の場合のみ内容を取り込む。
+    1件ごとにリビジョンを進めるので、移行後の ETag・変更履歴の位置は空のレジストリと区別できる。
+    """
+    if agents or not os.path.exists(legacy_path):
+        return agents
+    with open(legacy_path, "r") as f:
+        legacy = json.load(f)
+    for agent_id, data in legacy.items():
+        store.put(agent_id, data, revision=store.revision + 1)
+    logging.info(f"[AgentStore] {legacy_path} から {len(legacy)} 件を移行しました")
+    return dict(legacy)
@@ -0,0 +1,172 @@
+import asyncio
+import inspect
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from telemetry import Telemetry
+
+# 同期ハンドラを実行するスレッドプールの上限
+AGENT_EXECUTOR_WORKERS = int(os.environ.get("AGENT_EXECUTOR_WORKERS", "8"))
+
+
+def task_handler(task_type: str, blocking: bool = True):
+    """
+    メソッドをタスクのハンドラとして登録するデコレータ。ハンドラは params(dict) を受け取る。
+    async def のハンドラはイベントループ上で実行し、同期ハンドラは blocking=True（既定）なら
+    スレッドプールで、blocking=False（メモリ参照だけ等、すぐ終わる処理）ならその場で実行する。
+    """
+    def decorator(fn):
+        fn._task_type = task_type
+        fn._blocking = blocking
+        return fn
+    return decorator
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class AIAgentBase(ABC):
+    """
+    AIAgentのベースクラス。
+    各AIAgentサービスはこのクラスを継承して実装します。
+    タスクは @task_handler で登録したメソッドに振り分け、get_tasks() の各タスク定義の
+    max_concurrency（同時実行数の上限）と timeout（秒）を実行時に適用します。
+    """
+    def __init__(self, name: str, description: str, capabilities: List[str], endpoint: str,
+                 max_workers: Optional[int] = None):
+        self.name = name
+        self.description = description
+        self.capabilities = capabilities
+        self.endpoint = endpoint
+        self.agent_id = None  # 登録時にAgentRegistryServiceから付与
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or AGENT_EXECUTOR_WORKERS,
+                                            thread_name_prefix=f"{name}-task")
+        # ディスパッチテーブル: タスク種別 -> バインド済みハンドラ
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        for attr in dir(type(self)):
+            fn = getattr(type(self), attr, None)
+            if callable(fn) and hasattr(fn, "_task_type"):
+                self._handlers[fn._task_type] = getattr(self, attr)
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._task_defs: Optional[Dict[str, Dict[str, Any]]] = None
+        self.task_stats: Dict[str, Dict[str, int]] = {}
+        # タスクごとの所要時間・エラー数（/metrics）と、X-Request-ID ごとのスパン（/traces）
+        self.telemetry = Telemetry(name)
+        self.telemetry.callback("agent_task_calls_total", "タスクごとの呼び出し数",
+                                lambda: {t: s["calls"] for t, s in self.task_stats.items()}, kind="counter", label="task")
+        self.telemetry.callback("agent_task_timeouts_total", "タスクごとのタイムアウト数",
+                                lambda: {t: s["timeouts"] for t, s in self.task_stats.items()}, kind="counter", label="task")
+
+    @abstractmethod
+    def get_tasks(self) -> List[Dict[str, Any]]:
+        """
+        /tasksエンドポイントで返すタスク定義リスト。
+        各AIAgentで必須実装。
+        例: [{"type": "get_cpu_metrics", "parameters": {...}, "max_concurrency": 4, "timeout": 5}, ...]
+        """
+        pass
+
+    def _task_def(self, task_type: str) -> Dict[str, Any]:
+        if self._task_defs is None:
+            self._task_defs = {t["type"]: t for t in self.get_tasks()}
+        return self._task_defs.get(task_type, {})
+
+    def _limit(self, task_type: str) -> Optional[asyncio.Semaphore]:
+        limit = self._task_def(task_type).get("max_concurrency")
+        if not limit:
+            return None
+        semaphore = self._limits.get(task_type)
+        if semaphore is None:
+            semaphore = self._limits[task_type] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _stats(self, task_type: str) -> Dict[str, int]:
+        stats = self.task_stats.get(task_type)
+        if stats is None:
+            stats = self.task_stats[task_type] = {"calls": 0, "in_flight": 0, "errors": 0, "timeouts": 0}
+        return stats
+
+    async def _invoke(self, handler, params: Dict[str, Any]) -> Any:
+        if inspect.iscoroutinefunction(handler):
+            return await handler(params)
+        if not getattr(handler, "_blocking", True):
+            return handler(params)
+        # 同期ハンドラはイベントループを塞がないようスレッドプールで実行する
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(handler, params))
+
+    async def run(self, task_type: str, params: Dict[str, Any]) -> Any:
+        """
+        タスクを実行して結果を返す。未知のタスクは {"error": ...} を返し、
+        timeout を超えた場合は TaskTimeout を送出する（スレッドで実行中の処理は止まらない）。
+        """
+        handler = self._handlers.get(task_type)
+        if handler is None:
+            return {"error": "Unknown task type"}
+        stats = self._stats(task_type)
+        stats["calls"] += 1
+        timeout = self._task_def(task_type).get("timeout")
+        semaphore = self._limit(task_type)
+
+        async def call():
+            if semaphore is None:
+                return await self._invoke(handler, params)
+            async with semaphore:
+                return await self._invoke(handler, params)
+
+        stats["in_flight"] += 1
+        try:
+            with self.telemetry.stage(f"task.{task_type}"):
+                return await asyncio.wait_for(call(), timeout=timeout) if timeout else await call()
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            raise TaskTimeout(f"Task '{task_type}' timed out after {timeout}s")
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+
+    async def run_batch(self, tasks: List[Any]) -> List[Dict[str, Any]]:
+        """
+        複数タスクを並行に実行し、入力と同じ順序で {"result": ...} または {"error": ...} を返す。
+        """
+        async def run_item(item):
+            if not isinstance(item, dict) or not item.get("type"):
+                return {"error": "type is required"}
+            try:
+                return {"result": await self.run(item["type"], item.get("parameters") or {})}
+            except Exception as e:
+                return {"error": f"{type(e).__name__}: {e}"}
+        return await asyncio.gather(*(run_item(item) for item in tasks))
+
+    def handle_request(self, task_type: str, params: Dict[str, Any]) -> Any:
+        """
+        同期的にタスクを実行する（ベンチマーク・テスト等、イベントループ外から呼ぶ場合用）。
+        """
+        handler = self._handlers.get(task_type)
+        if handler is None:
+            return {"error": "Unknown task type"}
+        if inspect.iscoroutinefunction(handler):
+            return asyncio.run(handler(params))
+        return handler(params)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_registry_info(self) -> Dict[str, Any]:
+        """
+        AgentRegistryServiceへ登録するための情報を返す。
+        """
+        artifact_id = os.environ.get("ARTIFACT_ID")
+        return {
+            'artifactID': artifact_id,
+            'name': self.name,
+            'description': self.description,
+            'capabilities': self.capabilities,
+            'endpoint': self.endpoint,
+            'tasks': self.get_tasks()  # tasksも必ず含める
+        }
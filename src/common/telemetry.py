@@ -0,0 +1,375 @@
+# 各サービス共通の軽量な計測モジュール（Prometheus テキスト形式の /metrics と、HTTP をまたぐトレースID）
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 直近何件のトレース（スパン一覧）を /traces/{id} 用に保持するか
+TRACE_HISTORY = int(os.environ.get("TRACE_HISTORY", "1000"))
+# これより遅いHTTPリクエストはスパンの内訳をログに出す（ミリ秒、0で無効）
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "1000"))
+
+# サービス間で引き継ぐトレースIDのヘッダ
+TRACE_HEADER = "X-Request-ID"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def lines(self) -> List[str]:
+        """
+        Prometheus テキスト形式のサンプル行を返す（# HELP / # TYPE 行は含めない）。
+        """
+        pass
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    """
+    累積バケット方式のヒストグラム。ラベルの組ごとにバケット件数・合計・件数を持つ。
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [バケットごとの件数（非累積、末尾は +Inf）, 合計, 件数]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        out = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                out.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            out.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            out.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return out
+
+
+class _Callback(_Metric):
+    """
+    /metrics の出力時に fn() を呼んで値を得る。既存の stats dict をそのまま公開するために使う。
+    label を指定した場合 fn は {ラベル値: 値} を、指定しない場合は数値を返す。
+    """
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], Any], label: Optional[str]):
+        super().__init__(name, help)
+        self.kind = kind
+        self.fn = fn
+        self.label = label
+
+    def lines(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logging.warning(f"[telemetry] {self.name} の取得に失敗しました: {e}")
+            return []
+        if value is None:
+            return []
+        if self.label:
+            return [f"{self.name}{_format_labels(((self.label, str(k)),))} {_format_value(v)}"
+                    for k, v in value.items() if isinstance(v, (int, float))]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Trace:
+    __slots__ = ("trace_id", "started", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def trace_headers() -> Dict[str, str]:
+    """
+    下流サービスへのHTTP呼び出しに付けるヘッダ（トレース中でなければ空）。
+    """
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+
+class _Stage:
+    """
+    with / async with のどちらでも使える区間計測。所要時間・実行中の数・例外の数を記録し、
+    トレース中であればスパンとして追加する。
+    """
+    __slots__ = ("telemetry", "name", "attrs", "started")
+
+    def __init__(self, telemetry: "Telemetry", name: str, attrs: Dict[str, Any]):
+        self.telemetry = telemetry
+        self.name = name
+        self.attrs = attrs
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.telemetry.stage_in_flight.inc(stage=self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t = self.telemetry
+        elapsed = time.perf_counter() - self.started
+        t.stage_in_flight.dec(stage=self.name)
+        t.stage_seconds.observe(elapsed, stage=self.name)
+        if exc_type is not None:
+            t.stage_errors.inc(stage=self.name, error=exc_type.__name__)
+        trace = _current_trace.get()
+        if trace is not None:
+            span = {"service": t.service, "stage": self.name,
+                    "start_ms": round((self.started - trace.started) * 1000, 3),
+                    "duration_ms": round(elapsed * 1000, 3)}
+            if self.attrs:
+                span.update(self.attrs)
+            if exc_type is not None:
+                span["error"] = exc_type.__name__
+            trace.spans.append(span)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Telemetry:
+    """
+    1サービス（1プロセス）分のメトリクスとトレースを保持する。
+    stage(name) で区間を計測する。app.add_middleware(TelemetryMiddleware, telemetry=...) で組み込むと
+    HTTP リクエストごとの計測・トレースIDの受け渡し（X-Request-ID）・/metrics・/traces/{trace_id} が有効になる。
+    """
+    def __init__(self, service: str, trace_history: int = TRACE_HISTORY, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.service = service
+        self.slow_request_ms = slow_request_ms
+        self._metrics: "OrderedDict[str, _Metric]" = OrderedDict()
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._trace_history = trace_history
+        self._trace_lock = threading.Lock()
+        self.http_seconds = self.histogram("http_request_duration_seconds", "HTTPリクエストの処理時間（秒）")
+        self.http_in_flight = self.gauge("http_requests_in_flight", "処理中のHTTPリクエスト数")
+        self.http_requests = self.counter("http_requests_total", "HTTPリクエスト数（ステータス別）")
+        self.stage_seconds = self.histogram("stage_duration_seconds", "処理区間ごとの所要時間（秒）")
+        self.stage_in_flight = self.gauge("stage_in_flight", "処理区間ごとの実行中の数")
+        self.stage_errors = self.counter("stage_errors_total", "処理区間ごとの例外の数")
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def callback(self, name: str, help: str, fn: Callable[[], Any], kind: str = "gauge", label: Optional[str] = None):
+        self._register(_Callback(name, help, kind, fn, label))
+
+    def stage(self, name: str, **attrs) -> _Stage:
+        return _Stage(self, name, attrs)
+
+    def render(self) -> str:
+        """
+        Prometheus テキスト形式（version 0.0.4）。全系列に service ラベルを付ける。
+        """
+        service = f'service="{_escape(self.service)}"'
+        out = []
+        for metric in list(self._metrics.values()):
+            lines = metric.lines()
+            if not lines:
+                continue
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            for line in lines:
+                name_part, value = line.rsplit(" ", 1)
+                if name_part.endswith("}"):
+                    name_part = name_part[:-1] + "," + service + "}"
+                else:
+                    name_part = name_part + "{" + service + "}"
+                out.append(f"{name_part} {value}")
+        return "\n".join(out) + "\n"
+
+    def _store_trace(self, trace: Trace):
+        if self._trace_history <= 0 or not trace.spans:
+            return
+        with self._trace_lock:
+            spans = self._traces.get(trace.trace_id)
+            if spans is None:
+                self._traces[trace.trace_id] = list(trace.spans)
+            else:
+                spans.extend(trace.spans)
+                self._traces.move_to_end(trace.trace_id)
+            while len(self._traces) > self._trace_history:
+                self._traces.popitem(last=False)
+
+    def get_trace(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._trace_lock:
+            spans = self._traces.get(trace_id)
+            return list(spans) if spans is not None else None
+
+
+class TelemetryMiddleware:
+    """
+    ASGI ミドルウェア。受け取った X-Request-ID（無ければ新規採番）をトレースIDとして
+    リクエストの処理中に引き継ぎ、応答ヘッダにも返す。/metrics と /traces/{trace_id} はここで応答する。
+    """
+    def __init__(self, app, telemetry: Telemetry):
+        self.app = app
+        self.telemetry = telemetry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        if path == "/metrics":
+            await self._respond(send, 200, self.telemetry.render().encode(), b"text/plain; version=0.0.4; charset=utf-8")
+            return
+        if path.startswith("/traces/"):
+            spans = self.telemetry.get_trace(path[len("/traces/"):])
+            if spans is None:
+                await self._respond(send, 404, b'{"detail":"not found"}', b"application/json")
+            else:
+                body = json.dumps({"trace_id": path[len("/traces/"):], "spans": spans}, ensure_ascii=False)
+                await self._respond(send, 200, body.encode(), b"application/json")
+            return
+        incoming = None
+        for name, value in scope.get("headers") or []:
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")[:128]
+                break
+        trace = Trace(incoming or uuid.uuid4().hex)
+        token = _current_trace.set(trace)
+        t = self.telemetry
+        status = {"code": 500}
+        header = (TRACE_HEADER.lower().encode(), trace.trace_id.encode("latin-1"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = {**message, "headers": list(message.get("headers") or []) + [header]}
+            await send(message)
+
+        method = scope.get("method", "")
+        t.http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            t.http_in_flight.dec()
+            _current_trace.reset(token)
+            # ルートのテンプレート（/agents/{agent_id:path} 等）で集計し、系列数がIDの数で増えないようにする
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            t.http_seconds.observe(elapsed, method=method, route=route)
+            t.http_requests.inc(method=method, route=route, status=status["code"])
+            trace.spans.append({"service": t.service, "stage": f"http {method} {route}", "start_ms": 0.0,
+                                "duration_ms": round(elapsed * 1000, 3), "status": status["code"]})
+            t._store_trace(trace)
+            if t.slow_request_ms > 0 and elapsed * 1000 >= t.slow_request_ms:
+                breakdown = ", ".join(f"{s['stage']}={s['duration_ms']}ms" for s in trace.spans)
+                logging.warning(f"[telemetry] slow request {method} {path} trace={trace.trace_id} "
+                                f"{elapsed * 1000:.1f}ms: {breakdown}")
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, content_type: bytes):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -1,12 +1,23 @@
-from ai_agent_base import AIAgentBase
-from typing import List, Dict, Any
-import subprocess
-# Gemini用のimport例（google.generativeai）
+import asyncio
 import os
+import sys
+# ローカル実行時は src/common の共通モジュールを参照する（コンテナでは /app にコピー済み）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from ai_agent_base import AIAgentBase, task_handler
+from command_runner import CommandRunner
+from suggestion_cache import SuggestionCache, cache_key
+from suggestion_dispatcher import SuggestionDispatcher
+from typing import List, Dict, Any, Optional
+# Gemini用のimport例（google.generativeai）
 import google.generativeai as genai
 
+# run_command は requires_consent のタスクなので、同意を得た呼び出し元が "confirmed": true を付けた場合のみ実行する
+CONFIRMATION_REQUIRED = "run_command requires explicit confirmation (\"confirmed\": true)"
+
 class LinuxCommandAIAgent(AIAgentBase):
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, runner: Optional[CommandRunner] = None,
+                 suggestions: Optional[SuggestionCache] = None, suggest_concurrency: int = 8,
+                 batch_window: float = 0.0, batch_max: int = 8):
         super().__init__(
             name="LinuxCommandAIAgent",
             description="Linuxサーバ上でコマンド提案や実行を行い、システム操作や自動化を支援するAIAgent。コマンドライン操作の自動化や運用効率化に利用可能。",
@@ -20,54 +31,82 @@ class LinuxCommandAIAgent(AIAgentBase):
         self.gemini_api_key = os.environ.get("GEMINI_API_KEY")
         if self.gemini_api_key:
             genai.configure(api_key=self.gemini_api_key)
-        self.gemini_model = "gemini-pro"
+        self.gemini_model = os.environ.get("GEMINI_MODEL", "gemini-pro")
+        # 提案結果は (正規化した指示, モデル名) ごとにメモリとディスクにキャッシュし、
+        # キャッシュに無い指示はLLMへ問い合わせる（同じ指示の同時呼び出しは1回にまとめ、
+        # batch_window > 0 なら異なる指示も検証付きで1回にまとめる）
+        self.suggestions = suggestions or SuggestionCache()
+        self.dispatcher = SuggestionDispatcher(self._complete, max_concurrency=suggest_concurrency,
+                                               batch_window=batch_window, max_batch=batch_max)
+        # コマンドはシェルを介さず、資源制限・出力上限付きで実行する
+        self.runner = runner or CommandRunner()
+        self.telemetry.callback("suggestion_cache_events_total", "提案キャッシュのヒット・ミス",
+                                lambda: {k: v for k, v in self.suggestions.stats.items()}, kind="counter", label="event")
+        self.telemetry.callback("command_processes", "実行中・空き待ちのコマンド数",
+                                lambda: {"running": self.runner.stats["running"], "waiting": self.runner.stats["waiting"]},
+                                label="state")
 
-    def suggest_command(self, user_instruction: str) -> Dict[str, Any]:
-        """
-        ユーザの指示からコマンドラインを提案する（Gemini利用）
+    async def _complete(self, prompt: str) -> str:
+        async with self.telemetry.stage("llm", model=self.gemini_model):
+            model = genai.GenerativeModel(self.gemini_model)
+            response = await model.generate_content_async(prompt)
+            return response.text
+
+    async def suggest_command(self, user_instruction: str) -> Dict[str, Any]:
         """
-        if not self.gemini_api_key:
-            return {"error": "GEMINI_API_KEY not set"}
-        prompt = f"""
-        ユーザの指示: {user_instruction}
-        上記の指示を実現するLinuxコマンドを1行で提案してください。
-        コマンドのみを返してください。
+        ユーザの指示からコマンドラインを提案する（Gemini利用）。
+        cache は提案の出どころ（memory | disk | llm）。
         """
-        try:
-            response = genai.chat.completions.create(
-                model=self.gemini_model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            command = response.choices[0].message.content.strip()
-            return {"suggested_command": command}
-        except Exception as e:
-            return {"error": str(e)}
+        if not user_instruction or not user_instruction.strip():
+            return {"error": "user_instruction is required"}
+        key = cache_key(user_instruction, self.gemini_model)
+        command, source = self.suggestions.get_memory(key), "memory"
+        if command is None:
+            command, source = await asyncio.to_thread(self.suggestions.get_disk, key), "disk"
+        if command is None:
+            if not self.gemini_api_key:
+                return {"error": "GEMINI_API_KEY not set"}
+            try:
+                command, source = await self.dispatcher.suggest(user_instruction), "llm"
+            except Exception as e:
+                return {"error": str(e)}
+            if command:
+                await asyncio.to_thread(self.suggestions.set, key, user_instruction, self.gemini_model, command)
+        return {"suggested_command": command, "cache": source}
 
-    def run_command(self, command: str, working_directory: str = "/tmp") -> Dict[str, Any]:
+    async def run_command(self, command: str, working_directory: str = "/tmp") -> Dict[str, Any]:
         """
-        指定コマンドを実行する（安全のためダミー実装。実運用時は要サニタイズ）
+        指定コマンドを実行し、終了コード・stdout・stderr を返す。
+        シェルは使わないため、パイプやリダイレクトは解釈されない。
         """
-        try:
-            # 実際のコマンド実行例（危険なので本番は要制限）
-            # result = subprocess.check_output(command, shell=True, cwd=working_directory, text=True)
-            # return {"result": result}
-            return {"result": f"実行: {command} (in {working_directory})"}
-        except Exception as e:
-            return {"error": str(e)}
+        async with self.telemetry.stage("subprocess"):
+            return await self.runner.run(command, working_directory)
+
+    @task_handler("suggest_command")
+    async def handle_suggest_command(self, params: Dict[str, Any]) -> Any:
+        user_instruction = params.get("user_instruction", "")
+        return await self.suggest_command(user_instruction)
+
+    @task_handler("run_command")
+    async def handle_run_command(self, params: Dict[str, Any]) -> Any:
+        if params.get("confirmed") is not True:
+            return {"error": CONFIRMATION_REQUIRED}
+        cmd = params.get("command", "echo 'no command'")
+        working_dir = params.get("working_directory") or "/tmp"
+        return await self.run_command(cmd, working_dir)
 
-    def handle_request(self, task_type: str, params: Dict[str, Any]) -> Any:
-        if task_type == "suggest_command":
-            user_instruction = params.get("user_instruction", "")
-            return self.suggest_command(user_instruction)
-        elif task_type == "run_command":
-            cmd = params.get("command", "echo 'no command'")
-            working_dir = params.get("working_directory", "/tmp")
-            return self.run_command(cmd, working_dir)
-        else:
-            return {"error": "Unknown task type"}
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tasks": self.task_stats,
+            "suggestion_cache": self.suggestions.describe(),
+            "suggestion_dispatcher": self.dispatcher.describe(),
+            "command_runner": self.runner.describe(),
+        }
 
     def get_tasks(self) -> List[Dict[str, Any]]:
         return [
-            {"type": "suggest_command", "parameters": {"user_instruction": "str"}, "requires_consent": False},
-            {"type": "run_command", "parameters": {"command": "str", "working_directory": "str (optional)"}, "requires_consent": True}
+            {"type": "suggest_command", "parameters": {"user_instruction": "str"}, "requires_consent": False,
+             "max_concurrency": 8, "timeout": 60},
+            {"type": "run_command", "parameters": {"command": "str", "working_directory": "str (optional)"}, "requires_consent": True,
+             "max_concurrency": 4, "timeout": 60}
         ]
@@ -1,15 +1,57 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
-from ai_agent import LinuxCommandAIAgent
+from fastapi.responses import JSONResponse, StreamingResponse
+from ai_agent import LinuxCommandAIAgent, CONFIRMATION_REQUIRED
+from ai_agent_base import TaskTimeout
+from telemetry import TelemetryMiddleware
+from command_runner import CommandRunner
+from suggestion_cache import SuggestionCache
 import os
+import json
+import asyncio
 import requests
+from urllib.parse import quote
 
 app = FastAPI()
 
 # エージェントのエンドポイントURL（本番では環境変数や設定ファイルで指定）
 ENDPOINT = os.environ.get("AGENT_ENDPOINT", "http://localhost:5003")
 REGISTRY_URL = os.environ.get("AGENT_REGISTRY_URL", "http://agent_registry_service:5002/agents")
-agent = LinuxCommandAIAgent(endpoint=ENDPOINT)
+# レジストリへのハートビート間隔とリース期間（秒）。リース期間内にハートビートが届かないと expired 扱いになる
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "10"))
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "30"))
+# /run/batch で1回に受け付けるタスク数の上限
+BATCH_MAX_TASKS = int(os.environ.get("BATCH_MAX_TASKS", "100"))
+# コマンド実行の同時プロセス数・実時間/CPU時間の上限（秒）・メモリ上限（MB）・stdout/stderr それぞれの保持上限（バイト）
+COMMAND_MAX_PROCESSES = int(os.environ.get("COMMAND_MAX_PROCESSES", "4"))
+COMMAND_TIMEOUT = float(os.environ.get("COMMAND_TIMEOUT", "30"))
+COMMAND_CPU_SECONDS = int(os.environ.get("COMMAND_CPU_SECONDS", "10"))
+COMMAND_MEMORY_MB = int(os.environ.get("COMMAND_MEMORY_MB", "512"))
+COMMAND_OUTPUT_LIMIT = int(os.environ.get("COMMAND_OUTPUT_LIMIT", "65536"))
+# 実行を許可するプログラム名（カンマ区切り、PATH から解決する）。空なら制限しない
+COMMAND_ALLOWED_PROGRAMS = [p.strip() for p in os.environ.get("COMMAND_ALLOWED_PROGRAMS", "").split(",") if p.strip()]
+runner = CommandRunner(
+    max_processes=COMMAND_MAX_PROCESSES,
+    timeout=COMMAND_TIMEOUT,
+    cpu_seconds=COMMAND_CPU_SECONDS,
+    memory_mb=COMMAND_MEMORY_MB,
+    output_limit=COMMAND_OUTPUT_LIMIT,
+    allowed_programs=COMMAND_ALLOWED_PROGRAMS or None,
+)
+# suggest_command のキャッシュ（SQLiteの保存先・メモリ上の件数・有効期間（秒、0で無期限））
+SUGGEST_CACHE_PATH = os.environ.get("SUGGEST_CACHE_PATH", "/work/suggestions.db")
+SUGGEST_CACHE_MEMORY = int(os.environ.get("SUGGEST_CACHE_MEMORY", "1024"))
+SUGGEST_CACHE_TTL = float(os.environ.get("SUGGEST_CACHE_TTL", str(7 * 86400)))
+# 提案のためのLLM呼び出しの同時実行数（同じ指示の同時呼び出しは1回にまとめる）
+SUGGEST_MAX_CONCURRENCY = int(os.environ.get("SUGGEST_MAX_CONCURRENCY", "8"))
+# 同時に届いた異なる指示を1回のLLM呼び出しにまとめる待ち時間（ミリ秒、既定0で無効）と1回の上限件数
+SUGGEST_BATCH_WINDOW_MS = float(os.environ.get("SUGGEST_BATCH_WINDOW_MS", "0"))
+SUGGEST_BATCH_MAX = int(os.environ.get("SUGGEST_BATCH_MAX", "8"))
+suggestions = SuggestionCache(path=SUGGEST_CACHE_PATH or None, max_memory=SUGGEST_CACHE_MEMORY, ttl=SUGGEST_CACHE_TTL)
+agent = LinuxCommandAIAgent(endpoint=ENDPOINT, runner=runner, suggestions=suggestions,
+                            suggest_concurrency=SUGGEST_MAX_CONCURRENCY,
+                            batch_window=SUGGEST_BATCH_WINDOW_MS / 1000, batch_max=SUGGEST_BATCH_MAX)
+# /metrics・/traces/{trace_id} を公開し、SuperAgentServer から届いた X-Request-ID をスパンに紐付ける
+app.add_middleware(TelemetryMiddleware, telemetry=agent.telemetry)
 
 @app.on_event("startup")
 def register_agent():
@@ -17,6 +59,7 @@ def register_agent():
         info = agent.get_registry_info()
         # agent.get_tasks()の結果を直接セット
         info["tasks"] = agent.get_tasks()
+        info["lease_ttl"] = LEASE_TTL
         print(f"[DEBUG] registry info to POST: {info}")
         resp = requests.post(REGISTRY_URL, json=info, timeout=5)
         resp.raise_for_status()
@@ -25,6 +68,35 @@ def register_agent():
     except Exception as e:
         print(f"[ERROR] Agent registration failed: {e}")
 
+def send_heartbeat():
+    artifact_id = agent.get_registry_info()["artifactID"]
+    # 同じartifactIDのレプリカが複数ある場合に備え、自インスタンスのendpointを指定する
+    resp = requests.post(f"{REGISTRY_URL}/{quote(artifact_id, safe='/')}/heartbeat", json={"endpoint": ENDPOINT}, timeout=5)
+    if resp.status_code == 404:
+        # レジストリから消えている（再起動でデータを失った等）場合は登録し直す
+        print("[INFO] Agent not found in registry, registering again")
+        register_agent()
+        return
+    resp.raise_for_status()
+
+async def heartbeat_loop():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            await asyncio.to_thread(send_heartbeat)
+        except Exception as e:
+            print(f"[ERROR] Heartbeat failed: {e}")
+
+@app.on_event("startup")
+async def start_heartbeat():
+    app.state.heartbeat_task = asyncio.create_task(heartbeat_loop())
+
+@app.on_event("shutdown")
+async def stop_heartbeat():
+    app.state.heartbeat_task.cancel()
+    agent.shutdown()
+    suggestions.close()
+
 @app.post("/run")
 async def run_task(request: Request):
     data = await request.json()
@@ -32,7 +104,55 @@ async def run_task(request: Request):
     params = data.get("parameters", {})
     if not task_type:
         return JSONResponse(status_code=400, content={"error": "type is required"})
-    return agent.handle_request(task_type, params)
+    try:
+        return await agent.run(task_type, params)
+    except TaskTimeout as e:
+        return JSONResponse(status_code=504, content={"error": str(e)})
+
+@app.post("/run/batch")
+async def run_batch(request: Request):
+    """
+    複数タスクをまとめて受け取り並行に実行する。結果は入力と同じ順序で、1件ごとに
+    {"result": ...} または {"error": ...} を返す（1件の失敗は他に影響しない）。
+    """
+    data = await request.json()
+    tasks = data.get("tasks") if isinstance(data, dict) else None
+    if not isinstance(tasks, list):
+        return JSONResponse(status_code=400, content={"error": "tasks must be a list"})
+    if len(tasks) > BATCH_MAX_TASKS:
+        return JSONResponse(status_code=413, content={"error": f"too many tasks (max {BATCH_MAX_TASKS})"})
+    return {"results": await agent.run_batch(tasks)}
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/run_command/stream")
+async def run_command_stream(request: Request):
+    """
+    コマンドを実行し、stdout/stderr を出力のたびに SSE（event: stdout | stderr）で返す。
+    最後に event: exit（終了コード等）を返す。クライアントが切断するとプロセスを終了させる。
+    run_command と同じく、利用者の同意を得たことを示す "confirmed": true が無ければ実行しない。
+    """
+    data = await request.json()
+    command = data.get("command")
+    if not command:
+        return JSONResponse(status_code=400, content={"error": "command is required"})
+    if data.get("confirmed") is not True:
+        return JSONResponse(status_code=403, content={"error": CONFIRMATION_REQUIRED})
+
+    async def events():
+        async for event in runner.stream(command, data.get("working_directory") or "/tmp"):
+            yield format_sse(event.pop("event"), event)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats")
+def get_stats():
+    """
+    タスクごとの実行件数、提案キャッシュ・バッチ、コマンド実行の統計を返す。
+    """
+    return agent.get_stats()
 
 @app.get("/tasks")
 def list_tasks():
@@ -0,0 +1,230 @@
+# LinuxCommandAIAgent のコマンド実行（非同期サブプロセス + 資源制限 + 出力上限 + ストリーミング）
+import asyncio
+import codecs
+import os
+import shlex
+import shutil
+import signal
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple
+
+# rlimit を設定してから対象コマンドに exec するラッパー
+RLIMIT_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rlimit_exec.py")
+
+
+class CommandRunner:
+    """
+    コマンドをシェルを介さずに asyncio.create_subprocess_exec で実行する。
+      - 同時に実行するプロセス数を max_processes に制限する（超えた分は空きを待つ）
+      - allowed_programs を指定した場合、argv[0] はパスを含まないプログラム名に限り、その中のものだけを
+        PATH から解決した絶対パスで実行する（"./ls" や "/tmp/x/ls" で許可を迂回させない）
+      - 子プロセスに CPU時間・アドレス空間・書き込みファイルサイズの rlimit を設定する
+        （rlimit_exec.py を経由して exec する。preexec_fn はスレッドのあるプロセスでは安全でないため使わない）
+      - timeout 秒を超えたらプロセスグループごと SIGKILL する
+      - stdout/stderr はそれぞれ output_limit バイトまで保持し、超えた分は読み捨てる
+        （読み続けるのでパイプが詰まって子プロセスが止まることはない）
+      - 出力はストリームごとのインクリメンタルデコーダで UTF-8 として読むので、読み込みの区切りで
+        マルチバイト文字が壊れることはない
+    stream() は出力を逐次イベントとして返し、run() はそれをまとめた結果を返す。
+    """
+    def __init__(self, max_processes: int = 4, timeout: float = 30.0, cpu_seconds: int = 10,
+                 memory_mb: int = 512, file_size_mb: int = 64, output_limit: int = 65536,
+                 chunk_size: int = 4096, allowed_programs: Optional[Iterable[str]] = None):
+        self.max_processes = max_processes
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.file_size_mb = file_size_mb
+        self.output_limit = output_limit
+        self.chunk_size = chunk_size
+        self.allowed_programs = set(allowed_programs) if allowed_programs else None
+        self._slots = asyncio.Semaphore(max_processes)
+        self.stats = {"started": 0, "running": 0, "waiting": 0, "completed": 0, "failed_to_start": 0,
+                      "timeouts": 0, "truncated": 0}
+
+    def _wrapped(self, argv: list) -> list:
+        limits = [self.cpu_seconds, self.memory_mb * 1024 * 1024, self.file_size_mb * 1024 * 1024]
+        return [sys.executable, "-I", "-S", RLIMIT_EXEC, *map(str, limits), "--", *argv]
+
+    def _resolve_program(self, program: str, working_directory: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        exec するプログラムと、実行できない場合のエラーメッセージを返す（exec はラッパー内で行うので、起動前に確認する）。
+        """
+        if self.allowed_programs is not None:
+            if os.sep in program or program not in self.allowed_programs:
+                return None, f"Program not allowed: {program}"
+            path = shutil.which(program)
+            # PATH に相対パスの要素があっても、作業ディレクトリ等に置かれた同名のファイルは使わない
+            if path is None or not os.path.isabs(path):
+                return None, f"FileNotFoundError: {program} not found in PATH"
+            return path, None
+        if os.sep in program:
+            path = os.path.join(working_directory, program)
+            if not (os.path.isfile(path) and os.access(path, os.X_OK)):
+                return None, f"FileNotFoundError: {program} is not an executable file"
+        elif shutil.which(program) is None:
+            return None, f"FileNotFoundError: {program} not found in PATH"
+        return program, None
+
+    async def _pump(self, name: str, reader: asyncio.StreamReader, queue: asyncio.Queue):
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        kept = 0
+        truncated = False
+        while True:
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                break
+            if truncated:
+                continue
+            room = self.output_limit - kept
+            kept += min(len(chunk), room)
+            text = decoder.decode(chunk[:room])
+            if text:
+                await queue.put((name, text))
+            if len(chunk) > room:
+                # 上限の位置で途中になった文字のバイトは捨てる
+                truncated = True
+                await queue.put((name + "_truncated", None))
+        if not truncated:
+            text = decoder.decode(b"", final=True)
+            if text:
+                await queue.put((name, text))
+        await queue.put((name + "_eof", None))
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def stream(self, command: str, working_directory: str = "/tmp",
+                     timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        {"event": "stdout"|"stderr", "data": ...} を出力のたびに返し、最後に
+        {"event": "exit", "exit_code", "timed_out", "truncated", "duration_ms"} を返す。
+        起動できない場合は {"event": "error", "error": ...} のみを返す。
+        """
+        try:
+            argv = shlex.split(command)
+        except ValueError as e:
+            yield {"event": "error", "error": f"Invalid command: {e}"}
+            return
+        if not argv:
+            yield {"event": "error", "error": "command is empty"}
+            return
+        if not os.path.isdir(working_directory):
+            yield {"event": "error", "error": f"working_directory not found: {working_directory}"}
+            return
+        program, problem = self._resolve_program(argv[0], working_directory)
+        if problem:
+            self.stats["failed_to_start"] += 1
+            yield {"event": "error", "error": problem}
+            return
+        argv = [program, *argv[1:]]
+        timeout = min(timeout or self.timeout, self.timeout)
+        self.stats["waiting"] += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats["waiting"] -= 1
+        proc = None
+        pumps = []
+        try:
+            started = time.monotonic()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *self._wrapped(argv),
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=working_directory,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                self.stats["failed_to_start"] += 1
+                yield {"event": "error", "error": f"{type(e).__name__}: {e}"}
+                return
+            self.stats["started"] += 1
+            self.stats["running"] += 1
+            queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+            pumps = [asyncio.create_task(self._pump("stdout", proc.stdout, queue)),
+                     asyncio.create_task(self._pump("stderr", proc.stderr, queue))]
+            deadline = started + timeout
+            open_streams = 2
+            truncated = set()
+            timed_out = False
+            while open_streams:
+                try:
+                    name, data = await asyncio.wait_for(queue.get(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    self._kill(proc)
+                    break
+                if name.endswith("_eof"):
+                    open_streams -= 1
+                elif name.endswith("_truncated"):
+                    truncated.add(name[:-len("_truncated")])
+                else:
+                    yield {"event": name, "data": data}
+            try:
+                exit_code = await asyncio.wait_for(proc.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                timed_out = True
+                self._kill(proc)
+                exit_code = await proc.wait()
+            self.stats["timeouts"] += timed_out
+            self.stats["truncated"] += bool(truncated)
+            yield {
+                "event": "exit",
+                "exit_code": exit_code,
+                "timed_out": timed_out,
+                "truncated": sorted(truncated),
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+        finally:
+            # 呼び出し元が途中でやめた（切断等）場合もプロセスを残さない
+            for pump in pumps:
+                pump.cancel()
+            if proc is not None:
+                if proc.returncode is None:
+                    self._kill(proc)
+                    await proc.wait()
+                self.stats["running"] -= 1
+                self.stats["completed"] += 1
+            self._slots.release()
+
+    async def run(self, command: str, working_directory: str = "/tmp",
+                  timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        stream() の出力をまとめて {"exit_code", "stdout", "stderr", ...} を返す。
+        """
+        out = {"stdout": [], "stderr": []}
+        async for event in self.stream(command, working_directory, timeout):
+            if event["event"] in out:
+                out[event["event"]].append(event["data"])
+            elif event["event"] == "error":
+                return {"error": event["error"]}
+            else:
+                return {
+                    "command": command,
+                    "exit_code": event["exit_code"],
+                    "stdout": "".join(out["stdout"]),
+                    "stderr": "".join(out["stderr"]),
+                    "timed_out": event["timed_out"],
+                    "truncated": event["truncated"],
+                    "duration_ms": event["duration_ms"],
+                }
+        return {"error": "command finished without exit status"}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "max_processes": self.max_processes,
+            "timeout": self.timeout,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+            "output_limit": self.output_limit,
+            "allowed_programs": sorted(self.allowed_programs) if self.allowed_programs is not None else None,
+            **self.stats,
+        }
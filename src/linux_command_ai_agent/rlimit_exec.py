@@ -0,0 +1,25 @@
+# CommandRunner が子プロセスの起動に使うラッパー（rlimit を設定してから対象コマンドに exec する）
+# 使い方: python -I -S rlimit_exec.py <CPU秒> <アドレス空間バイト> <ファイルサイズバイト> -- <argv...>
+# preexec_fn はスレッドのあるプロセスでは fork 後に安全に実行できないため、制限は起動後のこのラッパーで設定する。
+import os
+import resource
+import sys
+
+
+def main(args):
+    cpu_seconds, memory, file_size = (int(v) for v in args[:3])
+    argv = args[4:]
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    try:
+        os.execvp(argv[0], argv)
+    except OSError as e:
+        sys.stderr.write(f"{argv[0]}: {e.strerror}\n")
+        # シェルと同じく、見つからない場合は127、実行できない場合は126
+        sys.exit(127 if isinstance(e, FileNotFoundError) else 126)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
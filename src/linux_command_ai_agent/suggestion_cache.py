@@ -0,0 +1,143 @@
+# suggest_command の結果を (正規化した指示, モデル名) 単位で保持する2段キャッシュ（メモリLRU + SQLite）
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_instruction(instruction: str) -> str:
+    """
+    全角/半角・大文字/小文字・空白の違いと、前後の句読点を吸収した比較用の文字列を返す。
+    例: "ディスク使用量を見る。" と "ディスク使用量を見る" は同じになる。
+    文中の記号（"-a" 等）はコマンドの意味に関わりうるので残す。
+    """
+    text = _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", instruction or "").casefold()).strip()
+    start, end = 0, len(text)
+    while start < end and unicodedata.category(text[start]).startswith("P"):
+        start += 1
+    while end > start and unicodedata.category(text[end - 1]).startswith("P"):
+        end -= 1
+    return text[start:end].strip()
+
+
+def cache_key(instruction: str, model: str) -> str:
+    return hashlib.sha1(f"{model}\0{normalize_instruction(instruction)}".encode("utf-8")).hexdigest()
+
+
+class SuggestionCache:
+    """
+    1段目はプロセス内のLRU（max_memory 件）、2段目は path の SQLite（WALモード）で、再起動後も残る。
+    2段目で見つかった結果は1段目に載せ直す。ttl 秒より古い結果は使わない（0 で無期限）。
+    path が None または開けない場合はメモリのみで動く。
+    get_disk / set はワーカースレッドから呼ばれるので、SQLite への操作と1段目のLRUの更新はそれぞれのロックで直列化する
+    （1段目のロックは辞書の操作の間だけ持つので、イベントループ上の get_memory が SQLite を待つことはない）。
+    """
+    def __init__(self, path: Optional[str] = None, max_memory: int = 1024, ttl: float = 7 * 86400):
+        self.path = path
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "disk_errors": 0}
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS suggestions ("
+                    "key TEXT PRIMARY KEY, model TEXT, instruction TEXT, command TEXT, created_at REAL)")
+                self._db.commit()
+            except (OSError, sqlite3.Error) as e:
+                print(f"[ERROR] Suggestion cache disabled on disk ({path}): {e}")
+                self._db = None
+
+    def _fresh(self, created_at: float) -> bool:
+        return self.ttl <= 0 or time.time() - created_at < self.ttl
+
+    def _remember(self, key: str, created_at: float, command: str):
+        if self.max_memory <= 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = (created_at, command)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def get_memory(self, key: str) -> Optional[str]:
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is None or not self._fresh(entry[0]):
+                return None
+            self._memory.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        return entry[1]
+
+    def get_disk(self, key: str) -> Optional[str]:
+        """
+        2段目を引く（1段目で外れた後に呼ぶ）。外れた場合は misses に数える。
+        """
+        row = None
+        if self._db is not None:
+            try:
+                with self._lock:
+                    row = self._db.execute("SELECT created_at, command FROM suggestions WHERE key = ?",
+                                           (key,)).fetchone()
+            except sqlite3.Error as e:
+                self.stats["disk_errors"] += 1
+                print(f"[ERROR] Suggestion cache read failed: {e}")
+        if row is None or not self._fresh(row[0]):
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, row[0], row[1])
+        return row[1]
+
+    def set(self, key: str, instruction: str, model: str, command: str):
+        created_at = time.time()
+        self._remember(key, created_at, command)
+        self.stats["stores"] += 1
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute("INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?, ?, ?)",
+                                 (key, model, instruction, command, created_at))
+                self._db.commit()
+        except sqlite3.Error as e:
+            self.stats["disk_errors"] += 1
+            print(f"[ERROR] Suggestion cache write failed: {e}")
+
+    def disk_size(self) -> Optional[int]:
+        if self._db is None:
+            return None
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def describe(self) -> Dict[str, Any]:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "path": self.path if self._db is not None else None,
+            "memory_size": len(self._memory),
+            "max_memory": self.max_memory,
+            "disk_size": self.disk_size(),
+            "ttl": self.ttl,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            **self.stats,
+        }
@@ -1,8 +1,16 @@
-from ai_agent_base import AIAgentBase
-from typing import List, Dict, Any
+import os
+import sys
+# ローカル実行時は src/common の共通モジュールを参照する（コンテナでは /app にコピー済み）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from ai_agent_base import AIAgentBase, task_handler
+from proc_collector import ProcCollector
+from timeseries import MetricHistory
+from process_scanner import ProcessScanner
+from typing import List, Dict, Any, Optional
 
 class LinuxMetricsAIAgent(AIAgentBase):
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, collector: Optional[ProcCollector] = None,
+                 history: Optional[MetricHistory] = None, scanner: Optional[ProcessScanner] = None):
         super().__init__(
             name="LinuxMetricsAIAgent",
             description="LinuxサーバのCPU・メモリ・ディスクなど主要なシステムメトリクスを取得し、リソース監視や障害調査を支援するAIAgent。システムの状態把握やパフォーマンス分析に利用可能。",
@@ -10,27 +18,88 @@ class LinuxMetricsAIAgent(AIAgentBase):
                 "list_metrics",
                 "get_cpu_metrics",
                 "get_memory_metrics",
-                "get_disk_metrics"
+                "get_disk_metrics",
+                "get_metric_history",
+                "get_per_core_cpu",
+                "get_top_processes"
             ],
             endpoint=endpoint
         )
+        # メトリクスはバックグラウンドで収集済みの最新サンプルから返す
+        self.collector = collector or ProcCollector()
+        # サンプルごとに履歴へ記録し、期間指定の問い合わせに答える
+        self.history = history or MetricHistory()
+        self.collector.listeners.append(self.history.record)
+        self.scanner = scanner or ProcessScanner()
 
-    def handle_request(self, task_type: str, params: Dict[str, Any]) -> Any:
-        if task_type == "list_metrics":
-            return ["cpu", "memory", "disk"]
-        elif task_type == "get_cpu_metrics":
-            return {"cpu_usage": 42.0}  # ダミー値
-        elif task_type == "get_memory_metrics":
-            return {"memory_usage": 2048}  # ダミー値
-        elif task_type == "get_disk_metrics":
-            return {"disk_usage": 51200}  # ダミー値
-        else:
-            return {"error": "Unknown task type"}
+    # 最新サンプルを参照するだけのタスクはI/Oが無いので、スレッドに渡さずその場で返す
+    @task_handler("list_metrics", blocking=False)
+    def list_metrics(self, params: Dict[str, Any]) -> Any:
+        return ["cpu", "cpu_cores", "memory", "disk", "processes"]
 
+    @task_handler("get_cpu_metrics", blocking=False)
+    def get_cpu_metrics(self, params: Dict[str, Any]) -> Any:
+        sample = self.collector.get()
+        return {**sample["cpu"], "timestamp": sample["timestamp"]}
+
+    @task_handler("get_memory_metrics", blocking=False)
+    def get_memory_metrics(self, params: Dict[str, Any]) -> Any:
+        sample = self.collector.get()
+        return {**sample["memory"], "timestamp": sample["timestamp"]}
+
+    @task_handler("get_disk_metrics", blocking=False)
+    def get_disk_metrics(self, params: Dict[str, Any]) -> Any:
+        sample = self.collector.get()
+        return {"disks": sample["disk"], "timestamp": sample["timestamp"]}
+
+    @task_handler("get_per_core_cpu", blocking=False)
+    def get_per_core_cpu(self, params: Dict[str, Any]) -> Any:
+        sample = self.collector.get()
+        return {"cores": sample["cpu_cores"], "timestamp": sample["timestamp"]}
+
+    @task_handler("get_top_processes")
+    def get_top_processes(self, params: Dict[str, Any]) -> Any:
+        return self.scanner.top(params.get("sort_by") or "cpu", params.get("limit") or 10)
+
+    @task_handler("get_metric_history")
+    def get_metric_history(self, params: Dict[str, Any]) -> Any:
+        return self.history.query(params.get("metric"), params.get("start"), params.get("end"), params.get("step"))
+
+    # keywords は計画生成の候補絞り込みと、LLMを使わない振り分け（SuperAgentServer の FastRouter）で使われる
+    # cache_ttl は値が変わりうる間隔（サンプリング1秒・プロセス走査5秒）に合わせ、それより短い間は呼び出し側で結果を使い回してよい
     def get_tasks(self) -> List[Dict[str, Any]]:
         return [
-            {"type": "list_metrics", "parameters": {}, "requires_consent": False},
-            {"type": "get_cpu_metrics", "parameters": {}, "requires_consent": False},
-            {"type": "get_memory_metrics", "parameters": {}, "requires_consent": False},
-            {"type": "get_disk_metrics", "parameters": {}, "requires_consent": False}
+            {"type": "list_metrics", "parameters": {}, "keywords": ["メトリクス一覧", "取得できるメトリクス", "metrics list"], "requires_consent": False, "idempotent": True, "cache_ttl": 60},
+            {"type": "get_cpu_metrics", "parameters": {}, "keywords": ["CPU", "CPU負荷", "ロードアベレージ", "load average"], "requires_consent": False, "idempotent": True, "cache_ttl": 1},
+            {"type": "get_memory_metrics", "parameters": {}, "keywords": ["メモリ", "memory", "mem", "RAM", "スワップ", "swap"], "requires_consent": False, "idempotent": True, "cache_ttl": 1},
+            {"type": "get_disk_metrics", "parameters": {}, "keywords": ["ディスク", "disk", "ディスク容量", "空き容量", "df", "storage", "ストレージ"], "requires_consent": False, "idempotent": True, "cache_ttl": 5},
+            {
+                "type": "get_metric_history",
+                "parameters": {
+                    "metric": "str (cpu_usage | iowait | memory_usage | swap_used_kb | disk_usage:<マウントポイント>)",
+                    "start": "str (optional) 開始時刻。epoch秒または -1h / -30m 等の相対指定。既定は -1h",
+                    "end": "str (optional) 終了時刻。既定は現在",
+                    "step": "int (optional) 集計間隔（秒）。各区間の min/max/avg を返す"
+                },
+                "keywords": ["履歴", "推移", "history"],
+                "requires_consent": False,
+                "idempotent": True,
+                "cache_ttl": 5,
+                "max_concurrency": 4,
+                "timeout": 10
+            },
+            {"type": "get_per_core_cpu", "parameters": {}, "keywords": ["コアごと", "コア別", "コア毎", "各コア", "per core", "CPU per core", "cores"], "requires_consent": False, "idempotent": True, "cache_ttl": 1},
+            {
+                "type": "get_top_processes",
+                "parameters": {
+                    "sort_by": "str (optional) cpu | rss。既定は cpu",
+                    "limit": "int (optional) 件数。既定は10"
+                },
+                "keywords": ["プロセス", "プロセス一覧", "重いプロセス", "top", "processes", "ps"],
+                "requires_consent": False,
+                "idempotent": True,
+                "cache_ttl": 5,
+                "max_concurrency": 4,
+                "timeout": 10
+            }
         ]
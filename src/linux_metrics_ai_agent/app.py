@@ -1,16 +1,44 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
-from ai_agent_base import AIAgentBase
 from ai_agent import LinuxMetricsAIAgent
+from ai_agent_base import TaskTimeout
+from telemetry import TelemetryMiddleware
+from proc_collector import ProcCollector
+from timeseries import MetricHistory
+from process_scanner import ProcessScanner
 import os
+import time
+import asyncio
 import requests
+from urllib.parse import quote
 
 app = FastAPI()
 
 # エージェントのエンドポイントURL（本番では環境変数や設定ファイルで指定）
 ENDPOINT = os.environ.get("AGENT_ENDPOINT", "http://localhost:5004")
 REGISTRY_URL = os.environ.get("AGENT_REGISTRY_URL", "http://agent_registry_service:5002/agents")
-agent = LinuxMetricsAIAgent(endpoint=ENDPOINT)
+# レジストリへのハートビート間隔とリース期間（秒）。リース期間内にハートビートが届かないと expired 扱いになる
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "10"))
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "30"))
+# /run/batch で1回に受け付けるタスク数の上限
+BATCH_MAX_TASKS = int(os.environ.get("BATCH_MAX_TASKS", "100"))
+# メトリクスのサンプリング間隔（秒）・参照する /proc（ホストの値を見る場合はマウント先を指定）・対象ディスク
+METRICS_SAMPLE_INTERVAL = float(os.environ.get("METRICS_SAMPLE_INTERVAL", "1"))
+PROC_ROOT = os.environ.get("PROC_ROOT", "/proc")
+METRICS_DISK_PATHS = [p for p in os.environ.get("METRICS_DISK_PATHS", "/").split(",") if p]
+# 生データとして保持するサンプル数（既定3600 = 1秒間隔で1時間分）。10秒・1分の集約は1日・7日分を保持
+METRICS_HISTORY_RAW = int(os.environ.get("METRICS_HISTORY_RAW", "3600"))
+# プロセス一覧を走査する間隔（秒）。上位N件の問い合わせは直近の走査結果から返す
+PROCESS_SCAN_INTERVAL = float(os.environ.get("PROCESS_SCAN_INTERVAL", "5"))
+collector = ProcCollector(proc_root=PROC_ROOT, disk_paths=METRICS_DISK_PATHS, interval=METRICS_SAMPLE_INTERVAL)
+scanner = ProcessScanner(proc_root=PROC_ROOT, interval=PROCESS_SCAN_INTERVAL)
+agent = LinuxMetricsAIAgent(endpoint=ENDPOINT, collector=collector,
+                            history=MetricHistory(raw_capacity=METRICS_HISTORY_RAW), scanner=scanner)
+# /metrics・/traces/{trace_id} を公開し、SuperAgentServer から届いた X-Request-ID をスパンに紐付ける
+app.add_middleware(TelemetryMiddleware, telemetry=agent.telemetry)
+agent.telemetry.callback("process_scan_seconds", "直近のプロセス走査1回の所要時間（秒）", lambda: scanner.last_scan_cost)
+agent.telemetry.callback("metrics_sample_age_seconds", "最新サンプルの経過時間（秒）",
+                         lambda: time.time() - collector.latest["timestamp"] if collector.latest else None)
 
 @app.on_event("startup")
 def register_agent():
@@ -18,6 +46,7 @@ def register_agent():
         info = agent.get_registry_info()
         # agent.get_tasks()の結果を直接セット
         info["tasks"] = agent.get_tasks()
+        info["lease_ttl"] = LEASE_TTL
         print(f"[DEBUG] registry info to POST: {info}")
         resp = requests.post(REGISTRY_URL, json=info, timeout=5)
         resp.raise_for_status()
@@ -26,6 +55,44 @@ def register_agent():
     except Exception as e:
         print(f"[ERROR] Agent registration failed: {e}")
 
+def send_heartbeat():
+    artifact_id = agent.get_registry_info()["artifactID"]
+    # 同じartifactIDのレプリカが複数ある場合に備え、自インスタンスのendpointを指定する
+    resp = requests.post(f"{REGISTRY_URL}/{quote(artifact_id, safe='/')}/heartbeat", json={"endpoint": ENDPOINT}, timeout=5)
+    if resp.status_code == 404:
+        # レジストリから消えている（再起動でデータを失った等）場合は登録し直す
+        print("[INFO] Agent not found in registry, registering again")
+        register_agent()
+        return
+    resp.raise_for_status()
+
+async def heartbeat_loop():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            await asyncio.to_thread(send_heartbeat)
+        except Exception as e:
+            print(f"[ERROR] Heartbeat failed: {e}")
+
+@app.on_event("startup")
+async def start_heartbeat():
+    app.state.heartbeat_task = asyncio.create_task(heartbeat_loop())
+
+@app.on_event("shutdown")
+async def stop_heartbeat():
+    app.state.heartbeat_task.cancel()
+    agent.shutdown()
+
+@app.on_event("startup")
+async def start_collector():
+    collector.start()
+    scanner.start()
+
+@app.on_event("shutdown")
+async def stop_collector():
+    await scanner.stop()
+    await collector.stop()
+
 @app.post("/run")
 async def run_task(request: Request):
     data = await request.json()
@@ -33,7 +100,24 @@ async def run_task(request: Request):
     params = data.get("parameters", {})
     if not task_type:
         return JSONResponse(status_code=400, content={"error": "type is required"})
-    return agent.handle_request(task_type, params)
+    try:
+        return await agent.run(task_type, params)
+    except TaskTimeout as e:
+        return JSONResponse(status_code=504, content={"error": str(e)})
+
+@app.post("/run/batch")
+async def run_batch(request: Request):
+    """
+    複数タスクをまとめて受け取り並行に実行する。結果は入力と同じ順序で、1件ごとに
+    {"result": ...} または {"error": ...} を返す（1件の失敗は他に影響しない）。
+    """
+    data = await request.json()
+    tasks = data.get("tasks") if isinstance(data, dict) else None
+    if not isinstance(tasks, list):
+        return JSONResponse(status_code=400, content={"error": "tasks must be a list"})
+    if len(tasks) > BATCH_MAX_TASKS:
+        return JSONResponse(status_code=413, content={"error": f"too many tasks (max {BATCH_MAX_TASKS})"})
+    return {"results": await agent.run_batch(tasks)}
 
 @app.get("/tasks")
 def list_tasks():
@@ -0,0 +1,100 @@
+# メトリクス収集1回あたりのコストと、問い合わせ応答のコストを計測するベンチマーク
+# 使い方: python bench_collector.py [--iterations 2000] [--json]
+# 1日分（1秒間隔）の履歴に対する期間指定の問い合わせのコストも計測する
+import argparse
+import json
+import os
+import statistics
+import time
+
+from ai_agent import LinuxMetricsAIAgent
+from proc_collector import ProcCollector
+from timeseries import MetricSeries
+
+
+class ReopeningCollector(ProcCollector):
+    """
+    比較用: サンプルごとにファイルを開き直して読む実装。
+    """
+    def _read(self, name: str) -> bytes:
+        with open(os.path.join(self.proc_root, name), "rb") as f:
+            return f.read()
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "mean_us": round(statistics.mean(samples) * 1e6, 2),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 2),
+    }
+
+
+def bench_sample(collector: ProcCollector, iterations: int) -> dict:
+    collector.sample()
+    samples = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        collector.sample()
+        samples.append(time.perf_counter() - t)
+    collector.close()
+    return summarize(samples)
+
+
+def bench_request(iterations: int) -> dict:
+    agent = LinuxMetricsAIAgent(endpoint="http://localhost:5004")
+    agent.collector.sample()
+    samples = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        agent.handle_request("get_cpu_metrics", {})
+        samples.append(time.perf_counter() - t)
+    agent.collector.close()
+    return summarize(samples)
+
+
+def bench_history(queries: int = 20) -> dict:
+    series = MetricSeries()
+    now = time.time()
+    for i in range(86400):
+        series.add(now - 86400 + i, float(i % 100))
+    results = {"bytes_per_metric": series.nbytes()}
+    for label, span, step in (("1d_step300", 86400, 300), ("1d_step60", 86400, 60), ("1h_step1", 3600, 1)):
+        samples = []
+        for _ in range(queries):
+            t = time.perf_counter()
+            series.query(now - span, now, step)
+            samples.append(time.perf_counter() - t)
+        results[label] = summarize(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+    results = {
+        "sample_reused_fds": bench_sample(ProcCollector(), args.iterations),
+        "sample_reopen": bench_sample(ReopeningCollector(), args.iterations),
+        "get_cpu_metrics": bench_request(args.iterations),
+        "history": bench_history(),
+    }
+    # 既定の1秒間隔でサンプリングした場合にエージェント自身が使うCPU時間の割合
+    results["overhead_pct_at_1s"] = round(results["sample_reused_fds"]["mean_us"] / 1e6 * 100, 4)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'case':20} {'mean':>9} {'p50':>9} {'p99':>9}  (us)")
+    for name, r in results.items():
+        if isinstance(r, dict) and "mean_us" in r:
+            print(f"{name:20} {r['mean_us']:>9} {r['p50_us']:>9} {r['p99_us']:>9}")
+    for name, r in results["history"].items():
+        if isinstance(r, dict):
+            print(f"{'history ' + name:20} {r['mean_us']:>9} {r['p50_us']:>9} {r['p99_us']:>9}")
+    print(f"history memory: {results['history']['bytes_per_metric']} bytes per metric")
+    print(f"overhead at 1s interval: {results['overhead_pct_at_1s']}% of one core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# プロセス走査1回あたりのコストをプロセス数別に計測するベンチマーク
+# 使い方: python bench_process_scanner.py [--sizes 1000,5000,10000] [--scans 10] [--json]
+# 合成した /proc ツリー（PIDごとに stat / status / cmdline を持つ）と、実際の /proc を走査する
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from process_scanner import ProcessScanner, parse_pid_stat
+
+
+def make_proc_tree(size: int) -> str:
+    root = tempfile.mkdtemp(prefix="bench_proc_")
+    with open(os.path.join(root, "uptime"), "w") as f:
+        f.write("100000.00 90000.00\n")
+    for pid in range(1, size + 1):
+        pid_dir = os.path.join(root, str(pid))
+        os.mkdir(pid_dir)
+        with open(os.path.join(pid_dir, "stat"), "w") as f:
+            f.write(f"{pid} (worker {pid}) S 1 {pid} {pid} 0 -1 4194560 100 0 0 0 "
+                    f"{pid % 500} {pid % 100} 0 0 20 0 4 0 {1000 + pid} 123456789 {pid % 4096} "
+                    + "0 " * 27 + "\n")
+        with open(os.path.join(pid_dir, "status"), "w") as f:
+            f.write(f"Name:\tworker {pid}\nState:\tS (sleeping)\nVmRSS:\t{pid % 4096 * 4} kB\nThreads:\t4\n" * 8)
+        with open(os.path.join(pid_dir, "cmdline"), "wb") as f:
+            f.write(f"/usr/bin/worker\0--id\0{pid}\0".encode())
+    return root
+
+
+class NaiveScanner:
+    """
+    比較用: 毎回 os.listdir で列挙し、PIDごとに stat / status / cmdline をすべて開き直して読む実装。
+    """
+    def __init__(self, proc_root: str):
+        self.proc_root = proc_root
+
+    def scan(self):
+        records = []
+        for name in os.listdir(self.proc_root):
+            if not name.isdigit():
+                continue
+            base = os.path.join(self.proc_root, name)
+            try:
+                with open(os.path.join(base, "stat"), "rb") as f:
+                    fields = parse_pid_stat(f.read())
+                with open(os.path.join(base, "status")) as f:
+                    f.read()
+                with open(os.path.join(base, "cmdline"), "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ").decode()
+            except OSError:
+                continue
+            records.append({"pid": int(name), "name": fields[0], "cmdline": cmdline, "ticks": fields[2]})
+        return records
+
+
+def timed(fn, repeat: int) -> dict:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def bench(root: str, label: str, scans: int) -> dict:
+    scanner = ProcessScanner(proc_root=root)
+    scanner.scan()
+    return {
+        "tree": label,
+        "processes": len(scanner.latest),
+        "incremental_scan": timed(scanner.scan, scans),
+        "naive_scan": timed(NaiveScanner(root).scan, scans),
+        "top10_cpu": timed(lambda: scanner.top("cpu", 10), scans),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,5000,10000")
+    parser.add_argument("--scans", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        root = make_proc_tree(size)
+        try:
+            results.append(bench(root, "synthetic", args.scans))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    if os.path.isdir("/proc/self"):
+        results.append(bench("/proc", "/proc", args.scans))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'tree':10} {'procs':>6} {'incr p50':>9} {'naive p50':>10} {'top10 p50':>10}  (ms)")
+    for r in results:
+        print(f"{r['tree']:10} {r['processes']:>6} {r['incremental_scan']['p50_ms']:>9} "
+              f"{r['naive_scan']['p50_ms']:>10} {r['top10_cpu']['p50_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# /proc と statvfs からCPU・メモリ・ディスクのメトリクスを収集するコレクタ
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# /proc/stat の cpu 行の列（jiffies）。guest 系は user/nice に含まれるので使わない
+_CPU_FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal")
+_MEMINFO_KEYS = {b"MemTotal", b"MemFree", b"MemAvailable", b"Buffers", b"Cached", b"SwapTotal", b"SwapFree"}
+
+
+def parse_cpu_line(line: bytes) -> List[int]:
+    return [int(v) for v in line.split()[1:len(_CPU_FIELDS) + 1]]
+
+
+def cpu_percentages(prev: Optional[List[int]], cur: List[int]) -> Dict[str, float]:
+    """
+    2回分の cpu 行の差分から使用率（%）を求める。prev が無い場合は起動時からの平均になる。
+    """
+    delta = [c - p for c, p in zip(cur, prev)] if prev else list(cur)
+    total = sum(delta)
+    if total <= 0:
+        return {"cpu_usage": 0.0, "iowait": 0.0, "steal": 0.0}
+    idle = delta[3] + delta[4]
+    return {
+        "cpu_usage": round((total - idle) * 100.0 / total, 2),
+        "iowait": round(delta[4] * 100.0 / total, 2),
+        "steal": round(delta[7] * 100.0 / total, 2),
+    }
+
+
+class ProcCollector:
+    """
+    /proc/stat・/proc/meminfo を開いたままにして os.pread で読み直し、
+    最新のサンプルを1つのdictとして保持する。問い合わせには latest を返すだけなのでI/Oは発生しない。
+    start() で interval 秒ごとにバックグラウンドでサンプリングする。
+    """
+    def __init__(self, proc_root: str = "/proc", disk_paths: Optional[List[str]] = None,
+                 interval: float = 1.0, read_size: int = 65536):
+        self.proc_root = proc_root
+        self.disk_paths = disk_paths or ["/"]
+        self.interval = interval
+        self.read_size = read_size
+        self.latest: Optional[Dict[str, Any]] = None
+        self.samples = 0
+        self.last_sample_cost = 0.0
+        # サンプル取得のたびに呼ばれるコールバック（履歴の記録等）
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._prev_cpu: Optional[List[int]] = None
+        self._prev_cores: Dict[str, List[int]] = {}
+        self._fds: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _read(self, name: str) -> bytes:
+        fd = self._fds.get(name)
+        if fd is None:
+            fd = self._fds[name] = os.open(os.path.join(self.proc_root, name), os.O_RDONLY)
+        # /proc のファイルはオフセット0から読み直すたびに最新の内容が生成される
+        return os.pread(fd, self.read_size, 0)
+
+    def _cpu(self) -> tuple:
+        """
+        /proc/stat の先頭の cpu 行（全体）と cpuN 行（コアごと）から使用率を求める。
+        """
+        lines = self._read("stat").splitlines()
+        cur = parse_cpu_line(lines[0])
+        result = cpu_percentages(self._prev_cpu, cur)
+        self._prev_cpu = cur
+        result["cpu_count"] = os.cpu_count()
+        cores = []
+        prev_cores, self._prev_cores = self._prev_cores, {}
+        for line in lines[1:]:
+            if not line.startswith(b"cpu"):
+                break
+            name = line[:line.index(b" ")].decode()
+            values = parse_cpu_line(line)
+            self._prev_cores[name] = values
+            cores.append({"core": int(name[3:]), **cpu_percentages(prev_cores.get(name), values)})
+        return result, cores
+
+    def _memory(self) -> Dict[str, Any]:
+        values = {}
+        for line in self._read("meminfo").splitlines():
+            key, _, rest = line.partition(b":")
+            if key in _MEMINFO_KEYS:
+                values[key.decode()] = int(rest.split()[0])
+        total = values.get("MemTotal", 0)
+        # MemAvailable が無い古いカーネルでは Free + Buffers + Cached で近似する
+        available = values.get("MemAvailable",
+                               values.get("MemFree", 0) + values.get("Buffers", 0) + values.get("Cached", 0))
+        used = total - available
+        return {
+            "memory_usage": round(used * 100.0 / total, 2) if total else 0.0,
+            "total_kb": total,
+            "available_kb": available,
+            "used_kb": used,
+            "swap_total_kb": values.get("SwapTotal", 0),
+            "swap_used_kb": values.get("SwapTotal", 0) - values.get("SwapFree", 0),
+        }
+
+    def _disk(self) -> Dict[str, Any]:
+        disks = {}
+        for path in self.disk_paths:
+            try:
+                st = os.statvfs(path)
+            except OSError as e:
+                disks[path] = {"error": str(e)}
+                continue
+            total = st.f_blocks * st.f_frsize
+            # df と同様に、一般ユーザが使える容量（f_bavail）を基準に使用率を出す
+            used = (st.f_blocks - st.f_bfree) * st.f_frsize
+            avail = st.f_bavail * st.f_frsize
+            disks[path] = {
+                "disk_usage": round(used * 100.0 / (used + avail), 2) if used + avail else 0.0,
+                "total_bytes": total,
+                "used_bytes": used,
+                "available_bytes": avail,
+            }
+        return disks
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        1回分のサンプルを取得して latest を差し替える（dictの差し替えなので読み手は常に一貫した値を見る）。
+        """
+        started = time.perf_counter()
+        cpu, cores = self._cpu()
+        latest = {
+            "timestamp": time.time(),
+            "cpu": cpu,
+            "cpu_cores": cores,
+            "memory": self._memory(),
+            "disk": self._disk(),
+        }
+        self.latest = latest
+        self.samples += 1
+        self.last_sample_cost = time.perf_counter() - started
+        for listener in self.listeners:
+            listener(latest)
+        return latest
+
+    def get(self) -> Dict[str, Any]:
+        """
+        最新のサンプルを返す。まだ1度もサンプリングしていない場合はその場で取得する。
+        """
+        return self.latest or self.sample()
+
+    async def _loop(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[ERROR] Metrics sampling failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.close()
+
+    def close(self):
+        fds, self._fds = self._fds, {}
+        for fd in fds.values():
+            os.close(fd)
@@ -0,0 +1,173 @@
+# /proc/[pid] を走査してプロセスごとのCPU使用率・RSSを求めるインクリメンタルスキャナ
+import asyncio
+import heapq
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+class _ProcState:
+    """
+    PIDごとにスキャン間で保持する状態。comm/cmdline は初回のみ読み、以降は stat だけを読む。
+    """
+    __slots__ = ("starttime", "name", "cmdline", "ticks", "record")
+
+    def __init__(self, starttime: int, name: str, cmdline: str):
+        self.starttime = starttime
+        self.name = name
+        self.cmdline = cmdline
+        self.ticks: Optional[int] = None
+        self.record: Optional[Dict[str, Any]] = None
+
+
+def parse_pid_stat(data: bytes) -> tuple:
+    """
+    /proc/[pid]/stat を (comm, state, utime+stime, num_threads, starttime, rss_pages) に分解する。
+    comm には空白や括弧が含まれうるので、最後の ")" で区切る。
+    """
+    lparen = data.index(b"(")
+    rparen = data.rindex(b")")
+    rest = data[rparen + 2:].split()
+    return (
+        data[lparen + 1:rparen].decode("utf-8", "replace"),
+        rest[0].decode(),
+        int(rest[11]) + int(rest[12]),
+        int(rest[17]),
+        int(rest[19]),
+        int(rest[21]),
+    )
+
+
+def _read(path: str, size: int = 4096) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+class ProcessScanner:
+    """
+    os.scandir で /proc のPIDを列挙し、各プロセスの stat だけを読み直して前回スキャンとの差分から
+    CPU使用率を求める。PIDの再利用は starttime の変化で検出する。消えたPIDの状態は破棄する。
+    スキャン結果はリストとして差し替えるので、問い合わせは最新の結果から上位N件を選ぶだけ。
+    """
+    def __init__(self, proc_root: str = "/proc", interval: float = 5.0, cmdline_max: int = 200, limit_max: int = 100):
+        self.proc_root = proc_root
+        self.interval = interval
+        self.cmdline_max = cmdline_max
+        # top で返す件数の上限（LLM が大きな limit を指定しても応答が膨らまないように）
+        self.limit_max = limit_max
+        self.latest: Optional[List[Dict[str, Any]]] = None
+        self.scanned_at: Optional[float] = None
+        self.last_scan_cost = 0.0
+        self.scans = 0
+        self._states: Dict[int, _ProcState] = {}
+        self._prev_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        # 定期走査（別スレッド）と、初回の問い合わせでの走査が _states・前回時刻を同時に更新しないようにする
+        self._scan_lock = threading.Lock()
+
+    def _uptime(self) -> float:
+        return float(_read(os.path.join(self.proc_root, "uptime")).split()[0])
+
+    def _new_state(self, pid_dir: str, name: str, starttime: int) -> _ProcState:
+        try:
+            raw = _read(os.path.join(pid_dir, "cmdline"), self.cmdline_max)
+            cmdline = raw.replace(b"\0", b" ").strip().decode("utf-8", "replace")
+        except OSError:
+            cmdline = ""
+        return _ProcState(starttime, name, cmdline)
+
+    def scan(self) -> List[Dict[str, Any]]:
+        with self._scan_lock:
+            return self._scan()
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        started = time.perf_counter()
+        now = time.monotonic()
+        elapsed = now - self._prev_time if self._prev_time is not None else None
+        uptime = self._uptime()
+        states: Dict[int, _ProcState] = {}
+        records = []
+        with os.scandir(self.proc_root) as it:
+            for entry in it:
+                if not entry.name.isdigit():
+                    continue
+                pid = int(entry.name)
+                try:
+                    name, state, ticks, threads, starttime, rss = parse_pid_stat(_read(entry.path + "/stat"))
+                except (OSError, ValueError, IndexError):
+                    # 走査中に終了したプロセス等
+                    continue
+                proc = self._states.get(pid)
+                if proc is None or proc.starttime != starttime:
+                    proc = self._new_state(entry.path, name, starttime)
+                if proc.ticks is not None and elapsed:
+                    cpu = (ticks - proc.ticks) / CLK_TCK / elapsed * 100.0
+                else:
+                    # 初めて見たプロセスは起動からの平均使用率
+                    lifetime = uptime - starttime / CLK_TCK
+                    cpu = ticks / CLK_TCK / lifetime * 100.0 if lifetime > 0 else 0.0
+                proc.ticks = ticks
+                proc.record = {
+                    "pid": pid,
+                    "name": proc.name,
+                    "cmdline": proc.cmdline,
+                    "state": state,
+                    "cpu_percent": round(cpu, 2),
+                    "rss_kb": rss * PAGE_SIZE_KB,
+                    "threads": threads,
+                }
+                states[pid] = proc
+                records.append(proc.record)
+        self._states = states
+        self._prev_time = now
+        self.latest = records
+        self.scanned_at = time.time()
+        self.scans += 1
+        self.last_scan_cost = time.perf_counter() - started
+        return records
+
+    def top(self, sort_by: str = "cpu", limit: int = 10) -> Dict[str, Any]:
+        key = {"cpu": "cpu_percent", "rss": "rss_kb"}.get(sort_by)
+        if key is None:
+            return {"error": f"sort_by must be 'cpu' or 'rss': {sort_by}"}
+        try:
+            limit = min(max(1, int(limit)), self.limit_max)
+        except (TypeError, ValueError, OverflowError):
+            return {"error": f"limit must be an integer: {limit!r}"}
+        records = self.latest
+        if records is None:
+            # まだ定期走査が終わっていない。実行中の走査があれば、それを待って結果を使う
+            with self._scan_lock:
+                records = self.latest if self.latest is not None else self._scan()
+        return {
+            "sort_by": sort_by,
+            "processes": heapq.nlargest(limit, records, key=lambda r: r[key]),
+            "total": len(records),
+            "timestamp": self.scanned_at,
+        }
+
+    async def _loop(self):
+        while True:
+            try:
+                # 数千プロセスの走査はミリ秒単位になるのでイベントループを塞がないようスレッドで実行する
+                await asyncio.to_thread(self.scan)
+            except Exception as e:
+                print(f"[ERROR] Process scan failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
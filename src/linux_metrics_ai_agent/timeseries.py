@@ -0,0 +1,200 @@
+# メトリクスの時系列履歴（固定長リングバッファ + 10秒/1分のロールアップ）
+import math
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RollupRing:
+    """
+    array で確保した固定長のリングバッファ。1要素は (時刻, min, max, sum, count)。
+    bucket > 0 の場合は同じバケットの値をその場で集約し、bucket = 0 の場合は値ごとに1要素追加する。
+    容量を超えると古い要素から上書きするので、稼働時間に関係なくメモリ使用量は一定。
+    """
+    def __init__(self, capacity: int, bucket: float = 0.0):
+        self.capacity = capacity
+        self.bucket = bucket
+        self.ts = array("d", bytes(8 * capacity))
+        self.min = array("d", bytes(8 * capacity))
+        self.max = array("d", bytes(8 * capacity))
+        self.sum = array("d", bytes(8 * capacity))
+        self.count = array("d", bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def _pos(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def add(self, t: float, value: float):
+        if self.bucket > 0:
+            t = math.floor(t / self.bucket) * self.bucket
+            if self.size and self.ts[self._pos(self.size - 1)] == t:
+                p = self._pos(self.size - 1)
+                self.min[p] = min(self.min[p], value)
+                self.max[p] = max(self.max[p], value)
+                self.sum[p] += value
+                self.count[p] += 1
+                return
+        if self.size < self.capacity:
+            p = self._pos(self.size)
+            self.size += 1
+        else:
+            p = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.ts[p], self.min[p], self.max[p], self.sum[p], self.count[p] = t, value, value, value, 1
+
+    def oldest(self) -> Optional[float]:
+        return self.ts[self.start] if self.size else None
+
+    def bisect_left(self, t: float) -> int:
+        """
+        時刻 t 以上の最初の要素の論理インデックス（古い順）。
+        """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[self._pos(mid)] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.ts, self.min, self.max, self.sum, self.count))
+
+
+class MetricSeries:
+    """
+    1メトリクス分の履歴。生データ・10秒・1分の3段階を同時に更新する。
+    """
+    def __init__(self, raw_capacity: int = 3600, tiers: Tuple[Tuple[float, int], ...] = ((10, 8640), (60, 10080))):
+        self.rings = [RollupRing(raw_capacity)] + [RollupRing(capacity, bucket) for bucket, capacity in tiers]
+
+    def add(self, t: float, value: float):
+        for ring in self.rings:
+            ring.add(t, value)
+
+    def _choose(self, start: float, step: float) -> RollupRing:
+        # step 以下の解像度のうち、start まで遡れる最も粗い段を使う。遡れなければ最も保持期間の長い段
+        candidates = [r for r in self.rings if r.bucket <= step]
+        for ring in reversed(candidates):
+            oldest = ring.oldest()
+            if ring.size < ring.capacity or (oldest is not None and oldest <= start):
+                return ring
+        return self.rings[-1]
+
+    def query(self, start: float, end: float, step: float) -> Dict[str, Any]:
+        """
+        [start, end] を step 秒ごとのバケットに分け、各バケットの min/max/avg を返す。
+        """
+        ring = self._choose(start, step)
+        points: List[Dict[str, float]] = []
+        current = None
+        lo = ring.bisect_left(start)
+        for i in range(lo, ring.size):
+            p = ring._pos(i)
+            t = ring.ts[p]
+            if t > end:
+                break
+            key = start + math.floor((t - start) / step) * step
+            if current is None or current[0] != key:
+                if current is not None:
+                    points.append(current)
+                current = [key, ring.min[p], ring.max[p], ring.sum[p], ring.count[p]]
+            else:
+                current[1] = min(current[1], ring.min[p])
+                current[2] = max(current[2], ring.max[p])
+                current[3] += ring.sum[p]
+                current[4] += ring.count[p]
+        if current is not None:
+            points.append(current)
+        return {
+            "resolution": ring.bucket,
+            "points": [
+                {"timestamp": t, "min": round(mn, 3), "max": round(mx, 3), "avg": round(s / c, 3)}
+                for t, mn, mx, s, c in points
+            ],
+        }
+
+    def nbytes(self) -> int:
+        return sum(r.nbytes() for r in self.rings)
+
+
+def parse_time(value: Any, now: float) -> float:
+    """
+    epoch秒、負の数（現在からの相対秒）、"now"、"-1h" / "-30m" / "-90s" / "-2d" 形式を受け付ける。
+    """
+    if value is None or value == "" or value == "now":
+        return now
+    if isinstance(value, (int, float)):
+        return now + value if value <= 0 else float(value)
+    text = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:] in units:
+        return now + float(text[:-1]) * units[text[-1]]
+    number = float(text)
+    return now + number if number <= 0 else number
+
+
+def sample_values(sample: Dict[str, Any]) -> Dict[str, float]:
+    """
+    ProcCollector のサンプルから履歴に残す値を取り出す。ディスクは "disk_usage:<マウントポイント>"。
+    """
+    values = {
+        "cpu_usage": sample["cpu"]["cpu_usage"],
+        "iowait": sample["cpu"]["iowait"],
+        "memory_usage": sample["memory"]["memory_usage"],
+        "swap_used_kb": sample["memory"]["swap_used_kb"],
+    }
+    for path, disk in sample["disk"].items():
+        if "disk_usage" in disk:
+            values[f"disk_usage:{path}"] = disk["disk_usage"]
+    return values
+
+
+class MetricHistory:
+    """
+    メトリクス名ごとの MetricSeries を保持し、ProcCollector のサンプルを記録する。
+    """
+    def __init__(self, raw_capacity: int = 3600, max_points: int = 500):
+        self.raw_capacity = raw_capacity
+        self.max_points = max_points
+        self.series: Dict[str, MetricSeries] = {}
+
+    def record(self, sample: Dict[str, Any]):
+        t = sample["timestamp"]
+        for name, value in sample_values(sample).items():
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = MetricSeries(self.raw_capacity)
+            series.add(t, value)
+
+    def query(self, metric: str, start: Any = None, end: Any = None, step: Any = None) -> Dict[str, Any]:
+        series = self.series.get(metric)
+        if series is None:
+            return {"error": f"Unknown metric: {metric}", "available": sorted(self.series)}
+        now = time.time()
+        # start / end / step は LLM が組み立てるので、解釈できない値はエラーとして返す
+        try:
+            end_t = parse_time(end, now)
+            start_t = parse_time(start if start not in (None, "") else "-1h", now)
+        except (TypeError, ValueError):
+            return {"error": f"Invalid start/end: start={start!r}, end={end!r}"}
+        if not (math.isfinite(start_t) and math.isfinite(end_t)):
+            return {"error": f"Invalid start/end: start={start!r}, end={end!r}"}
+        if start_t >= end_t:
+            return {"error": "start must be earlier than end"}
+        # step 未指定時は max_points 点程度になるように決める
+        try:
+            step_s = float(step) if step not in (None, "") else max(1.0, math.ceil((end_t - start_t) / self.max_points))
+        except (TypeError, ValueError):
+            return {"error": f"Invalid step: {step!r}"}
+        if not step_s > 0 or not math.isfinite(step_s):
+            return {"error": "step must be positive"}
+        # 1回の応答が大きくなりすぎないよう、点数が max_points を超える step は切り上げる
+        step_s = max(step_s, math.ceil((end_t - start_t) / self.max_points))
+        result = series.query(start_t, end_t, step_s)
+        return {"metric": metric, "start": start_t, "end": end_t, "step": step_s, **result}
+
+    def describe(self) -> Dict[str, Any]:
+        return {"metrics": sorted(self.series), "bytes": sum(s.nbytes() for s in self.series.values())}
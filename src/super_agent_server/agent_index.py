@@ -0,0 +1,88 @@
+# 計画生成プロンプトに載せる候補エージェントを絞り込むためのBM25索引
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+_ASCII_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RUN_RE = re.compile(r"[^\x00-\x7f\s]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    英数字は単語単位（snake_caseは分割）、日本語などの非ASCII文字列は
+    文字bigram（1文字のみの場合はunigram）に分割する。
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    tokens = _ASCII_WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        run = "".join(ch for ch in run if not unicodedata.category(ch).startswith("P"))
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def agent_document(agent: Dict[str, Any]) -> str:
+    parts = [agent.get("name") or "", agent.get("description") or ""]
+    parts.extend(agent.get("capabilities") or [])
+    for task in agent.get("tasks") or []:
+        parts.append(task.get("type") or "")
+        parts.extend(task.get("keywords") or [])
+    return " ".join(str(p) for p in parts)
+
+
+class AgentIndex:
+    """
+    エージェントの name/description/capabilities/tasks を対象にしたBM25索引。
+    レジストリのプロファイルバージョンが変わった時だけ再構築する。
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.version: Optional[str] = None
+        self.agents: List[Dict[str, Any]] = []
+        self._doc_tf: List[Counter] = []
+        self._doc_len: List[int] = []
+        self._idf: Dict[str, float] = {}
+        self._avgdl = 0.0
+        self.builds = 0
+
+    def ensure(self, agents: List[Dict[str, Any]], version: Optional[str]):
+        if version is None or version != self.version:
+            self.build(agents, version)
+
+    def build(self, agents: List[Dict[str, Any]], version: Optional[str]):
+        self.agents = list(agents)
+        self._doc_tf = [Counter(tokenize(agent_document(a))) for a in self.agents]
+        self._doc_len = [sum(tf.values()) for tf in self._doc_tf]
+        n = len(self.agents)
+        self._avgdl = (sum(self._doc_len) / n) if n else 0.0
+        df: Counter = Counter()
+        for tf in self._doc_tf:
+            df.update(tf.keys())
+        self._idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        self.version = version
+        self.builds += 1
+
+    def score(self, query: str) -> List[float]:
+        terms = [t for t in set(tokenize(query)) if t in self._idf]
+        scores = []
+        for tf, dl in zip(self._doc_tf, self._doc_len):
+            s = 0.0
+            norm = self.k1 * (1 - self.b + self.b * dl / self._avgdl) if self._avgdl else self.k1
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    s += self._idf[t] * f * (self.k1 + 1) / (f + norm)
+            scores.append(s)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[Dict[str, Any]]:
+        """
+        スコア上位k件のエージェントを返す。どの語にも一致しない場合は登録順の先頭k件。
+        """
+        scores = self.score(query)
+        order = sorted(range(len(self.agents)), key=lambda i: (-scores[i], i))
+        return [self.agents[i] for i in order[:k]]
@@ -1,16 +1,35 @@
 # SuperAgentServer のエントリポイント（FastAPI + Gemini 対応版）
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
-import httpx
 import json
 from pydantic import BaseModel
 from typing import Any, Union # AnyとUnionをインポート
 import logging
+from http_pool import HttpClientPool
+from registry_snapshot import RegistrySnapshot, is_live
+from plan_cache import PlanCache
+from agent_index import AgentIndex
+from jobs import JobManager, JobQueueFull, InvalidCallbackUrl
+from balancer import LoadBalancer
+from resilience import AgentCaller
+from coalescer import CallCoalescer
+from result_cache import ResultCache
+from fast_router import FastRouter
+# ローカル実行時は src/common の共通モジュールを参照する（コンテナでは /common にマウント）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from telemetry import Telemetry, TelemetryMiddleware, trace_headers
 
 app = FastAPI()
+# 処理区間ごとの所要時間・エラー数を /metrics で公開し、X-Request-ID を各AIAgentへの呼び出しに引き継ぐ
+telemetry = Telemetry("super_agent_server")
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -27,6 +46,59 @@ app.add_middleware(
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-pro")
 AGENT_REGISTRY_URL = os.environ.get("AGENT_REGISTRY_URL", "http://agent_registry_service:5002")
+# レジストリスナップショットの更新間隔と、読み出し時に同期再取得する鮮度の上限（秒）
+REGISTRY_REFRESH_INTERVAL = float(os.environ.get("REGISTRY_REFRESH_INTERVAL", "5"))
+REGISTRY_MAX_AGE = float(os.environ.get("REGISTRY_MAX_AGE", "30"))
+# レジストリ・各AIAgentへのHTTP接続プール設定
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.environ.get("HTTP_MAX_KEEPALIVE_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+AGENT_CONNECT_TIMEOUT = float(os.environ.get("AGENT_CONNECT_TIMEOUT", "3"))
+AGENT_READ_TIMEOUT = float(os.environ.get("AGENT_READ_TIMEOUT", "30"))
+# エージェント名ごとのタイムアウト上書き 例: {"LinuxCommandAIAgent": {"connect": 2, "read": 60}}
+AGENT_TIMEOUTS = json.loads(os.environ.get("AGENT_TIMEOUTS", "{}"))
+# 計画生成（Gemini呼び出し）の同時実行数上限・タイムアウト（秒）・実行方式（async|executor）
+PLAN_CONCURRENCY = int(os.environ.get("PLAN_CONCURRENCY", "8"))
+PLAN_TIMEOUT = float(os.environ.get("PLAN_TIMEOUT", "60"))
+PLAN_BACKEND = os.environ.get("PLAN_BACKEND", "async")
+# 計画生成プロンプトに載せる候補エージェント数の上限（BM25で事前に絞り込む）
+PLANNER_TOP_K = int(os.environ.get("PLANNER_TOP_K", "5"))
+# 複数ステップ計画で同時に実行するステップ数の上限
+PLAN_STEP_CONCURRENCY = int(os.environ.get("PLAN_STEP_CONCURRENCY", "4"))
+# 実行計画キャッシュの最大件数・TTL（秒）。PLAN_CACHE_SIZE=0 で無効化
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "1024"))
+PLAN_CACHE_TTL = float(os.environ.get("PLAN_CACHE_TTL", "600"))
+# 非同期ジョブのワーカー数・キュー上限・完了後の保持期間（秒）
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", "3600"))
+# 非同期ジョブの callback_url に許可するホスト（カンマ区切り、"*.example.com" で配下を許可。空ならWebhookは受け付けない）と送信のタイムアウト（秒）
+JOB_CALLBACK_ALLOWED_HOSTS = [h.strip() for h in os.environ.get("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+JOB_CALLBACK_TIMEOUT = float(os.environ.get("JOB_CALLBACK_TIMEOUT", "5"))
+# 同じエージェントのレプリカ間での振り分け方式（p2c | least_outstanding）
+LB_POLICY = os.environ.get("LB_POLICY", "p2c")
+# AIAgent呼び出しのサーキットブレーカ（連続失敗回数・open を維持する秒数）
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+# idempotent なタスクのリトライ回数とバックオフ（秒）
+AGENT_RETRIES = int(os.environ.get("AGENT_RETRIES", "2"))
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "0.1"))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "2"))
+# p95 を超えた idempotent なタスクを別レプリカにも送る（ヘッジ）。判定に必要な最小サンプル数
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+# 同じインスタンス・タスク種別への同時呼び出しを /run/batch にまとめる待ち時間（ミリ秒、0で無効）と1バッチの上限件数
+COALESCE_WINDOW_MS = float(os.environ.get("COALESCE_WINDOW_MS", "2"))
+COALESCE_MAX_BATCH = int(os.environ.get("COALESCE_MAX_BATCH", "32"))
+# 曖昧さの無い短い要求をLLMを呼ばずに振り分ける。入力のうち語句で覆えた割合がこれ以上なら即決する
+FAST_ROUTER_ENABLED = os.environ.get("FAST_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+FAST_ROUTER_MIN_COVERAGE = float(os.environ.get("FAST_ROUTER_MIN_COVERAGE", "0.8"))
+# idempotent なタスク結果のキャッシュ件数と、タスク定義の cache_ttl に対する上限（秒）。RESULT_CACHE_SIZE=0 で無効化
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MAX_TTL = float(os.environ.get("RESULT_CACHE_MAX_TTL", "60"))
+# クライアント切断を確認する間隔（秒）
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("DISCONNECT_POLL_INTERVAL", "0.5"))
 
 # SuperAgentServer 入出力モデル (README.md に基づく)
 class CommandIn(BaseModel):
@@ -46,6 +118,11 @@ class RequestOut(BaseModel):
     status: str # 予約 (README.mdより)
     result: Union[Any, None] = None # any | None を Union[Any, None] に修正
 
+class TaskIn(BaseModel):
+    type: str
+    parameters: dict = {}
+    callback_url: str | None = None # 完了時に結果をPOSTするWebhook URL
+
 class SuperAgentServer:
     def __init__(self):
         self.gemini_api_key = GEMINI_API_KEY
@@ -53,26 +130,146 @@ class SuperAgentServer:
         self.agent_registry_url = AGENT_REGISTRY_URL
         if self.gemini_api_key:
             genai.configure(api_key=self.gemini_api_key)
+        self.http = HttpClientPool(
+            max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_per_host=HTTP_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            http2=HTTP2_ENABLED,
+            connect_timeout=AGENT_CONNECT_TIMEOUT,
+            read_timeout=AGENT_READ_TIMEOUT,
+            agent_timeouts=AGENT_TIMEOUTS,
+            extra_headers=trace_headers,
+        )
+        self.registry = RegistrySnapshot(
+            self.agent_registry_url,
+            self.http,
+            refresh_interval=REGISTRY_REFRESH_INTERVAL,
+            max_age=REGISTRY_MAX_AGE,
+        )
+        # 計画生成の同時実行数を制限し、イベントループをブロックしないようにする
+        self._plan_semaphore = asyncio.Semaphore(PLAN_CONCURRENCY)
+        self._plan_executor = ThreadPoolExecutor(max_workers=PLAN_CONCURRENCY, thread_name_prefix="plan") if PLAN_BACKEND == "executor" else None
+        self.agent_index = AgentIndex()
+        self.balancer = LoadBalancer(policy=LB_POLICY)
+        self.caller = AgentCaller(
+            self.http,
+            self.balancer,
+            failure_threshold=BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=BREAKER_RESET_TIMEOUT,
+            retries=AGENT_RETRIES,
+            backoff_base=RETRY_BACKOFF_BASE,
+            backoff_max=RETRY_BACKOFF_MAX,
+            hedge=HEDGE_ENABLED,
+            hedge_min_samples=HEDGE_MIN_SAMPLES,
+            coalescer=CallCoalescer(self.http, window=COALESCE_WINDOW_MS / 1000, max_batch=COALESCE_MAX_BATCH)
+            if COALESCE_WINDOW_MS > 0 else None,
+        )
+        self.fast_router = FastRouter(min_coverage=FAST_ROUTER_MIN_COVERAGE)
+        # 計画の決め方ごとの件数（fast_path: FastRouter / plan_cache: キャッシュ済み計画 / llm: Gemini）
+        self.route_stats = {"fast_path": 0, "plan_cache": 0, "llm": 0}
+        self.result_cache = ResultCache(max_size=RESULT_CACHE_SIZE, max_ttl=RESULT_CACHE_MAX_TTL)
+        self.prompt_stats = {"prompts": 0, "prompt_tokens_total": 0, "last_prompt_tokens": None,
+                             "last_candidates": 0, "last_prompt_chars": 0, "last_full_profile_chars": 0}
+        self._full_profile_chars = (None, 0)
+        self.plan_cache = PlanCache(max_size=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL)
+        self.jobs = JobManager(self.run_job, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, retention=JOB_RETENTION,
+                               callback_hosts=JOB_CALLBACK_ALLOWED_HOSTS, callback_timeout=JOB_CALLBACK_TIMEOUT)
+        self.plan_stats = {"calls": 0, "in_flight": 0, "waiting": 0, "timeouts": 0, "cancelled": 0, "errors": 0}
+
+    async def startup(self):
+        self.registry.start()
+        self.jobs.start()
+
+    async def shutdown(self):
+        await self.jobs.stop()
+        await self.registry.stop()
+        await self.http.aclose()
+        if self._plan_executor:
+            self._plan_executor.shutdown(wait=False, cancel_futures=True)
 
-    async def fetch_agents(self):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{self.agent_registry_url}/agents")
-            agents = resp.json()
-            return agents
+    async def fetch_agents(self, include_inactive=False):
+        # 通常はメモリ上のスナップショットを返し、レジストリが変わった時だけ再取得される
+        # 既定ではリース切れ（status != active）のエージェントを除外する
+        return await self.registry.get(include_inactive=include_inactive)
 
-    def generate_plan(self, user_input, agents):
-        # 利用可能なエージェントのdescription/capabilities/tasksをプロンプトに含める
-        agent_profiles = {
+    async def _send_plan_prompt(self, plan_prompt: str):
+        """
+        Geminiへプロンプトを送信する。同時実行数はPLAN_CONCURRENCYで制限し、
+        PLAN_BACKEND=executor の場合は同期APIを専用スレッドプールで実行する。
+        """
+        self.plan_stats["waiting"] += 1
+        try:
+            await self._plan_semaphore.acquire()
+        finally:
+            self.plan_stats["waiting"] -= 1
+        self.plan_stats["calls"] += 1
+        self.plan_stats["in_flight"] += 1
+        try:
+            model = genai.GenerativeModel(self.gemini_model)
+            chat = model.start_chat(history=[])
+            if self._plan_executor:
+                loop = asyncio.get_running_loop()
+                call = loop.run_in_executor(self._plan_executor, chat.send_message, plan_prompt)
+            else:
+                call = chat.send_message_async(plan_prompt)
+            return await asyncio.wait_for(call, timeout=PLAN_TIMEOUT)
+        except asyncio.CancelledError:
+            self.plan_stats["cancelled"] += 1
+            raise
+        except asyncio.TimeoutError:
+            self.plan_stats["timeouts"] += 1
+            raise
+        except Exception:
+            self.plan_stats["errors"] += 1
+            raise
+        finally:
+            self.plan_stats["in_flight"] -= 1
+            self._plan_semaphore.release()
+
+    @staticmethod
+    def agent_profiles(agents):
+        return {
             a['name']: {
                 "description": a.get('description', ''),
                 "capabilities": a.get('capabilities', []),
                 "tasks": a.get('tasks', [])
             } for a in agents
         }
+
+    def shortlist_agents(self, user_input, agents):
+        """
+        BM25索引でユーザ要求に近い上位PLANNER_TOP_K件のエージェントに絞り込む。
+        索引はレジストリのプロファイルバージョンが変わった時だけ再構築する。
+        """
+        version = self.registry.profile_version
+        self.agent_index.ensure(agents, version)
+        if self._full_profile_chars[0] != self.agent_index.version:
+            # 絞り込み前（全エージェント・インデント付き）のプロンプトサイズを比較用に記録
+            full = len(json.dumps(self.agent_profiles(agents), indent=2, ensure_ascii=False))
+            self._full_profile_chars = (self.agent_index.version, full)
+        return self.agent_index.top_k(user_input, PLANNER_TOP_K)
+
+    def _record_prompt(self, plan_prompt, candidates, plan_resp):
+        usage = getattr(plan_resp, "usage_metadata", None)
+        tokens = getattr(usage, "prompt_token_count", None) if usage else None
+        self.prompt_stats["prompts"] += 1
+        self.prompt_stats["last_candidates"] = len(candidates)
+        self.prompt_stats["last_prompt_chars"] = len(plan_prompt)
+        self.prompt_stats["last_full_profile_chars"] = self._full_profile_chars[1]
+        if tokens is not None:
+            self.prompt_stats["last_prompt_tokens"] = tokens
+            self.prompt_stats["prompt_tokens_total"] += tokens
+        logging.info(f"[Gemini LLM] 候補エージェント数={len(candidates)} プロンプト文字数={len(plan_prompt)} "
+                     f"(全件時のプロファイル文字数={self._full_profile_chars[1]}) prompt_tokens={tokens}")
+
+    async def generate_plan(self, user_input, agents):
+        # ユーザ要求に近いエージェントだけを候補とし、そのdescription/capabilities/tasksをプロンプトに含める
+        candidates = self.shortlist_agents(user_input, agents)
+        agent_profiles = self.agent_profiles(candidates)
         plan_prompt = f"""
         ユーザ要求: {user_input}
         利用可能なAIAgentとその説明・機能・タスク仕様:
-        {json.dumps(agent_profiles, indent=2, ensure_ascii=False)}
+        {json.dumps(agent_profiles, separators=(',', ':'), ensure_ascii=False)}
 
         上記の情報に基づき、ユーザ要求に応じるために最適なAIAgentとそのタスク、必要なパラメータをJSON形式で出力してください。
         出力形式:
@@ -81,6 +278,14 @@ class SuperAgentServer:
           "task": "<実行するタスクタイプ>",
           "parameters": {{ <タスクに必要なパラメータ> }}
         }}
+        複数のタスクが必要な場合（例: CPU・メモリ・ディスクをまとめて取得）は、次の複数ステップ形式で出力してください。
+        互いに依存しないステップは並列に実行されます。前のステップの完了を待つ必要がある場合のみ depends_on にIDを指定してください。
+        {{
+          "steps": [
+            {{"id": "s1", "agent": "<AIAgent名>", "task": "<タスクタイプ>", "parameters": {{}}, "depends_on": []}},
+            {{"id": "s2", "agent": "<AIAgent名>", "task": "<タスクタイプ>", "parameters": {{}}, "depends_on": ["s1"]}}
+          ]
+        }}
         もし適切なAIAgentやタスクがない場合は、その旨をJSONで示してください。
         例: {{
           "agent": null,
@@ -91,11 +296,9 @@ class SuperAgentServer:
         注意: JSON以外の出力や説明文、コードブロック記号（```）は一切付けず、純粋なJSONのみを返してください。
         """
         try:
-            # Gemini APIの呼び出し方法を修正
             logging.debug(f"[Gemini LLM] プロンプト送信: {plan_prompt}")
-            model = genai.GenerativeModel(self.gemini_model)
-            chat = model.start_chat(history=[])
-            plan_resp = chat.send_message(plan_prompt)
+            plan_resp = await self._send_plan_prompt(plan_prompt)
+            self._record_prompt(plan_prompt, candidates, plan_resp)
             logging.debug(f"[Gemini LLM] レスポンス受信: {plan_resp.text}")
             plan_json = plan_resp.text.strip()
             # コードブロックで返ってきた場合は中身だけ抽出
@@ -113,53 +316,202 @@ class SuperAgentServer:
                 logging.error(f"[Gemini LLM] JSONデコード失敗: {je}\nレスポンス内容: {plan_json}")
                 return None, f"Gemini LLM response is not valid JSON: {je}\nResponse: {plan_json}"
             return plan, None
+        except asyncio.TimeoutError:
+            logging.error(f"[Gemini LLM] タイムアウト: {PLAN_TIMEOUT}秒")
+            return None, f"Gemini LLM timed out after {PLAN_TIMEOUT} seconds."
         except Exception as e:
             logging.error(f"[Gemini LLM] 例外発生: {e}")
             return None, str(e)
 
-    async def execute_plan(self, plan, agents):
+    @staticmethod
+    async def _emit(emit, event, data):
         """
-        実行計画(plan)に従い、AIAgentのエンドポイント/runにPOSTしてタスクを実行。
-        パラメータが不足している場合はChatClientに追加情報を要求する。
+        ストリーミング応答用のイベント通知。emitが指定されていない場合は何もしない。
         """
-        if not plan or not isinstance(plan, dict):
-            return {"error": "Invalid plan format"}
-        agent_name = plan.get("agent")
-        task_type = plan.get("task")
-        parameters = plan.get("parameters", {})
-        # agent_nameからエンドポイントを特定
-        agent_info = next((a for a in agents if a.get("name") == agent_name), None)
+        if emit is not None:
+            await emit(event, data)
+
+    def _prepare_step(self, step):
+        """
+        1ステップ分の計画を検証し、(agent_info, task_def, エラー/確認要求のdict) を返す。
+        問題がなければ3番目の要素はNone。
+        """
+        agent_name = step.get("agent")
+        task_type = step.get("task")
+        parameters = step.get("parameters") or {}
+        # agent_nameからエンドポイントを特定（スナップショットの索引でO(1)参照）
+        agent_info = self.registry.find_agent(agent_name)
         if not agent_info:
-            return {"error": f"Agent '{agent_name}' not found"}
+            return None, None, {"error": f"Agent '{agent_name}' not found"}
+        if not is_live(agent_info):
+            # リース切れのエージェントには接続を試みずに即座に失敗させる
+            return agent_info, None, {"error": f"Agent '{agent_name}' is not available (status: {agent_info.get('status')})"}
         endpoint = agent_info.get("endpoint")
         if not endpoint:
-            return {"error": f"Endpoint for agent '{agent_name}' not found"}
+            return agent_info, None, {"error": f"Endpoint for agent '{agent_name}' not found"}
+        # agent_info["tasks"] の仕様を索引経由で参照
+        task_def = self.registry.find_task(agent_name, task_type)
+        if not task_def:
+            return agent_info, None, {"error": f"Task definition for '{task_type}' not found in agent '{agent_name}'"}
         # requires_consent判定 & パラメータ必須チェック
-        consent_required = False
-        missing_params = []
-        # agent_info["tasks"] から直接仕様を参照
-        tasks = agent_info.get("tasks", [])
-        task_def = next((t for t in tasks if t.get("type") == task_type), None)
-        if task_def:
-            consent_required = task_def.get("requires_consent", False)
-            param_defs = task_def.get("parameters", {})
-            for key in param_defs:
-                if key not in parameters or parameters[key] in (None, ""):
-                    missing_params.append(key)
-        else:
-            return {"error": f"Task definition for '{task_type}' not found in agent '{agent_name}'"}
+        # 説明に "(optional)" と書かれたパラメータは省略可
+        missing_params = [
+            key for key, spec in task_def.get("parameters", {}).items()
+            if "(optional)" not in str(spec) and (key not in parameters or parameters[key] in (None, ""))
+        ]
         if missing_params:
-            return {"missing_parameters": missing_params, "plan": plan}
-        if consent_required:
-            return {"consent_required": True, "plan": plan}
+            return agent_info, task_def, {"missing_parameters": missing_params}
+        if task_def.get("requires_consent", False):
+            return agent_info, task_def, {"consent_required": True}
+        return agent_info, task_def, None
+
+    async def _run_step(self, agent_info, task_def, parameters):
+        """
+        AIAgentの/runを呼び出し、{"result": ...} または {"error": ...} を返す。
+        呼び出し先の選択・タイムアウト・ブレーカ・リトライ・ヘッジは AgentCaller が担う。
+        タスク定義に cache_ttl がある idempotent なタスクは ResultCache の結果を使い回す。
+        """
+        async with telemetry.stage("agent_call", agent=agent_info.get("name"), task=task_def.get("type")):
+            return await self.result_cache.get_or_call(
+                agent_info.get("name"), task_def, parameters,
+                lambda: self.caller.call(agent_info, task_def, parameters))
+
+    async def execute_plan(self, plan, emit=None):
+        """
+        実行計画(plan)に従い、AIAgentのエンドポイント/runにPOSTしてタスクを実行。
+        パラメータが不足している場合はChatClientに追加情報を要求する。
+        planが "steps" を持つ場合は依存関係付きの複数ステップ（DAG）として実行する。
+        emitを指定すると各ステップの開始・終了をイベントとして通知する。
+        """
+        if not plan or not isinstance(plan, dict):
+            return {"error": "Invalid plan format"}
+        if "steps" in plan:
+            return await self._execute_dag(plan, emit)
+        agent_info, task_def, problem = self._prepare_step(plan)
+        if problem:
+            if "error" in problem:
+                return problem
+            return {**problem, "plan": plan}
         # 実際にAIAgentの/runを呼び出す
-        try:
-            async with httpx.AsyncClient() as client:
-                run_resp = await client.post(f"{endpoint}/run", json={"type": task_type, "parameters": parameters})
-                result = run_resp.json()
-            return {"result": result, "consent_required": False}
-        except Exception as e:
-            return {"error": f"Failed to execute agent task: {e}"}
+        entry = {"id": "main", "agent": plan.get("agent"), "task": plan.get("task")}
+        await self._emit(emit, "step_started", entry)
+        outcome = await self._run_step(agent_info, task_def, plan.get("parameters") or {})
+        await self._emit(emit, "step_finished", {**entry, "status": "ERROR" if "error" in outcome else "SUCCESS", **outcome})
+        if "error" in outcome:
+            return outcome
+        return {"result": outcome["result"], "consent_required": False}
+
+    @staticmethod
+    def _validate_dag(steps):
+        """
+        ステップIDの重複・未定義の依存先・循環依存を検出し、エラーメッセージを返す（問題なければNone）。
+        """
+        if not isinstance(steps, list) or not steps:
+            return "Plan 'steps' must be a non-empty list"
+        ids = [step.get("id") for step in steps if isinstance(step, dict)]
+        if len(ids) != len(steps) or any(not i for i in ids):
+            return "Every step must be an object with an 'id'"
+        if len(set(ids)) != len(ids):
+            return "Duplicate step id in plan"
+        deps = {step["id"]: list(step.get("depends_on") or []) for step in steps}
+        for step_id, parents in deps.items():
+            unknown = [p for p in parents if p not in deps]
+            if unknown:
+                return f"Step '{step_id}' depends on unknown steps: {unknown}"
+        # Kahnのアルゴリズムで循環を検出
+        indegree = {i: len(p) for i, p in deps.items()}
+        children = {i: [] for i in deps}
+        for step_id, parents in deps.items():
+            for p in parents:
+                children[p].append(step_id)
+        ready = [i for i, d in indegree.items() if d == 0]
+        visited = 0
+        while ready:
+            node = ready.pop()
+            visited += 1
+            for child in children[node]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if visited != len(deps):
+            return "Plan steps contain a dependency cycle"
+        return None
+
+    async def _execute_dag(self, plan, emit=None):
+        """
+        依存関係（depends_on）に従ってステップを実行する。依存の無いステップは
+        PLAN_STEP_CONCURRENCYの範囲で並列に実行し、失敗したステップに依存する
+        ステップのみをスキップする（無関係な分岐は継続する）。
+        """
+        steps = plan.get("steps")
+        err = self._validate_dag(steps)
+        if err:
+            return {"error": err}
+        prepared = {}
+        missing = {}
+        consent = []
+        for step in steps:
+            agent_info, task_def, problem = self._prepare_step(step)
+            if problem and "error" in problem:
+                return {"error": f"Step '{step['id']}': {problem['error']}"}
+            if problem and "missing_parameters" in problem:
+                missing[step["id"]] = problem["missing_parameters"]
+            elif problem and problem.get("consent_required"):
+                consent.append(step["id"])
+            prepared[step["id"]] = (agent_info, task_def)
+        if missing:
+            return {"missing_parameters": missing, "plan": plan}
+        if consent:
+            return {"consent_required": True, "consent_steps": consent, "plan": plan}
+
+        semaphore = asyncio.Semaphore(PLAN_STEP_CONCURRENCY)
+        results = {}
+        tasks = {}
+
+        async def run(step):
+            for parent in step.get("depends_on") or []:
+                await tasks[parent]
+            failed = [p for p in step.get("depends_on") or [] if results[p]["status"] != "SUCCESS"]
+            entry = {"agent": step.get("agent"), "task": step.get("task")}
+            if failed:
+                results[step["id"]] = {**entry, "status": "SKIPPED", "error": f"Dependency failed: {failed}"}
+                await self._emit(emit, "step_finished", {"id": step["id"], **results[step["id"]]})
+                return
+            async with semaphore:
+                await self._emit(emit, "step_started", {"id": step["id"], **entry})
+                outcome = await self._run_step(*prepared[step["id"]], step.get("parameters") or {})
+            if "error" in outcome:
+                results[step["id"]] = {**entry, "status": "ERROR", "error": outcome["error"]}
+            else:
+                results[step["id"]] = {**entry, "status": "SUCCESS", "result": outcome["result"]}
+            await self._emit(emit, "step_finished", {"id": step["id"], **results[step["id"]]})
+
+        # 依存先のタスクを先に参照できるよう、全ステップのタスクを作成してからまとめて待つ
+        for step in steps:
+            tasks[step["id"]] = asyncio.ensure_future(run(step))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for step in steps:
+            task = tasks[step["id"]]
+            if step["id"] not in results and task.exception() is not None:
+                results[step["id"]] = {"agent": step.get("agent"), "task": step.get("task"),
+                                       "status": "ERROR", "error": str(task.exception())}
+        ordered = {step["id"]: results[step["id"]] for step in steps}
+        succeeded = sum(1 for r in ordered.values() if r["status"] == "SUCCESS")
+        return {"steps": ordered, "succeeded": succeeded, "failed": len(ordered) - succeeded, "consent_required": False}
+
+    async def resolve_agent(self, agent_id: str):
+        """
+        エージェント名またはartifactIDからエージェント情報を返す（見つからなければNone）。
+        """
+        await self.fetch_agents()
+        return self.registry.find_agent(agent_id) or self.registry.find_artifact(agent_id)
+
+    async def run_job(self, job):
+        """
+        JobManagerのワーカーから呼ばれ、単一ステップの計画として実行する。
+        """
+        await self.fetch_agents()
+        return await self.execute_plan({"agent": job.agent, "task": job.task, "parameters": job.parameters})
 
     async def handle_command(self, command_in: CommandIn) -> CommandOut:
         """
@@ -169,7 +521,7 @@ class SuperAgentServer:
         arguments = command_in.arguments
 
         if command == "help": # README.mdでは"/"を除去したものがcommand
-            agents = await self.fetch_agents()
+            agents = await self.fetch_agents(include_inactive=True)
             # 機能一覧を分かりやすく整形
             features = []
             for agent in agents:
@@ -181,23 +533,66 @@ class SuperAgentServer:
                     "status": agent.get("status")
                 })
             return CommandOut(command=command, status="SUCCESS", result={"agents": features})
+        if command == "stats":
+            return CommandOut(command=command, status="SUCCESS", result=self.get_stats())
         # 他のコマンドは今後拡張
         return CommandOut(command=command, status="ERROR", errorMessage=f"Unknown command: {command}")
 
-    async def handle_request_logic(self, request_in: RequestIn) -> RequestOut:
+    def get_stats(self) -> dict:
+        """
+        内部キャッシュ等の統計情報を返す（/command stats）
+        """
+        return {
+            "registry": self.registry.describe(),
+            "http_pool": self.http.describe(),
+            "balancer": self.balancer.describe(),
+            "resilience": self.caller.describe(),
+            "planner": {"backend": PLAN_BACKEND, "concurrency": PLAN_CONCURRENCY, **self.plan_stats},
+            "prompt": {"top_k": PLANNER_TOP_K, "index_builds": self.agent_index.builds, **self.prompt_stats},
+            "plan_cache": self.plan_cache.describe(),
+            "routing": {"enabled": FAST_ROUTER_ENABLED, **self.route_stats, "router": self.fast_router.describe()},
+            "result_cache": self.result_cache.describe(),
+            "jobs": self.jobs.describe(),
+        }
+
+    async def handle_request_logic(self, request_in: RequestIn, emit=None) -> RequestOut:
         """
         ユーザ要求を処理し、RequestOut形式で結果を返却 (計画生成・実行ロジック)
+        emitを指定すると registry/plan/step_started/step_finished の各段階をイベントとして通知する。
         """
         user_input = request_in.user_input
 
-        agents = await self.fetch_agents()
-        plan, err = self.generate_plan(user_input, agents)
+        async with telemetry.stage("fetch_agents"):
+            agents = await self.fetch_agents()
+        await self._emit(emit, "registry", {"agents": len(agents), "version": self.registry.version})
+        profile_version = self.registry.profile_version
+        plan = None
+        if FAST_ROUTER_ENABLED:
+            # 単一タスクに一意に決まる要求はLLMを呼ばずに振り分ける
+            with telemetry.stage("fast_route"):
+                self.fast_router.ensure(agents, profile_version)
+                plan = self.fast_router.route(user_input)
+        route = "fast_path"
+        if plan is None:
+            # 同じ要求・同じレジストリ内容であればキャッシュ済みの計画を再利用する
+            plan = self.plan_cache.get(user_input, profile_version)
+            route = "plan_cache"
+        if plan is None:
+            route = "llm"
+            async with telemetry.stage("generate_plan"):
+                plan, err = await self.generate_plan(user_input, agents)
 
-        if err:
-            # エラー発生時はRequestOut形式でエラーを返す
-            return RequestOut(status="ERROR", result={"error": f"Plan LLM error: {err}"})
+            if err:
+                # エラー発生時はRequestOut形式でエラーを返す
+                self.route_stats[route] += 1
+                return RequestOut(status="ERROR", result={"error": f"Plan LLM error: {err}"})
+            if isinstance(plan, dict) and (plan.get("agent") or plan.get("steps")):
+                self.plan_cache.set(user_input, profile_version, plan)
+        self.route_stats[route] += 1
+        await self._emit(emit, "plan", {"plan": plan, "cached": route == "plan_cache", "route": route})
 
-        exec_result = await self.execute_plan(plan, agents)
+        async with telemetry.stage("execute_plan"):
+            exec_result = await self.execute_plan(plan, emit)
 
         # execute_planの戻り値をRequestOut形式に変換
         if "error" in exec_result:
@@ -208,6 +603,15 @@ class SuperAgentServer:
         elif "consent_required" in exec_result and exec_result["consent_required"]:
              # README.mdのstatusは「予約」だが、ここでは状態を示すために使用
             return RequestOut(status="CONSENT_REQUIRED", result=exec_result)
+        elif "steps" in exec_result:
+            # 複数ステップの場合は全成功でSUCCESS、一部失敗でPARTIAL、全失敗でERROR
+            if exec_result["failed"] == 0:
+                status = "SUCCESS"
+            elif exec_result["succeeded"] > 0:
+                status = "PARTIAL"
+            else:
+                status = "ERROR"
+            return RequestOut(status=status, result={"steps": exec_result["steps"]})
         elif "result" in exec_result:
             return RequestOut(status="SUCCESS", result=exec_result["result"])
         else:
@@ -216,6 +620,26 @@ class SuperAgentServer:
 
 
 super_agent = SuperAgentServer()
+# 既存の統計（経路別の件数・キャッシュ・計画生成の待ち）をそのまま /metrics にも出す
+telemetry.callback("plan_route_total", "計画の決め方ごとの件数", lambda: super_agent.route_stats,
+                   kind="counter", label="route")
+telemetry.callback("plan_cache_events_total", "実行計画キャッシュのヒット・ミス",
+                   lambda: {k: v for k, v in super_agent.plan_cache.describe().items()
+                            if k in ("hits", "misses", "evictions", "expirations")}, kind="counter", label="event")
+telemetry.callback("result_cache_events_total", "タスク結果キャッシュのヒット・ミス・合流",
+                   lambda: {k: v for k, v in super_agent.result_cache.describe().items()
+                            if k in ("hits", "misses", "joined", "bypassed")}, kind="counter", label="event")
+telemetry.callback("llm_plan_calls", "計画生成（Gemini呼び出し）の実行中・待ちの数",
+                   lambda: {"in_flight": super_agent.plan_stats["in_flight"], "waiting": super_agent.plan_stats["waiting"]},
+                   label="state")
+
+@app.on_event("startup")
+async def on_startup():
+    await super_agent.startup()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await super_agent.shutdown()
 
 @app.post("/command", response_model=CommandOut) # /command エンドポイントを新設
 async def command_endpoint(command_in: CommandIn):
@@ -225,14 +649,119 @@ async def command_endpoint(command_in: CommandIn):
     return await super_agent.handle_command(command_in)
 
 
+async def run_until_disconnected(request: Request, coro):
+    """
+    コルーチンを実行し、途中でクライアントが切断した場合はキャンセルしてNoneを返す。
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logging.info("[SuperAgentServer] クライアント切断のため処理をキャンセルします")
+                task.cancel()
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @app.post("/request", response_model=RequestOut)
-async def request_endpoint(request_in: RequestIn):
+async def request_endpoint(request_in: RequestIn, request: Request):
     """
     ChatClientからのユーザ要求を受け取り処理する
     """
     # README.mdの定義に従い、/requestは純粋なユーザ要求のみを処理
     # コマンド処理は/commandエンドポイントへ移動
-    return await super_agent.handle_request_logic(request_in)
+    result = await run_until_disconnected(request, super_agent.handle_request_logic(request_in))
+    if result is None:
+        return RequestOut(status="CANCELLED", result=None)
+    return result
+
+@app.post("/agents/{agent_id:path}/tasks", status_code=202)
+async def submit_task_endpoint(agent_id: str, task_in: TaskIn):
+    """
+    エージェントへタスクを非同期に割り当てる（MCP_A2A.md）。
+    即座にタスクIDを返し、結果は GET /agents/{agent_id}/tasks/{task_id} または callback_url で受け取る。
+    """
+    agent = await super_agent.resolve_agent(agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail=f"Agent '{agent_id}' not found")
+    try:
+        job = super_agent.jobs.submit(agent["name"], task_in.type, task_in.parameters, task_in.callback_url)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Task queue is full", headers={"Retry-After": "1"})
+    except InvalidCallbackUrl as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "id": job.id,
+        "status": job.status,
+        "status_url": f"/agents/{agent_id}/tasks/{job.id}",
+    }
+
+
+@app.get("/agents/{agent_id:path}/tasks/{task_id}")
+async def get_task_endpoint(agent_id: str, task_id: str):
+    """
+    非同期タスクの状態・結果を返す。保持期間を過ぎたタスクは404。
+    """
+    job = super_agent.jobs.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    agent = await super_agent.resolve_agent(agent_id)
+    if agent is None or agent.get("name") != job.agent:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return job.to_dict()
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+@app.post("/request/stream")
+async def request_stream_endpoint(request_in: RequestIn):
+    """
+    /request のストリーミング版（Server-Sent Events）。
+    registry → plan → step_started/step_finished → result の順にイベントを送信する。
+    クライアントが切断すると実行中の処理はキャンセルされる。
+    """
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def emit(event, data):
+            await queue.put((event, data))
+
+        async def run():
+            try:
+                out = await super_agent.handle_request_logic(request_in, emit=emit)
+                await queue.put(("result", out))
+            except Exception as e:
+                logging.error(f"[SuperAgentServer] ストリーミング処理で例外発生: {e}")
+                await queue.put(("result", RequestOut(status="ERROR", result={"error": str(e)})))
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(run())
+        try:
+            yield format_sse("accepted", {"user_input": request_in.user_input})
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield format_sse(*item)
+        finally:
+            # クライアント切断時はここでジェネレータが閉じられるため、処理も中断する
+            if not task.done():
+                task.cancel()
+                logging.info("[SuperAgentServer] ストリーミング中にクライアントが切断したため処理をキャンセルしました")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/")
 def index():
@@ -0,0 +1,116 @@
+# 同じartifactIDを持つ複数インスタンス（レプリカ）から呼び出し先を選ぶロードバランサ
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def live_endpoints(agent_info: dict) -> List[str]:
+    """
+    レジストリのエージェント情報から active なインスタンスのendpoint一覧を返す。
+    instances を持たない旧形式は endpoint 1件として扱う。
+    """
+    instances = agent_info.get("instances")
+    if not isinstance(instances, list):
+        return [agent_info["endpoint"]] if agent_info.get("endpoint") else []
+    return [i["endpoint"] for i in instances if i.get("endpoint") and i.get("status", "active") == "active"]
+
+
+class _EndpointStats:
+    __slots__ = ("ewma", "in_flight", "requests", "errors")
+
+    def __init__(self):
+        self.ewma: Optional[float] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+
+class LoadBalancer:
+    """
+    endpointごとのレイテンシ（EWMA）と処理中リクエスト数を記録し、呼び出し先を選ぶ。
+    policy:
+      p2c               ランダムに2つ選び、(処理中+1)×EWMA が小さい方（power of two choices）
+      least_outstanding 処理中リクエスト数が最小のもの（同数ならEWMAが小さい方）
+    計測値の無いendpointは優先して試す（新しいレプリカにも負荷が回るようにする）。
+    """
+    def __init__(self, policy: str = "p2c", alpha: float = 0.3, rng: Optional[random.Random] = None):
+        if policy not in ("p2c", "least_outstanding"):
+            raise ValueError(f"Unknown load balancing policy: {policy}")
+        self.policy = policy
+        self.alpha = alpha
+        self._rng = rng or random.Random()
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def _get(self, endpoint: str) -> _EndpointStats:
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = _EndpointStats()
+        return stats
+
+    def _cost(self, endpoint: str) -> tuple:
+        stats = self._get(endpoint)
+        if stats.ewma is None:
+            return (0, 0.0)
+        if self.policy == "least_outstanding":
+            return (1, stats.in_flight, stats.ewma)
+        return (1, (stats.in_flight + 1) * stats.ewma)
+
+    def choose(self, agent_info: dict, exclude: Iterable[str] = ()) -> str:
+        """
+        呼び出し先のendpointを返す。exclude のendpointは他に候補がある限り選ばない。
+        """
+        candidates = live_endpoints(agent_info)
+        exclude = set(exclude)
+        remaining = [e for e in candidates if e not in exclude]
+        candidates = remaining or candidates
+        if not candidates:
+            return agent_info["endpoint"]
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.policy == "p2c":
+            candidates = self._rng.sample(candidates, 2)
+        return min(candidates, key=self._cost)
+
+    def observe(self, endpoint: str, elapsed: float, ok: bool = True):
+        stats = self._get(endpoint)
+        stats.requests += 1
+        if not ok:
+            stats.errors += 1
+        stats.ewma = elapsed if stats.ewma is None else self.alpha * elapsed + (1 - self.alpha) * stats.ewma
+
+    @asynccontextmanager
+    async def track(self, endpoint: str):
+        """
+        処理中リクエスト数を増減し、所要時間をEWMAに反映する。例外時は失敗として記録する。
+        """
+        stats = self._get(endpoint)
+        stats.in_flight += 1
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        except asyncio.CancelledError:
+            # 取り消された呼び出し（ヘッジの負け側等）はレイテンシ・失敗として数えない
+            ok = None
+            raise
+        finally:
+            stats.in_flight -= 1
+            if ok is not None:
+                self.observe(endpoint, time.monotonic() - started, ok)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "endpoints": {
+                endpoint: {
+                    "ewma_ms": round(s.ewma * 1000, 3) if s.ewma is not None else None,
+                    "in_flight": s.in_flight,
+                    "requests": s.requests,
+                    "errors": s.errors,
+                }
+                for endpoint, s in self._stats.items()
+            },
+        }
@@ -0,0 +1,154 @@
+# 同じAIAgentインスタンスへの同時呼び出しを /run/batch 1回にまとめるコアレッサ
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from http_pool import HttpClientPool
+
+
+class RemoteCallError(Exception):
+    """
+    バッチ内の1件のタスクがエージェント側で失敗した。インスタンスは応答しているので、
+    ブレーカの失敗にもリトライの対象にもしない。
+    """
+    pass
+
+
+class BatchRequestError(Exception):
+    """
+    リクエスト自体の失敗（通信エラー・5xx・不正な応答）。まとめて送った呼び出し元すべてに同じインスタンスを渡すので、
+    ブレーカには claim() が True を返した1件だけが数える。
+    """
+    def __init__(self, message: str):
+        super().__init__(message)
+        self._claimed = False
+
+    def claim(self) -> bool:
+        claimed, self._claimed = self._claimed, True
+        return not claimed
+
+
+class _Pending:
+    __slots__ = ("items", "handle")
+
+    def __init__(self):
+        self.items: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class CallCoalescer:
+    """
+    endpoint・タスク種別（とタイムアウト）ごとに window 秒だけ呼び出しを溜め、2件以上なら /run/batch にまとめて送る。
+    種別ごとに分けるので、遅いタスクの後ろに速いタスクが並んで待たされることはない。
+    1件だけなら通常の /run を使う。max_batch 件に達したら待たずに送る。
+    /run/batch を持たない（404 を返す）エージェントは記憶し、以降は1件ずつ /run で呼び出す。
+    """
+    def __init__(self, http: HttpClientPool, window: float = 0.002, max_batch: int = 32):
+        self.http = http
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[tuple, _Pending] = {}
+        self._unsupported: Set[str] = set()
+        self._sending: Set[asyncio.Task] = set()
+        self.stats = {"calls": 0, "single_requests": 0, "batch_requests": 0, "batched_calls": 0, "fallbacks": 0}
+
+    async def submit(self, endpoint: str, task_type: str, parameters: Dict[str, Any],
+                     timeout: Optional[httpx.Timeout] = None) -> Any:
+        """
+        タスクを実行して /run の応答本文（結果）を返す。1件で送った場合の通信エラーは httpx の例外、
+        5xx は BatchRequestError、バッチ全体の失敗は BatchRequestError、バッチ内の1件の失敗と
+        /run/batch の 4xx（404/405 以外）は RemoteCallError として送出する。
+        """
+        self.stats["calls"] += 1
+        if endpoint in self._unsupported:
+            return await self._run_single(endpoint, {"type": task_type, "parameters": parameters}, timeout)
+        key = (endpoint, task_type, timeout.connect if timeout else None, timeout.read if timeout else None)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+            pending.handle = asyncio.get_running_loop().call_later(self.window, self._flush, key, timeout)
+        pending.items.append(({"type": task_type, "parameters": parameters}, future))
+        if len(pending.items) >= self.max_batch:
+            self._flush(key, timeout)
+        return await future
+
+    def _flush(self, key: tuple, timeout: Optional[httpx.Timeout]):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        # 呼び出し元が取り消し済み（ヘッジの負け側等）の分は送らない
+        items = [(task, f) for task, f in pending.items if not f.done()]
+        if not items:
+            return
+        task = asyncio.ensure_future(self._send(key[0], items, timeout))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, endpoint: str, items: List[Tuple[Dict[str, Any], asyncio.Future]],
+                    timeout: Optional[httpx.Timeout]):
+        try:
+            if len(items) == 1:
+                outcomes = [await self._run_single_outcome(endpoint, items[0][0], timeout)]
+            else:
+                outcomes = await self._run_batch(endpoint, [task for task, _ in items], timeout)
+        except BatchRequestError as e:
+            # 全員に同じ例外を渡し、ブレーカには1回だけ数えさせる
+            outcomes = [e] * len(items)
+        except Exception as e:
+            failure = BatchRequestError(f"{type(e).__name__}: {e}")
+            failure.__cause__ = e
+            outcomes = [failure] * len(items)
+        for (_, future), outcome in zip(items, outcomes):
+            if future.done():
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    async def _run_single_outcome(self, endpoint: str, task: Dict[str, Any], timeout) -> Any:
+        try:
+            return await self._run_single(endpoint, task, timeout)
+        except Exception as e:
+            return e
+
+    async def _run_single(self, endpoint: str, task: Dict[str, Any], timeout) -> Any:
+        self.stats["single_requests"] += 1
+        resp = await self.http.post(f"{endpoint}/run", json=task, timeout=timeout)
+        if resp.status_code >= 500:
+            raise BatchRequestError(f"{endpoint} returned HTTP {resp.status_code}")
+        return resp.json()
+
+    async def _run_batch(self, endpoint: str, tasks: List[Dict[str, Any]], timeout) -> List[Any]:
+        resp = await self.http.post(f"{endpoint}/run/batch", json={"tasks": tasks}, timeout=timeout)
+        if resp.status_code in (404, 405):
+            logging.info(f"[CallCoalescer] {endpoint} は /run/batch 未対応のため個別に呼び出します")
+            self._unsupported.add(endpoint)
+            self.stats["fallbacks"] += 1
+            return await asyncio.gather(*(self._run_single_outcome(endpoint, t, timeout) for t in tasks))
+        if resp.status_code >= 500:
+            raise BatchRequestError(f"{endpoint} returned HTTP {resp.status_code}")
+        if resp.status_code >= 400:
+            # 応答できているので /run の 4xx と同じくブレーカの失敗にはせず、各呼び出しのエラーとして返す
+            return [RemoteCallError(f"{endpoint} returned HTTP {resp.status_code} for /run/batch") for _ in tasks]
+        results = resp.json().get("results")
+        if not isinstance(results, list) or len(results) != len(tasks):
+            raise BatchRequestError(f"{endpoint} returned a malformed batch response")
+        self.stats["batch_requests"] += 1
+        self.stats["batched_calls"] += len(tasks)
+        return [item["result"] if "result" in item else RemoteCallError(item.get("error", "batch item failed"))
+                for item in results]
+
+    def describe(self) -> Dict[str, Any]:
+        batches = self.stats["batch_requests"]
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            **self.stats,
+            "avg_batch_size": round(self.stats["batched_calls"] / batches, 2) if batches else None,
+            "unsupported_endpoints": sorted(self._unsupported),
+        }
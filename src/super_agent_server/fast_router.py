@@ -0,0 +1,137 @@
+# LLMを呼ばずに、曖昧さの無い短い要求（"cpu" / "メモリ使用量" 等）を単一タスクへ振り分ける決定的ルータ
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from plan_cache import normalize_user_input
+
+# タスク種別の先頭の動詞と末尾の総称語。"get_cpu_metrics" からは "cpumetrics" と "cpu" を語句にする
+_LEADING_VERBS = {"get", "list", "fetch", "show"}
+_GENERIC_SUFFIXES = {"metrics", "metric", "info", "status"}
+
+# どのタスクにも対応しないが、要求に含まれていても意味を変えない語（一致した分は被覆に数える）
+DEFAULT_FILLERS = (
+    "の", "は", "を", "が", "て", "教えて", "ください", "見せて", "表示", "して", "確認", "知りたい",
+    "現在", "今", "いま", "状況", "状態", "使用量", "使用率", "一覧",
+    "show", "me", "get", "the", "current", "what", "is", "how", "much", "please", "check", "usage", "used",
+)
+
+
+def compact(text: str) -> str:
+    """
+    normalize_user_input の結果から句読点と空白も取り除いた照合用の文字列を返す（"CPU 使用率は？" → "cpu使用率は"）。
+    語句の区切りは照合時に決めるので区切りは残さない。パラメータの無いタスクだけを扱うので記号の違いは問題にならない。
+    """
+    return "".join(ch for ch in normalize_user_input(text)
+                   if not ch.isspace() and not unicodedata.category(ch).startswith("P"))
+
+
+def task_phrases(task: Dict[str, Any]) -> List[str]:
+    """
+    タスク定義から照合用の語句（正規化済み）を作る。種別名から導いた語句と、任意の keywords。
+    """
+    words = [w for w in str(task.get("type") or "").split("_") if w]
+    if len(words) > 1 and words[0] in _LEADING_VERBS:
+        words = words[1:]
+    phrases = ["".join(words)]
+    if len(words) > 1 and words[-1] in _GENERIC_SUFFIXES:
+        phrases.append("".join(words[:-1]))
+    phrases.extend(compact(str(k)) for k in task.get("keywords") or [])
+    return [p for p in phrases if len(p) >= 2]
+
+
+def takes_parameters(task: Dict[str, Any]) -> bool:
+    # パラメータを1つでも持つタスクは対象外。省略可能なものだけでも、"top 20 processes" の 20 のように
+    # 入力に含まれた値を捨てて既定値で実行してしまうため、値の抽出は計画キャッシュ・LLMに任せる
+    return bool(task.get("parameters"))
+
+
+class FastRouter:
+    """
+    生存中のエージェントの tasks（種別名と keywords）と、タスク名を挙げた capabilities から語句辞書を作り、
+    正規化したユーザ入力を、覆える文字数が最大になるよう語句に区切る。一致したタスクがちょうど1つで、語句とつなぎ語で
+    入力の min_coverage 以上を覆えた場合だけ計画を返す。それ以外（一致なし・複数候補・余りが多い）は None。
+    辞書はレジストリのプロファイルバージョンが変わった時だけ作り直す。
+    """
+    def __init__(self, min_coverage: float = 0.8, fillers: Iterable[str] = DEFAULT_FILLERS):
+        self.min_coverage = min_coverage
+        self.fillers = tuple(compact(f) for f in fillers)
+        self.version: Optional[str] = None
+        self._phrases: Dict[str, Set[Tuple[str, str]]] = {}
+        self._max_len = 0
+        self.builds = 0
+        self.stats = {"routed": 0, "no_match": 0, "ambiguous": 0, "low_coverage": 0}
+
+    def ensure(self, agents: List[Dict[str, Any]], version: Optional[str]):
+        if version is None or version != self.version:
+            self.build(agents, version)
+
+    def build(self, agents: List[Dict[str, Any]], version: Optional[str]):
+        phrases: Dict[str, Set[Tuple[str, str]]] = {f: set() for f in self.fillers if f}
+        for agent in agents:
+            name = agent.get("name")
+            tasks = {t.get("type"): t for t in agent.get("tasks") or [] if isinstance(t, dict) and t.get("type")}
+            # capabilities にタスク名が挙がっていないエージェントは全タスクを対象にする
+            listed = [c for c in agent.get("capabilities") or [] if c in tasks] or list(tasks)
+            for task_type in listed:
+                task = tasks[task_type]
+                if not name or takes_parameters(task):
+                    continue
+                for phrase in task_phrases(task):
+                    phrases.setdefault(phrase, set()).add((name, task_type))
+        self._phrases = phrases
+        self._max_len = max((len(p) for p in phrases), default=0)
+        self.version = version
+        self.builds += 1
+
+    def _match(self, text: str) -> Tuple[Set[Tuple[str, str]], int]:
+        """
+        覆える文字数が最大になるよう語句で区切り（動的計画法）、(一致したタスクの集合, 覆えた文字数) を返す。
+        貪欲な最長一致だと "showmememory" を "me|me|mory" と区切ってしまうため。
+        """
+        n = len(text)
+        # best[i]: text[i:] で覆える最大文字数、step[i]: その時 i から始まる語句の長さ（0 は1文字読み飛ばし）
+        best = [0] * (n + 1)
+        step = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            best[i], step[i] = best[i + 1], 0
+            # 同じ文字数を覆えるなら長い語句を優先する（"cpupercore" を "cpu|percore" と分けない）
+            for length in range(min(self._max_len, n - i), 0, -1):
+                if text[i:i + length] in self._phrases and length + best[i + length] > best[i]:
+                    best[i], step[i] = length + best[i + length], length
+        targets: Set[Tuple[str, str]] = set()
+        i = 0
+        while i < n:
+            if step[i]:
+                targets |= self._phrases[text[i:i + step[i]]]
+                i += step[i]
+            else:
+                i += 1
+        return targets, best[0]
+
+    def route(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        確信度が高ければ {"agent", "task", "parameters": {}} を返し、そうでなければ None を返す。
+        """
+        text = compact(user_input or "")
+        targets, covered = self._match(text) if text else (set(), 0)
+        if not targets:
+            self.stats["no_match"] += 1
+            return None
+        if len(targets) > 1:
+            self.stats["ambiguous"] += 1
+            return None
+        if covered / len(text) < self.min_coverage:
+            self.stats["low_coverage"] += 1
+            return None
+        self.stats["routed"] += 1
+        agent, task = next(iter(targets))
+        return {"agent": agent, "task": task, "parameters": {}}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "builds": self.builds,
+            "phrases": sum(1 for targets in self._phrases.values() if targets),
+            "min_coverage": self.min_coverage,
+            **self.stats,
+        }
@@ -0,0 +1,126 @@
+# SuperAgentServer が使う長寿命のHTTPクライアントプール
+import logging
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401  HTTP/2 はh2パッケージがある場合のみ有効化できる
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClientPool:
+    """
+    接続先ホスト（origin）ごとに httpx.AsyncClient を1つ保持するプール。
+    ホスト単位で接続数上限・keep-alive を効かせ、レジストリや各AIAgentへの
+    呼び出しでTCP接続を再利用する。FastAPIの起動/終了イベントで開閉する。
+    """
+    def __init__(
+        self,
+        max_connections_per_host: int = 20,
+        max_keepalive_per_host: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 30.0,
+        agent_timeouts: Optional[Dict[str, Dict[str, float]]] = None,
+        extra_headers: Optional[Callable[[], Dict[str, str]]] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning("[HttpClientPool] h2パッケージが無いためHTTP/2を無効化します")
+            http2 = False
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # エージェント名ごとのタイムアウト上書き（環境変数 AGENT_TIMEOUTS 由来）
+        self.agent_timeouts = agent_timeouts or {}
+        # 呼び出しごとに付けるヘッダ（トレースIDの受け渡し等）を返す関数
+        self.extra_headers = extra_headers
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def default_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def timeout_for(self, agent_info: Dict[str, Any], task_def: Optional[Dict[str, Any]] = None) -> httpx.Timeout:
+        """
+        エージェント・タスクごとの connect/read タイムアウトを返す。
+        優先順位: AGENT_TIMEOUTS の "エージェント名.タスク" > AGENT_TIMEOUTS のエージェント名
+                  > レジストリのタスク定義の timeouts > レジストリ登録情報の timeouts > 既定値
+        """
+        name = agent_info.get("name")
+        conf = dict(agent_info.get("timeouts") or {})
+        if task_def:
+            conf.update(task_def.get("timeouts") or {})
+        conf.update(self.agent_timeouts.get(name, {}))
+        if task_def:
+            conf.update(self.agent_timeouts.get(f"{name}.{task_def.get('type')}", {}))
+        read = float(conf.get("read", self.read_timeout))
+        connect = float(conf.get("connect", self.connect_timeout))
+        return httpx.Timeout(read, connect=connect)
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.default_timeout(),
+                http2=self.http2,
+            )
+            self._clients[origin] = client
+        return client
+
+    def _with_headers(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        extra = self.extra_headers() if self.extra_headers else None
+        if extra:
+            kwargs["headers"] = {**extra, **(kwargs.get("headers") or {})}
+        return kwargs
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.client_for(url).get(url, **self._with_headers(kwargs))
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.client_for(url).post(url, **self._with_headers(kwargs))
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    @staticmethod
+    def _pool_state(client: httpx.AsyncClient) -> Optional[Dict[str, int]]:
+        """
+        接続プールの open/idle/active/waiting を返す。httpx には公開APIが無いため httpcore の非公開属性
+        （AsyncConnectionPool.connections / _requests、is_idle() / is_queued()）を読む。
+        requirements.txt で固定した httpcore==1.0.9 の内部構造に依存しており、構造が違う版
+        （またはテスト用のトランスポート）では例外にせず None を返す。
+        """
+        try:
+            pool = client._transport._pool
+            connections = list(pool.connections)
+            requests = list(pool._requests)
+            idle = sum(1 for c in connections if c.is_idle())
+            waiting = sum(1 for r in requests if r.is_queued())
+        except Exception:
+            return None
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle, "waiting": waiting}
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        ホストごとの接続数（open/idle/active）と接続待ちのリクエスト数を返す（取得できない場合は null）。
+        """
+        return {
+            "http2": self.http2,
+            "max_connections_per_host": self.limits.max_connections,
+            "max_keepalive_per_host": self.limits.max_keepalive_connections,
+            "hosts": {origin: self._pool_state(client) for origin, client in self._clients.items()},
+        }
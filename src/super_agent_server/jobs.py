@@ -0,0 +1,223 @@
+# AIAgentタスクを非同期ジョブとして実行するためのキューとワーカー
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """
+    非同期タスク1件分の状態。status は queued → in_progress → completed | failed と遷移する。
+    """
+    def __init__(self, agent: str, task: str, parameters: Dict[str, Any], callback_url: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.agent = agent
+        self.task = task
+        self.parameters = parameters
+        self.callback_url = callback_url
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.webhook_status: Optional[str] = None
+        self.created_at = _now_iso()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.finished_monotonic: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.task,
+            "parameters": self.parameters,
+            "assigned_to": self.agent,
+            "status": self.status,
+            "results": self.result,
+            "error": self.error,
+            "callback_url": self.callback_url,
+            "webhook_status": self.webhook_status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class InvalidCallbackUrl(Exception):
+    pass
+
+
+def check_callback_url(url: str, allowed_hosts: Iterable[str]) -> Optional[str]:
+    """
+    callback_url が http/https で、ホストが allowed_hosts（"*.example.com" は配下のホスト）に
+    含まれるか検査し、問題があれば理由を返す（問題なければNone）。
+    利用者が指定したURLへサーバから送信するため、許可していない内部サービスへ届かないようにする。
+    """
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        parts.port  # 不正なポートは ValueError
+    except ValueError as e:
+        return f"invalid callback_url: {e}"
+    if parts.scheme not in ("http", "https") or not host:
+        return "callback_url must be an absolute http(s) URL"
+    if parts.username or parts.password:
+        return "callback_url must not contain credentials"
+    for allowed in allowed_hosts:
+        if host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:])):
+            return None
+    return f"callback_url host '{host}' is not allowed"
+
+
+class JobManager:
+    """
+    上限付きキューと固定数のワーカーでジョブを実行する。
+    完了したジョブは retention 秒だけ保持して状態・結果の取得に応じ、その後破棄する。
+    callback_url が指定されていれば完了時にジョブ内容をPOSTする（Webhook）。callback_url は
+    callback_hosts に挙げたホストだけを受け付け、AIAgent用の接続プールとは別の使い捨てクライアントで
+    （トレースID等のヘッダを付けず、リダイレクトも追わずに）callback_timeout 秒以内に送る。
+    """
+    def __init__(
+        self,
+        runner: Callable[[Job], Awaitable[Dict[str, Any]]],
+        workers: int = 4,
+        queue_size: int = 100,
+        retention: float = 3600.0,
+        callback_hosts: Iterable[str] = (),
+        callback_timeout: float = 5.0,
+    ):
+        self.runner = runner
+        self.callback_hosts = [h.lower() for h in callback_hosts]
+        self.callback_timeout = callback_timeout
+        self.workers = workers
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list = []
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "expired": 0,
+                      "webhooks_sent": 0, "webhooks_failed": 0}
+
+    def submit(self, agent: str, task: str, parameters: Dict[str, Any], callback_url: Optional[str] = None) -> Job:
+        """
+        ジョブをキューに入れる。キューが満杯なら JobQueueFull、callback_url が許可されていなければ
+        InvalidCallbackUrl を送出する。
+        """
+        if callback_url:
+            problem = check_callback_url(callback_url, self.callback_hosts)
+            if problem:
+                self.stats["rejected"] += 1
+                raise InvalidCallbackUrl(problem)
+        job = Job(agent, task, parameters, callback_url)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise JobQueueFull()
+        self.jobs[job.id] = job
+        self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "in_progress"
+        job.started_at = _now_iso()
+        try:
+            outcome = await self.runner(job)
+            if "result" in outcome and "error" not in outcome:
+                job.status = "completed"
+                job.result = outcome["result"]
+            else:
+                job.status = "failed"
+                job.result = outcome
+                job.error = outcome.get("error") or "Task could not be executed"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            logging.error(f"[JobManager] ジョブ実行で例外発生: {job.id}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = _now_iso()
+            job.finished_monotonic = time.monotonic()
+            self.stats["completed" if job.status == "completed" else "failed"] += 1
+        if job.callback_url:
+            await self._notify(job)
+
+    def _callback_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(timeout=self.callback_timeout, follow_redirects=False)
+
+    async def _notify(self, job: Job):
+        try:
+            async with self._callback_client() as client:
+                resp = await client.post(job.callback_url, json=job.to_dict())
+            resp.raise_for_status()
+            job.webhook_status = "sent"
+            self.stats["webhooks_sent"] += 1
+        except Exception as e:
+            logging.warning(f"[JobManager] Webhook通知失敗: {job.callback_url}: {e}")
+            job.webhook_status = f"failed: {e}"
+            self.stats["webhooks_failed"] += 1
+
+    async def _sweeper(self):
+        interval = max(1.0, min(60.0, self.retention / 10))
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    def expire(self) -> int:
+        """
+        保持期間を過ぎた完了済みジョブを削除し、削除件数を返す。
+        """
+        deadline = time.monotonic() - self.retention
+        expired = [jid for jid, job in self.jobs.items()
+                   if job.finished_monotonic is not None and job.finished_monotonic < deadline]
+        for jid in expired:
+            del self.jobs[jid]
+        self.stats["expired"] += len(expired)
+        return len(expired)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "in_progress": sum(1 for j in self.jobs.values() if j.status == "in_progress"),
+            "retained": len(self.jobs),
+            "retention": self.retention,
+            **self.stats,
+        }
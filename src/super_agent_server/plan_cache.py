@@ -0,0 +1,56 @@
+# 正規化したユーザ入力とレジストリのバージョンをキーにした実行計画キャッシュ
+import copy
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+
+from cache import LRUCache
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_user_input(user_input: str) -> str:
+    """
+    全角/半角・大文字/小文字・空白の連続と、前後の句読点の違いを吸収した比較用の文字列を返す。
+    例: "CPU使用率は？" と "cpu使用率は?" は同じ文字列になる。
+    文中の記号や空白の有無（"/tmp/a-b" と "/tmp/ab"、"ls -l x" と "ls -lx"）は計画のパラメータに
+    関わりうるので区別する。
+    """
+    text = _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", user_input or "").casefold()).strip()
+    start, end = 0, len(text)
+    while start < end and unicodedata.category(text[start]).startswith("P"):
+        start += 1
+    while end > start and unicodedata.category(text[end - 1]).startswith("P"):
+        end -= 1
+    return text[start:end].strip()
+
+
+class PlanCache:
+    """
+    generate_planの結果をキャッシュする。キーは (正規化したuser_input, レジストリの
+    プロファイルバージョン) で、エージェントやtasksが変わるとバージョンが変わるため
+    古い計画は参照されなくなる（バージョン切替時にまとめて破棄する）。
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0):
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+        self._version: Optional[str] = None
+        self.invalidations = 0
+
+    def _sync_version(self, version: Optional[str]):
+        if version != self._version:
+            if self._version is not None:
+                self.invalidations += self._cache.purge(lambda key: key[1] != version)
+            self._version = version
+
+    def get(self, user_input: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        self._sync_version(version)
+        plan = self._cache.get((normalize_user_input(user_input), version))
+        # 呼び出し側で計画を書き換えてもキャッシュが汚れないよう複製して返す
+        return copy.deepcopy(plan) if plan is not None else None
+
+    def set(self, user_input: str, version: Optional[str], plan: Dict[str, Any]):
+        self._sync_version(version)
+        self._cache.set((normalize_user_input(user_input), version), copy.deepcopy(plan))
+
+    def describe(self) -> Dict[str, Any]:
+        return {"version": self._version, "invalidations": self.invalidations, **self._cache.describe()}
@@ -0,0 +1,164 @@
+# AgentRegistryService のエージェント一覧をプロセス内に保持するスナップショット
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from http_pool import HttpClientPool
+
+
+def is_live(agent: Dict[str, Any]) -> bool:
+    """
+    レジストリ上で生存扱いのエージェントか（status未設定は旧形式の登録として生存扱い）。
+    """
+    return agent.get("status", "active") == "active"
+
+
+class RegistrySnapshot:
+    """
+    AgentRegistryServiceの /agents をメモリ上に保持するスナップショット。
+    バックグラウンドで定期的に再取得し、レジストリのETag（なければ本文のハッシュ）を
+    バージョンとして扱う。バージョンが変わった時だけ内容を差し替えるため、
+    リクエスト処理側はネットワークに出ずにエージェント情報を参照できる。
+    """
+    def __init__(self, registry_url: str, http: HttpClientPool, refresh_interval: float = 5.0, max_age: float = 30.0):
+        self.registry_url = registry_url
+        self.http = http
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age  # これより古いスナップショットは読み出し時に同期再取得する
+        self.agents: List[Dict[str, Any]] = []
+        self.live_agents: List[Dict[str, Any]] = []
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        self.by_artifact: Dict[str, Dict[str, Any]] = {}
+        self.tasks_by_agent: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.version: Optional[str] = None
+        # 生存中エージェントの計画生成に影響する項目（name/description/capabilities/tasks）だけから求めたバージョン
+        self.profile_version: Optional[str] = None
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self.stats = {"refreshes": 0, "changes": 0, "not_modified": 0, "errors": 0}
+        self._etag: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def is_loaded(self) -> bool:
+        return self.version is not None
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.refreshed_at > self.max_age
+
+    async def get(self, include_inactive: bool = False) -> List[Dict[str, Any]]:
+        """
+        生存中のエージェント一覧を返す（include_inactive=True の場合はリース切れも含む全件）。
+        未取得または古すぎる場合のみレジストリへ問い合わせ、再取得に失敗しても
+        既存のスナップショットがあればそれを返す。
+        """
+        if not self.is_loaded():
+            await self.refresh()
+        elif self.is_stale():
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.warning(f"[RegistrySnapshot] 再取得失敗のため古いスナップショットを使用: {e}")
+        return self.agents if include_inactive else self.live_agents
+
+    def find_agent(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.by_name.get(name)
+
+    def find_artifact(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_artifact.get(artifact_id)
+
+    def find_task(self, agent_name: str, task_type: str) -> Optional[Dict[str, Any]]:
+        return self.tasks_by_agent.get(agent_name, {}).get(task_type)
+
+    async def refresh(self) -> bool:
+        """
+        レジストリから一覧を取得し、バージョンが変わっていれば差し替える。
+        内容が変わった場合にTrueを返す。
+        """
+        async with self._lock:
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            self.stats["refreshes"] += 1
+            try:
+                resp = await self.http.get(f"{self.registry_url}/agents", headers=headers)
+                if resp.status_code == 304:
+                    self.stats["not_modified"] += 1
+                    self.refreshed_at = time.monotonic()
+                    return False
+                resp.raise_for_status()
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            etag = resp.headers.get("ETag")
+            version = etag or "sha1:" + hashlib.sha1(resp.content).hexdigest()
+            self.refreshed_at = time.monotonic()
+            if version == self.version:
+                return False
+            agents = resp.json()
+            self._apply(agents, version)
+            self._etag = etag
+            return True
+
+    def _apply(self, agents: List[Dict[str, Any]], version: str):
+        self.agents = agents
+        self.live_agents = [a for a in agents if is_live(a)]
+        self.by_name = {a.get("name"): a for a in agents if a.get("name")}
+        self.by_artifact = {a.get("artifactID"): a for a in agents if a.get("artifactID")}
+        self.tasks_by_agent = {
+            name: {t.get("type"): t for t in a.get("tasks") or [] if isinstance(t, dict) and t.get("type")}
+            for name, a in self.by_name.items()
+        }
+        self.version = version
+        self.profile_version = self._profile_version(self.live_agents)
+        self.loaded_at = time.monotonic()
+        self.stats["changes"] += 1
+        logging.info(f"[RegistrySnapshot] スナップショット更新: version={version} agents={len(agents)}")
+
+    @staticmethod
+    def _profile_version(agents: List[Dict[str, Any]]) -> str:
+        profiles = sorted(
+            (
+                a.get("name") or "",
+                a.get("description") or "",
+                a.get("capabilities") or [],
+                a.get("tasks") or [],
+            )
+            for a in agents
+        )
+        body = json.dumps(profiles, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"[RegistrySnapshot] バックグラウンド更新失敗: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "profile_version": self.profile_version,
+            "agents": len(self.agents),
+            "live_agents": len(self.live_agents),
+            "age_seconds": round(time.monotonic() - self.refreshed_at, 3) if self.is_loaded() else None,
+            **self.stats,
+        }
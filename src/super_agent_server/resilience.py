@@ -0,0 +1,296 @@
+# AIAgent呼び出しの耐障害レイヤ（タイムアウト・サーキットブレーカ・リトライ・ヘッジ）
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+
+from balancer import LoadBalancer, live_endpoints
+from coalescer import BatchRequestError, CallCoalescer, RemoteCallError
+from http_pool import HttpClientPool
+
+
+class AgentCallError(Exception):
+    """
+    リトライ・ブレーカの失敗として数える呼び出しエラー（接続失敗・タイムアウト・5xx）。
+    """
+    pass
+
+
+class CircuitOpenError(AgentCallError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    連続 failure_threshold 回失敗すると open になり、reset_timeout 秒は呼び出しを即座に失敗させる。
+    経過後は half_open として1件だけ試行を通し、成功すれば closed、失敗すれば再び open に戻る。
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._trial_in_flight = False
+
+    def available(self) -> bool:
+        """
+        状態を変えずに、今呼び出しを通せるかを返す（呼び出し先の選択用）。
+        """
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._trial_in_flight
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_count += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        結果を判定せずに試行を終えた場合（ヘッジで取り消された等）に half_open の試行枠を戻す。
+        """
+        self._trial_in_flight = False
+
+    def describe(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened_count}
+
+
+class LatencyWindow:
+    """
+    直近 size 件の成功時レイテンシを保持し、パーセンタイルを返す。
+    """
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+
+    def add(self, elapsed: float):
+        self._samples.append(elapsed)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random) -> float:
+    """
+    指数バックオフ（full jitter）。attempt は0始まりのリトライ回数。
+    """
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AgentCaller:
+    """
+    AIAgentの /run 呼び出しを1か所に集約し、以下を適用する。
+      - エージェント・タスクごとのタイムアウト（HttpClientPool.timeout_for）
+      - インスタンス（endpoint）ごとのサーキットブレーカ。open のインスタンスは振り分け対象から外す
+      - idempotent なタスクのみ、ジッタ付き指数バックオフで最大 retries 回リトライ（別インスタンスを優先）
+      - hedge=True の場合、idempotent なタスクが p95 を超えても終わらなければ別のレプリカにも送る
+    """
+    def __init__(
+        self,
+        http: HttpClientPool,
+        balancer: LoadBalancer,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        retries: int = 2,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+        latency_window: int = 200,
+        coalescer: Optional[CallCoalescer] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.http = http
+        self.coalescer = coalescer
+        self.balancer = balancer
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.latency_window = latency_window
+        self._rng = rng or random.Random()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "short_circuited": 0,
+                      "hedges": 0, "hedge_wins": 0}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def _latency(self, key: str) -> LatencyWindow:
+        window = self.latencies.get(key)
+        if window is None:
+            window = self.latencies[key] = LatencyWindow(self.latency_window)
+        return window
+
+    def _choose(self, agent_info: dict, exclude=()) -> str:
+        # ブレーカが open のインスタンスは、他に候補がある限り選ばない
+        tripped = [e for e in live_endpoints(agent_info) if not self.breaker(e).available()]
+        return self.balancer.choose(agent_info, exclude=set(exclude) | set(tripped))
+
+    async def _attempt(self, endpoint: str, agent_info: dict, task_def: dict, parameters: dict) -> Any:
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError(f"Circuit open for {endpoint}")
+        started = time.monotonic()
+        try:
+            timeout = self.http.timeout_for(agent_info, task_def)
+            async with self.balancer.track(endpoint):
+                if self.coalescer is not None:
+                    # 同じインスタンスへの同時呼び出しは /run/batch にまとめて送る
+                    result = await self.coalescer.submit(endpoint, task_def["type"], parameters, timeout)
+                else:
+                    resp = await self.http.post(
+                        f"{endpoint}/run",
+                        json={"type": task_def["type"], "parameters": parameters},
+                        timeout=timeout,
+                    )
+                    if resp.status_code >= 500:
+                        raise AgentCallError(f"{endpoint} returned HTTP {resp.status_code}")
+                    result = resp.json()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except AgentCallError:
+            breaker.record_failure()
+            raise
+        except RemoteCallError:
+            # タスク自体の失敗。インスタンスは応答しているのでブレーカの失敗には数えない
+            breaker.record_success()
+            raise
+        except BatchRequestError as e:
+            # 同じバッチの呼び出し元には同じ例外が届くので、ブレーカには1回だけ数える
+            if e.claim():
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise AgentCallError(str(e)) from e
+        except (httpx.HTTPError, ValueError) as e:
+            breaker.record_failure()
+            raise AgentCallError(f"{type(e).__name__}: {e}") from e
+        except Exception:
+            # 想定外の例外でも half_open の試行枠を握ったままにしない（インスタンスの失敗とは数えない）
+            breaker.release()
+            raise
+        breaker.record_success()
+        self._latency(f"{agent_info.get('name')}.{task_def['type']}").add(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, agent_info: dict, task_def: dict, parameters: dict, endpoint: str) -> Any:
+        """
+        1本目が p95 までに終わらなければ、別のレプリカに2本目を送り、先に成功した方を返す。
+        """
+        window = self._latency(f"{agent_info.get('name')}.{task_def['type']}")
+        primary = asyncio.ensure_future(self._attempt(endpoint, agent_info, task_def, parameters))
+        pending = {primary}
+        try:
+            others = [e for e in live_endpoints(agent_info) if e != endpoint]
+            if len(window) < self.hedge_min_samples or not others:
+                return await primary
+            done, _ = await asyncio.wait(pending, timeout=window.percentile(0.95))
+            if done:
+                return primary.result()
+            second = self._choose(agent_info, exclude=[endpoint])
+            if second == endpoint or not self.breaker(second).available():
+                return await primary
+            self.stats["hedges"] += 1
+            hedge = asyncio.ensure_future(self._attempt(second, agent_info, task_def, parameters))
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 負けた方（または呼び出し元の取り消し時は両方）を取り消す
+            for task in pending:
+                task.cancel()
+
+    async def call(self, agent_info: dict, task_def: dict, parameters: dict) -> Dict[str, Any]:
+        """
+        タスクを実行し、{"result": ...} または {"error": ...} を返す。
+        """
+        self.stats["calls"] += 1
+        idempotent = bool(task_def.get("idempotent"))
+        attempts = 1 + (self.retries if idempotent else 0)
+        tried = []
+        error: Optional[Exception] = None
+        for attempt in range(attempts):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt - 1, self.backoff_base, self.backoff_max, self._rng))
+            endpoint = self._choose(agent_info, exclude=tried)
+            tried.append(endpoint)
+            try:
+                if self.hedge and idempotent:
+                    return {"result": await self._hedged(agent_info, task_def, parameters, endpoint)}
+                return {"result": await self._attempt(endpoint, agent_info, task_def, parameters)}
+            except RemoteCallError as e:
+                # エージェントがタスクの失敗を返した場合はリトライしない
+                error = e
+                break
+            except AgentCallError as e:
+                logging.warning(f"[AgentCaller] {agent_info.get('name')}.{task_def['type']} 失敗 "
+                                f"({attempt + 1}/{attempts}): {e}")
+                error = e
+                if isinstance(e, CircuitOpenError) and len(tried) >= len(live_endpoints(agent_info)):
+                    # 全インスタンスのブレーカが open なら待たずに失敗させる
+                    break
+        self.stats["failures"] += 1
+        return {"error": f"Failed to execute agent task: {error}"}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "retries_max": self.retries,
+            "hedge": self.hedge,
+            **self.stats,
+            "coalescer": self.coalescer.describe() if self.coalescer is not None else None,
+            "breakers": {endpoint: b.describe() for endpoint, b in self.breakers.items()},
+            "latency_p95_ms": {
+                key: round(w.percentile(0.95) * 1000, 3) for key, w in self.latencies.items() if len(w)
+            },
+        }
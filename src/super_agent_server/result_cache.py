@@ -0,0 +1,87 @@
+# idempotent なタスクの実行結果を (エージェント, タスク, 正規化したパラメータ) 単位で使い回すキャッシュ
+import asyncio
+import copy
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from cache import LRUCache
+
+
+def canonical_parameters(parameters: Dict[str, Any]) -> str:
+    """
+    キーの順序や空白の違いに依存しない、パラメータの比較用文字列を返す。
+    値が None のパラメータは省略と同じ扱いにする。
+    """
+    cleaned = {k: v for k, v in (parameters or {}).items() if v is not None}
+    return json.dumps(cleaned, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class ResultCache:
+    """
+    タスク定義の cache_ttl（秒）が正で idempotent なタスクだけを対象に、成功した結果を保持する。
+    同じキーの呼び出しが実行中なら新たに呼び出さず、その結果を待つ（single-flight）。
+    TTL は max_ttl で頭打ちにし、件数は max_size で LRU 方式に制限する。
+    """
+    def __init__(self, max_size: int = 1024, max_ttl: float = 60.0):
+        self.max_ttl = max_ttl
+        self._cache = LRUCache(max_size=max_size, ttl=max_ttl)
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"bypassed": 0, "joined": 0, "stored": 0, "not_stored": 0}
+
+    def ttl_of(self, task_def: Dict[str, Any]) -> float:
+        if not task_def or task_def.get("idempotent") is not True or self._cache.max_size <= 0:
+            return 0.0
+        ttl = task_def.get("cache_ttl")
+        if not isinstance(ttl, (int, float)) or isinstance(ttl, bool) or ttl <= 0:
+            return 0.0
+        return min(float(ttl), self.max_ttl)
+
+    async def get_or_call(self, agent_name: str, task_def: Dict[str, Any], parameters: Dict[str, Any],
+                          call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        キャッシュにあればその結果を、無ければ call() を実行して {"result": ...} / {"error": ...} を返す。
+        エラー（結果の本文が {"error": ...} の場合を含む）はキャッシュしない。
+        """
+        ttl = self.ttl_of(task_def)
+        if ttl <= 0:
+            self.stats["bypassed"] += 1
+            return await call()
+        key = (agent_name, task_def.get("type"), canonical_parameters(parameters))
+        outcome = self._cache.get(key)
+        if outcome is not None:
+            # 呼び出し側で結果を書き換えてもキャッシュが汚れないよう複製して返す
+            return copy.deepcopy(outcome)
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.stats["joined"] += 1
+        else:
+            shared = self._in_flight[key] = asyncio.ensure_future(call())
+            shared.add_done_callback(lambda f: self._finished(key, f, ttl))
+        # 待っている1人が取り消されても、他の待ち手のために呼び出し自体は続ける
+        return copy.deepcopy(await asyncio.shield(shared))
+
+    def _finished(self, key: Hashable, future: asyncio.Future, ttl: float):
+        self._in_flight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        outcome = future.result()
+        # エージェントが HTTP 200 で {"error": ...} を返した場合も失敗として扱い、保持しない
+        if (isinstance(outcome, dict) and "result" in outcome and "error" not in outcome
+                and not (isinstance(outcome["result"], dict) and "error" in outcome["result"])):
+            self._cache.set(key, outcome, ttl)
+            self.stats["stored"] += 1
+        else:
+            self.stats["not_stored"] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        described = self._cache.describe()
+        lookups = described["hits"] + described["misses"]
+        # 実行中の呼び出しに合流した分もエージェントを呼ばずに済んだものとして数える
+        saved = described["hits"] + self.stats["joined"]
+        return {
+            "max_ttl": self.max_ttl,
+            "in_flight": len(self._in_flight),
+            **self.stats,
+            **described,
+            "effective_hit_rate": round(saved / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,493 @@
+# SuperAgentServer・AgentRegistryService・各AIAgent を通した負荷試験（Gemini はスタブ、外部ネットワーク不要）
+# 使い方: python bench_pipeline.py [--scenarios request,command,suggest,registry] [--concurrency 1,8,32]
+#                                  [--requests 200] [--llm-latency-ms 200] [--output result.json] [--baseline old.json]
+# 各サービスを 127.0.0.1 の空きポートで別プロセスとして起動し、終了時に停止する。
+# --super-url / --registry-url を指定した場合は起動せず、稼働中の環境を計測する（この場合 Gemini は本物）。
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "..", "src"))
+TRACE_HEADER = "X-Request-ID"
+
+# FastRouter で振り分けられる要求・2回目以降は計画キャッシュに当たる要求・毎回LLMで計画する要求（{n} は通し番号）
+FAST_INPUTS = ["cpu", "メモリ使用量", "disk", "show me memory usage", "ディスク容量"]
+CACHED_INPUTS = ["サーバのcpuとmemoryを調べて", "cpuとdiskの状況をまとめて"]
+LLM_INPUT = "ホスト{n}のcpuとmemoryを調べて"
+SUGGEST_INPUT = "ファイル{k}の先頭{c}行を表示"
+
+
+def serve(service: str, port: int, latency: float, jitter: float, seed: int):
+    """
+    --serve で子プロセスとして呼ばれる。Gemini をスタブに差し替えてからサービスの app を起動する。
+    """
+    directory = os.path.join(SRC_DIR, service)
+    sys.path[:0] = [directory, os.path.join(SRC_DIR, "common")]
+    import stub_gemini
+    stub_gemini.install(latency=latency, jitter=jitter, seed=seed)
+    os.chdir(directory)
+    import uvicorn
+    from app import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalStack:
+    """
+    レジストリ → 2つのAIAgent → SuperAgentServer の順に起動し、エージェントがレジストリに載って
+    SuperAgentServer から見えるまで待つ。ログは作業ディレクトリの <service>.log に出す。
+    呼び出し元の環境変数（PLAN_CONCURRENCY 等）は各サービスにそのまま引き継ぐ。
+    """
+    def __init__(self, llm_latency: float, llm_jitter: float, seed: int, trace_history: int, keep: bool = False):
+        self.llm_args = ["--llm-latency-ms", str(llm_latency * 1000), "--llm-jitter-ms", str(llm_jitter * 1000),
+                         "--seed", str(seed)]
+        self.trace_history = trace_history
+        self.keep = keep
+        self.workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+        self.procs: Dict[str, subprocess.Popen] = {}
+        self.urls: Dict[str, str] = {}
+
+    def _launch(self, service: str, port: int, env: Dict[str, str]) -> str:
+        url = f"http://127.0.0.1:{port}"
+        full_env = {**os.environ, "GEMINI_API_KEY": "stub", "PYTHONUNBUFFERED": "1",
+                    "NO_PROXY": ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"]))}
+        full_env.setdefault("TRACE_HISTORY", str(self.trace_history))
+        # 遅いリクエストのログ出力で計測を乱さない
+        full_env.setdefault("SLOW_REQUEST_MS", "0")
+        full_env.update(env)
+        log = open(os.path.join(self.workdir, f"{service}.log"), "w")
+        self.procs[service] = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", service, "--port", str(port), *self.llm_args],
+            env=full_env, stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        self.urls[service] = url
+        return url
+
+    def _wait(self, service: str, path: str, ready: Callable[[httpx.Response], bool] = lambda r: True,
+              timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.procs[service].poll() is not None:
+                break
+            try:
+                resp = httpx.get(self.urls[service] + path, timeout=2, trust_env=False)
+                if resp.status_code == 200 and ready(resp):
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        with open(os.path.join(self.workdir, f"{service}.log")) as f:
+            tail = f.read()[-2000:]
+        raise RuntimeError(f"{service} did not become ready (log: {self.workdir}/{service}.log)\n{tail}")
+
+    def start(self):
+        registry = self._launch("agent_registry_service", free_port(),
+                                {"REGISTRY_DIR": os.path.join(self.workdir, "registry")})
+        self._wait("agent_registry_service", "/agents")
+        for service in ("linux_metrics_ai_agent", "linux_command_ai_agent"):
+            port = free_port()
+            self._launch(service, port, {
+                "AGENT_REGISTRY_URL": f"{registry}/agents",
+                "AGENT_ENDPOINT": f"http://127.0.0.1:{port}",
+                "ARTIFACT_ID": f"bench.local/{service}",
+                "SUGGEST_CACHE_PATH": os.path.join(self.workdir, "suggestions.db"),
+            })
+        for service in ("linux_metrics_ai_agent", "linux_command_ai_agent"):
+            self._wait(service, "/tasks")
+        self._wait("agent_registry_service", "/agents", lambda r: len(r.json()) >= 2)
+        self._launch("super_agent_server", free_port(),
+                     {"AGENT_REGISTRY_URL": registry, "REGISTRY_REFRESH_INTERVAL": "1"})
+        self._wait("super_agent_server", "/")
+
+    def stop(self):
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self.keep:
+            print(f"logs: {self.workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Targets:
+    """
+    計測対象のURL。agents はレジストリの一覧から引いた エージェント名 -> endpoint。
+    """
+    def __init__(self, super_url: str, registry_url: str, agents: Dict[str, str]):
+        self.super_url = super_url.rstrip("/")
+        self.registry_url = registry_url.rstrip("/")
+        self.agents = agents
+
+    @property
+    def services(self) -> List[str]:
+        return [self.super_url, self.registry_url, *self.agents.values()]
+
+
+async def discover(client: httpx.AsyncClient, super_url: str, registry_url: str) -> Targets:
+    resp = await client.get(f"{registry_url.rstrip('/')}/agents")
+    resp.raise_for_status()
+    agents = {a["name"]: a["endpoint"].rstrip("/") for a in resp.json()
+              if a.get("name") and a.get("endpoint") and a.get("status", "active") == "active"}
+    return Targets(super_url, registry_url, agents)
+
+
+# (method, url, httpx のキーワード引数)
+Call = Tuple[str, str, Dict[str, Any]]
+
+# レジストリ計測用のダミーエージェント（到達しない endpoint。どの要求とも照合されない種別名）
+BENCH_AGENT = {
+    "artifactID": "bench.local/bench_pipeline_agent",
+    "name": "BenchPipelineAgent",
+    "description": "負荷試験用のダミーAIAgent",
+    "capabilities": ["bench_noop"],
+    "endpoint": "http://127.0.0.1:9",
+    "tasks": [{"type": "bench_noop", "parameters": {}, "requires_consent": False}],
+}
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def request_calls(targets: Targets, args, rng: random.Random, label: str, count: int) -> List[Call]:
+    mix = parse_mix(args.request_mix)
+    kinds, weights = list(mix), list(mix.values())
+    calls = []
+    for n in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "fast":
+            text = rng.choice(FAST_INPUTS)
+        elif kind == "cached":
+            text = rng.choice(CACHED_INPUTS)
+        else:
+            text = LLM_INPUT.format(n=f"{label}-{n}")
+        calls.append(("POST", f"{targets.super_url}/request", {"json": {"user_input": text}}))
+    return calls
+
+
+def command_calls(targets: Targets, args, rng: random.Random, label: str, count: int) -> List[Call]:
+    # help（レジストリのスナップショット参照）が主で、1割は stats（内部統計の集計）
+    return [("POST", f"{targets.super_url}/command", {"json": {"command": "stats" if n % 10 == 9 else "help"}})
+            for n in range(count)]
+
+
+def suggest_calls(targets: Targets, args, rng: random.Random, label: str, count: int) -> List[Call]:
+    url = targets.agents.get("LinuxCommandAIAgent")
+    if url is None:
+        raise RuntimeError("LinuxCommandAIAgent is not registered")
+    # 指示の種類を suggest_distinct 件に絞り、キャッシュのヒットと同じ指示の集約が起きるようにする（run ごとに別の指示）
+    return [("POST", f"{url}/run", {"json": {"type": "suggest_command", "parameters": {
+        "user_instruction": SUGGEST_INPUT.format(k=rng.randrange(args.suggest_distinct), c=label)}}})
+            for _ in range(count)]
+
+
+def registry_calls(targets: Targets, args, rng: random.Random, label: str, count: int) -> List[Call]:
+    base = targets.registry_url
+    agent_url = f"{base}/agents/{BENCH_AGENT['artifactID']}"
+    choices = [
+        (0.4, lambda: ("GET", f"{base}/agents", {})),
+        (0.2, lambda: ("GET", f"{base}/agents", {"params": {"capability": "get_cpu_metrics"}})),
+        (0.2, lambda: ("GET", agent_url, {})),
+        (0.15, lambda: ("POST", f"{agent_url}/heartbeat", {"json": {"endpoint": BENCH_AGENT["endpoint"]}})),
+        (0.05, lambda: ("POST", f"{base}/agents", {"json": BENCH_AGENT})),
+    ]
+    weights, builders = zip(*choices)
+    return [rng.choices(builders, weights)[0]() for _ in range(count)]
+
+
+SCENARIOS = {
+    "request": request_calls,
+    "command": command_calls,
+    "suggest": suggest_calls,
+    "registry": registry_calls,
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples_ms)
+    if not samples:
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "p50_ms": round(percentile(samples, 0.5), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def outcome_of(resp: httpx.Response) -> Tuple[str, bool]:
+    """
+    HTTPステータスと、本文の status / error（/request の "ERROR"、/run の {"error": ...}）から結果を分類する。
+    """
+    outcome, ok = str(resp.status_code), resp.status_code < 400
+    try:
+        body = resp.json() if resp.content else None
+    except ValueError:
+        body = None
+    if isinstance(body, dict):
+        if isinstance(body.get("status"), str):
+            outcome += f" {body['status']}"
+            ok = ok and body["status"] != "ERROR"
+        elif "error" in body:
+            outcome += " error"
+            ok = False
+    return outcome, ok
+
+
+async def drive(client: httpx.AsyncClient, calls: List[Call], concurrency: int, label: str) -> Dict[str, Any]:
+    """
+    concurrency 個のワーカーが calls を先頭から順に取り、応答を待ってから次を送る（クローズドループ）。
+    各リクエストには "<label>-<番号>" を X-Request-ID として付ける。
+    """
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    trace_ids: List[str] = []
+    errors = 0
+    position = 0
+
+    async def worker():
+        nonlocal errors, position
+        while position < len(calls):
+            n = position
+            position += 1
+            method, url, kwargs = calls[n]
+            trace_id = f"{label}-{n}"
+            started = time.perf_counter()
+            try:
+                resp = await client.request(method, url, headers={TRACE_HEADER: trace_id}, **kwargs)
+                outcome, ok = outcome_of(resp)
+            except httpx.HTTPError as e:
+                outcome, ok = type(e).__name__, False
+            latencies.append((time.perf_counter() - started) * 1000)
+            outcomes[outcome] += 1
+            trace_ids.append(trace_id)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    return {
+        "requests": len(calls),
+        "errors": errors,
+        "outcomes": dict(sorted(outcomes.items())),
+        "duration_s": round(duration, 3),
+        "rps": round(len(calls) / duration, 2) if duration > 0 else None,
+        "latency": summarize(latencies),
+        "trace_ids": trace_ids,
+    }
+
+
+async def collect_stages(client: httpx.AsyncClient, targets: Targets, trace_ids: List[str]) -> Dict[str, Any]:
+    """
+    各サービスの /traces/{id} からスパンを集め、"<service>:<stage>" ごとに所要時間を集計する。
+    サービス側の保持件数（TRACE_HISTORY）を超えて古くなったトレースは数に入らない。
+    """
+    durations: Dict[str, List[float]] = {}
+    semaphore = asyncio.Semaphore(16)
+
+    async def fetch(url: str, trace_id: str):
+        async with semaphore:
+            try:
+                resp = await client.get(f"{url}/traces/{trace_id}")
+            except httpx.HTTPError:
+                return
+        if resp.status_code != 200:
+            return
+        for span in resp.json().get("spans", []):
+            durations.setdefault(f"{span['service']}:{span['stage']}", []).append(span["duration_ms"])
+
+    await asyncio.gather(*(fetch(url, t) for url in targets.services for t in trace_ids))
+    return {key: {"count": len(values), **summarize(values)} for key, values in sorted(durations.items())}
+
+
+async def route_counts(client: httpx.AsyncClient, targets: Targets) -> Dict[str, int]:
+    resp = await client.post(f"{targets.super_url}/command", json={"command": "stats"})
+    routing = (resp.json().get("result") or {}).get("routing") or {}
+    return {k: routing.get(k, 0) for k in ("fast_path", "plan_cache", "llm")}
+
+
+async def run_scenario(client: httpx.AsyncClient, targets: Targets, args, scenario: str,
+                       concurrency: int) -> Dict[str, Any]:
+    label = f"{scenario}-c{concurrency}"
+    rng = random.Random(f"{args.seed}-{label}")
+    build = SCENARIOS[scenario]
+    if args.warmup:
+        await drive(client, build(targets, args, rng, f"{label}-warmup", args.warmup), concurrency, f"{label}-warmup")
+    calls = build(targets, args, rng, label, args.requests)
+    before = await route_counts(client, targets) if scenario == "request" else None
+    result = await drive(client, calls, concurrency, label)
+    trace_ids = result.pop("trace_ids")
+    step = max(1, len(trace_ids) // args.trace_sample) if args.trace_sample > 0 else 0
+    stages = await collect_stages(client, targets, trace_ids[::step]) if step else {}
+    run = {"scenario": scenario, "concurrency": concurrency, **result, "stages": stages}
+    if before is not None:
+        after = await route_counts(client, targets)
+        run["routes"] = {k: after[k] - before[k] for k in after}
+    return run
+
+
+async def bench(args, super_url: str, registry_url: str) -> List[Dict[str, Any]]:
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(concurrencies) * 2, max_keepalive_connections=max(concurrencies) * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout, trust_env=False) as client:
+        targets = await discover(client, super_url, registry_url)
+        runs = []
+        for scenario in args.scenarios.split(","):
+            if scenario == "registry":
+                (await client.post(f"{targets.registry_url}/agents", json=BENCH_AGENT)).raise_for_status()
+            try:
+                for concurrency in concurrencies:
+                    runs.append(await run_scenario(client, targets, args, scenario, concurrency))
+                    if not args.json:
+                        print_run(runs[-1])
+            finally:
+                if scenario == "registry":
+                    await client.delete(f"{targets.registry_url}/agents/{BENCH_AGENT['artifactID']}")
+        return runs
+
+
+def print_run(run: Dict[str, Any]):
+    latency = run["latency"]
+    print(f"{run['scenario']:9} c={run['concurrency']:<4} reqs={run['requests']:<6} errors={run['errors']:<5} "
+          f"rps={run['rps']:<9} p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms p99={latency['p99_ms']}ms")
+    if run.get("routes"):
+        print(f"    routes: {run['routes']}")
+    if run["errors"]:
+        print(f"    outcomes: {run['outcomes']}")
+    width = max((len(stage) for stage in run["stages"]), default=0)
+    for stage, s in run["stages"].items():
+        print(f"    {stage:{width}} n={s['count']:<5} p50={s['p50_ms']:<9} p95={s['p95_ms']:<9} p99={s['p99_ms']}")
+
+
+def compare(runs: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    同じシナリオ・同時実行数の結果を比べ、RPS が tolerance 以上下がったか p95/p99 が tolerance 以上延びたものを返す。
+    """
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("runs", [])}
+    regressions = []
+    for run in runs:
+        old = previous.get((run["scenario"], run["concurrency"]))
+        if old is None:
+            continue
+        name = f"{run['scenario']} c={run['concurrency']}"
+        if old.get("rps") and run["rps"] is not None and run["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {old['rps']} -> {run['rps']}")
+        for key in ("p95_ms", "p99_ms"):
+            before, after = old["latency"].get(key), run["latency"].get(key)
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before} -> {after}")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="request,command,suggest,registry")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="シナリオ・同時実行数ごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=10, help="計測前に送るリクエスト数（集計しない）")
+    parser.add_argument("--request-mix", default="fast=0.5,cached=0.3,llm=0.2",
+                        help="/request の要求の内訳（FastRouter / 計画キャッシュ / 毎回LLM）")
+    parser.add_argument("--suggest-distinct", type=int, default=50, help="suggest シナリオの指示の種類数")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-jitter-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-sample", type=int, default=200, help="段階別の集計に使うリクエスト数（0で集計しない）")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--super-url", help="稼働中の SuperAgentServer を計測する（--registry-url と併用）")
+    parser.add_argument("--registry-url")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--baseline", help="比較する過去の --output。悪化があれば終了コード1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなす変化率")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    parser.add_argument("--keep", action="store_true", help="起動したサービスのログを残す")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port, args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000, args.seed)
+        return
+    if bool(args.super_url) != bool(args.registry_url):
+        parser.error("--super-url and --registry-url must be given together")
+
+    stack = None
+    if args.super_url:
+        super_url, registry_url = args.super_url, args.registry_url
+    else:
+        stack = LocalStack(args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000, args.seed,
+                           trace_history=max(1000, args.requests + args.warmup), keep=args.keep)
+        stack.start()
+        super_url, registry_url = stack.urls["super_agent_server"], stack.urls["agent_registry_service"]
+    try:
+        runs = asyncio.run(bench(args, super_url, registry_url))
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "mode": "attached" if args.super_url else "local",
+            "config": {k: v for k, v in vars(args).items() if k not in ("serve", "port", "output", "baseline", "json")},
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(runs, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
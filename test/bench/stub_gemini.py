@@ -0,0 +1,159 @@
+# ベンチマーク用の Gemini スタブ（ネットワークに出ず、同じプロンプトには常に同じ応答を、指定した遅延で返す）
+import asyncio
+import json
+import random
+import shlex
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# タスク種別のうち、要求との照合に使わない語
+_IGNORED_WORDS = {"get", "list", "metrics", "info", "status"}
+
+
+def _line_after(prompt: str, marker: str) -> Optional[str]:
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith(marker):
+            return line[len(marker):].strip()
+    return None
+
+
+def _profiles(prompt: str) -> Dict[str, Any]:
+    # 計画生成プロンプトではエージェント一覧が1行のJSONとして埋め込まれている
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+    return {}
+
+
+def plan_for(user_input: str, profiles: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    種別名の語（"get_cpu_metrics" なら "cpu"）が要求に含まれるタスクを選ぶ。
+    1件なら単一ステップ、複数なら並列の steps、無ければ agent=null の計画を返す。
+    必須パラメータには要求文をそのまま入れる。
+    """
+    text = user_input.lower()
+    steps = []
+    for name in sorted(profiles):
+        for task in profiles[name].get("tasks") or []:
+            words = [w for w in str(task.get("type") or "").split("_") if w and w not in _IGNORED_WORDS]
+            if words and all(w in text for w in words):
+                parameters = {k: user_input for k, spec in (task.get("parameters") or {}).items()
+                              if "(optional)" not in str(spec)}
+                steps.append({"agent": name, "task": task["type"], "parameters": parameters})
+    if not steps:
+        return {"agent": None, "task": None, "parameters": {}, "reason": "適切なAIAgentが見つかりませんでした"}
+    if len(steps) == 1:
+        return steps[0]
+    return {"steps": [{"id": f"s{i}", **step, "depends_on": []} for i, step in enumerate(steps, 1)]}
+
+
+def command_for(instruction: str) -> str:
+    return f"echo {shlex.quote(instruction.strip())}"
+
+
+def respond(prompt: str) -> str:
+    """
+    SuperAgentServer の計画生成・LinuxCommandAIAgent のコマンド提案（単発/まとめ送信）のプロンプトに応答する。
+    """
+    user_input = _line_after(prompt, "ユーザ要求:")
+    if user_input is not None:
+        return json.dumps(plan_for(user_input, _profiles(prompt)), ensure_ascii=False)
+    batch = _line_after(prompt, "入力:")
+    if batch is not None:
+        items = json.loads(batch)
+        return json.dumps([{**item, "command": command_for(item["instruction"])} for item in items],
+                          ensure_ascii=False)
+    instruction = _line_after(prompt, "ユーザの指示:")
+    return command_for(instruction if instruction is not None else prompt)
+
+
+class StubBackend:
+    """
+    応答までの遅延は latency ± jitter 秒（seed で固定した乱数列）。呼び出し数と同時実行数の最大を記録する。
+    """
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def _delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _enter(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def _exit(self):
+        with self._lock:
+            self.stats["in_flight"] -= 1
+
+    @staticmethod
+    def _response(prompt: str):
+        return SimpleNamespace(text=respond(prompt),
+                               usage_metadata=SimpleNamespace(prompt_token_count=len(prompt) // 4))
+
+    def generate(self, prompt: str):
+        self._enter()
+        try:
+            time.sleep(self._delay())
+            return self._response(prompt)
+        finally:
+            self._exit()
+
+    async def generate_async(self, prompt: str):
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay())
+            return self._response(prompt)
+        finally:
+            self._exit()
+
+
+class _StubChat:
+    def __init__(self, backend: StubBackend):
+        self._backend = backend
+        self.history: List[Any] = []
+
+    def send_message(self, prompt: str):
+        return self._backend.generate(prompt)
+
+    async def send_message_async(self, prompt: str):
+        return await self._backend.generate_async(prompt)
+
+
+def install(latency: float = 0.2, jitter: float = 0.0, seed: int = 0) -> StubBackend:
+    """
+    google.generativeai の configure / GenerativeModel をスタブに差し替える。アプリを import する前に呼ぶ。
+    """
+    import google.generativeai as genai
+
+    backend = StubBackend(latency, jitter, seed)
+
+    class StubGenerativeModel:
+        def __init__(self, model_name: str = "stub", **kwargs):
+            self.model_name = model_name
+
+        def start_chat(self, history=None, **kwargs):
+            return _StubChat(backend)
+
+        def generate_content(self, prompt, **kwargs):
+            return backend.generate(prompt)
+
+        async def generate_content_async(self, prompt, **kwargs):
+            return await backend.generate_async(prompt)
+
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = StubGenerativeModel
+    return backend
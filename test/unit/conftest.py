@@ -0,0 +1,65 @@
+# 各サービスのモジュール（app.py 等）を使うテスト用のフィクスチャ
+import importlib.util
+import os
+import sys
+import time
+
+import pytest
+
+SUPER_DIR = os.path.join(os.path.dirname(__file__), "../../src/super_agent_server")
+REGISTRY_DIR = os.path.join(os.path.dirname(__file__), "../../src/agent_registry_service")
+COMMAND_DIR = os.path.join(os.path.dirname(__file__), "../../src/linux_command_ai_agent")
+
+
+def load_app(name, directory, filename="app.py"):
+    """
+    app.py（等）を name という名前で1度だけ読み込む（各サービスの app.py・ai_agent.py は同じモジュール名のため）。
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        sys.path.insert(0, directory)
+        spec = importlib.util.spec_from_file_location(name, os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def super_app():
+    return load_app("super_agent_app", SUPER_DIR)
+
+
+@pytest.fixture(scope="session")
+def registry_app(tmp_path_factory):
+    """
+    一時ディレクトリを永続化先にした AgentRegistryService の app モジュール（テスト間で状態を共有する）。
+    """
+    previous = os.environ.get("REGISTRY_DIR")
+    os.environ["REGISTRY_DIR"] = str(tmp_path_factory.mktemp("registry"))
+    try:
+        return load_app("agent_registry_app", REGISTRY_DIR)
+    finally:
+        if previous is None:
+            del os.environ["REGISTRY_DIR"]
+        else:
+            os.environ["REGISTRY_DIR"] = previous
+
+
+@pytest.fixture
+def make_server(super_app):
+    """
+    レジストリに問い合わせず agents をスナップショットとして持つ SuperAgentServer を作る関数を返す。
+    asyncio のプリミティブはイベントループに結び付くため、テストごとに新しく作る。
+    """
+    def factory(agents):
+        server = super_app.SuperAgentServer()
+        server.registry._apply(agents, "v1")
+        server.registry.refreshed_at = time.monotonic()
+        return server
+    return factory
+
+
+@pytest.fixture(scope="session")
+def command_agent():
+    return load_app("linux_command_ai_agent", COMMAND_DIR, "ai_agent.py")
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from agent_index import AgentIndex, tokenize
+
+AGENTS = [
+    {"name": "LinuxCommandAIAgent", "description": "Linuxサーバ上でコマンド提案や実行を行う",
+     "capabilities": ["suggest_command", "run_command"], "tasks": [{"type": "run_command"}]},
+    {"name": "LinuxMetricsAIAgent", "description": "LinuxサーバのCPU・メモリ・ディスクなどのメトリクスを取得",
+     "capabilities": ["get_cpu_metrics"], "tasks": [{"type": "get_cpu_metrics"}]},
+    {"name": "TranslateAgent", "description": "文章を翻訳する", "capabilities": ["translate"], "tasks": []},
+]
+
+
+def test_tokenize_splits_snake_case_and_japanese_bigrams():
+    assert tokenize("get_cpu_metrics") == ["get", "cpu", "metrics"]
+    assert tokenize("メモリ") == ["メモ", "モリ"]
+
+
+def test_top_k_ranks_relevant_agent_first():
+    index = AgentIndex()
+    index.ensure(AGENTS, "v1")
+    assert [a["name"] for a in index.top_k("CPUメトリクスを教えて", 2)][0] == "LinuxMetricsAIAgent"
+    assert len(index.top_k("CPU", 2)) == 2
+    # 同じバージョンでは再構築しない
+    index.ensure(AGENTS, "v1")
+    assert index.builds == 1
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/common"))
+
+from ai_agent_base import AIAgentBase, TaskTimeout, task_handler
+
+
+class SampleAgent(AIAgentBase):
+    def __init__(self):
+        super().__init__(name="SampleAgent", description="test", capabilities=[], endpoint="http://x")
+        self.active = 0
+        self.peak = 0
+
+    @task_handler("thread_name")
+    def thread_name(self, params):
+        return threading.current_thread().name
+
+    @task_handler("inline", blocking=False)
+    def inline(self, params):
+        return threading.current_thread().name
+
+    @task_handler("limited")
+    async def limited(self, params):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return params["n"]
+
+    @task_handler("slow")
+    def slow(self, params):
+        time.sleep(0.2)
+
+    def get_tasks(self):
+        return [
+            {"type": "thread_name", "parameters": {}},
+            {"type": "inline", "parameters": {}},
+            {"type": "limited", "parameters": {}, "max_concurrency": 2},
+            {"type": "slow", "parameters": {}, "timeout": 0.05},
+        ]
+
+
+def test_dispatch_offloads_sync_handlers():
+    agent = SampleAgent()
+    assert asyncio.run(agent.run("thread_name", {})).startswith("SampleAgent-task")
+    assert asyncio.run(agent.run("inline", {})) == threading.current_thread().name
+    assert asyncio.run(agent.run("unknown", {})) == {"error": "Unknown task type"}
+    agent.shutdown()
+
+
+def test_concurrency_limit_and_timeout():
+    agent = SampleAgent()
+
+    async def scenario():
+        results = await asyncio.gather(*(agent.run("limited", {"n": i}) for i in range(6)))
+        assert results == list(range(6))
+        with pytest.raises(TaskTimeout):
+            await agent.run("slow", {})
+
+    asyncio.run(scenario())
+    assert agent.peak == 2
+    assert agent.task_stats["slow"]["timeouts"] == 1
+    agent.shutdown()
+
+
+def test_run_batch_keeps_order_and_isolates_errors():
+    agent = SampleAgent()
+    results = asyncio.run(agent.run_batch([{"type": "limited", "parameters": {"n": 1}}, {"type": "slow"}, "bad"]))
+    assert results[0] == {"result": 1}
+    assert "TaskTimeout" in results[1]["error"]
+    assert results[2] == {"error": "type is required"}
+    agent.shutdown()
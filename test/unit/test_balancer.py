@@ -0,0 +1,49 @@
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from balancer import LoadBalancer, live_endpoints
+
+
+AGENT = {
+    "name": "LinuxMetricsAIAgent",
+    "endpoint": "http://a:5004",
+    "instances": [
+        {"endpoint": "http://a:5004", "status": "active"},
+        {"endpoint": "http://b:5004", "status": "active"},
+        {"endpoint": "http://c:5004", "status": "expired"},
+    ],
+}
+
+
+def test_live_endpoints_skips_expired_and_supports_legacy():
+    assert live_endpoints(AGENT) == ["http://a:5004", "http://b:5004"]
+    assert live_endpoints({"endpoint": "http://x:1"}) == ["http://x:1"]
+
+
+def test_prefers_lower_latency_and_untried_endpoints():
+    lb = LoadBalancer(policy="p2c", rng=random.Random(0))
+    lb.observe("http://a:5004", 0.5)
+    # 計測値の無いbが優先される
+    assert lb.choose(AGENT) == "http://b:5004"
+    lb.observe("http://b:5004", 0.01)
+    assert all(lb.choose(AGENT) == "http://b:5004" for _ in range(20))
+    assert lb.choose(AGENT, exclude=["http://b:5004"]) == "http://a:5004"
+
+
+def test_least_outstanding_tracks_in_flight():
+    lb = LoadBalancer(policy="least_outstanding")
+    lb.observe("http://a:5004", 0.01)
+    lb.observe("http://b:5004", 0.02)
+
+    async def scenario():
+        async with lb.track("http://a:5004"):
+            assert lb.choose(AGENT) == "http://b:5004"
+        assert lb.choose(AGENT) == "http://a:5004"
+
+    asyncio.run(scenario())
+    stats = lb.describe()["endpoints"]["http://a:5004"]
+    assert stats["requests"] == 2 and stats["in_flight"] == 0
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from coalescer import BatchRequestError, CallCoalescer, RemoteCallError
+
+
+class FakeHttp:
+    def __init__(self, batch_status=200):
+        self.batch_status = batch_status
+        self.requests = []
+
+    async def post(self, url, json=None, timeout=None):
+        self.requests.append((url, [t["type"] for t in json["tasks"]] if "tasks" in json else json["type"]))
+        if url.endswith("/run/batch"):
+            if self.batch_status != 200:
+                return httpx.Response(self.batch_status)
+            results = [{"error": "boom"} if t["parameters"].get("fail") else {"result": t["parameters"]["n"]}
+                       for t in json["tasks"]]
+            return httpx.Response(200, json={"results": results})
+        return httpx.Response(200, json=json["parameters"]["n"])
+
+
+async def submit_many(coalescer, types, fail=()):
+    return await asyncio.gather(
+        *(coalescer.submit("http://a:1", t, {"n": i, "fail": i in fail}) for i, t in enumerate(types)),
+        return_exceptions=True)
+
+
+def test_concurrent_calls_share_one_batch_with_per_item_errors():
+    http = FakeHttp()
+    coalescer = CallCoalescer(http, window=0.01)
+    results = asyncio.run(submit_many(coalescer, ["ok", "ok", "ok"], fail={1}))
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], RemoteCallError)
+    assert http.requests == [("http://a:1/run/batch", ["ok", "ok", "ok"])]
+    assert coalescer.describe()["avg_batch_size"] == 3
+
+
+def test_batches_are_per_task_type():
+    http = FakeHttp()
+    coalescer = CallCoalescer(http, window=0.01)
+    assert asyncio.run(submit_many(coalescer, ["slow", "fast", "slow", "fast"])) == [0, 1, 2, 3]
+    assert sorted(http.requests) == [("http://a:1/run/batch", ["fast", "fast"]),
+                                     ("http://a:1/run/batch", ["slow", "slow"])]
+
+
+def test_batch_failure_is_one_shared_error():
+    http = FakeHttp(batch_status=503)
+    coalescer = CallCoalescer(http, window=0.01)
+    results = asyncio.run(submit_many(coalescer, ["ok", "ok", "ok"]))
+    assert all(isinstance(r, BatchRequestError) for r in results)
+    assert results[0] is results[1] is results[2]
+    assert [results[0].claim(), results[1].claim()] == [True, False]
+
+
+def test_single_call_uses_plain_run():
+    http = FakeHttp()
+    coalescer = CallCoalescer(http, window=0.001)
+    assert asyncio.run(coalescer.submit("http://a:1", "ok", {"n": 7})) == 7
+    assert http.requests == [("http://a:1/run", "ok")]
+
+
+def test_falls_back_to_single_calls_when_batch_is_unsupported():
+    http = FakeHttp(batch_status=404)
+    coalescer = CallCoalescer(http, window=0.01, max_batch=2)
+    assert asyncio.run(submit_many(coalescer, ["ok", "ok"])) == [0, 1]
+    assert [url for url, _ in http.requests] == ["http://a:1/run/batch", "http://a:1/run", "http://a:1/run"]
+    asyncio.run(submit_many(coalescer, ["ok", "ok"]))
+    assert "http://a:1/run/batch" not in [url for url, _ in http.requests[3:]]
+    assert coalescer.describe()["unsupported_endpoints"] == ["http://a:1"]
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/linux_command_ai_agent"))
+
+from command_runner import CommandRunner
+
+PY = sys.executable
+
+
+def test_run_captures_output_and_exit_code():
+    runner = CommandRunner()
+    result = asyncio.run(runner.run(f"{PY} -c 'import sys; print(\"hello\"); sys.exit(3)'"))
+    assert result["exit_code"] == 3
+    assert result["stdout"] == "hello\n"
+    assert result["timed_out"] is False and result["truncated"] == []
+
+
+def test_output_is_capped_and_timeout_kills_process():
+    runner = CommandRunner(output_limit=1000, timeout=0.5)
+    result = asyncio.run(runner.run(f"{PY} -c 'print(\"x\" * 200000)'"))
+    assert len(result["stdout"]) == 1000
+    assert result["truncated"] == ["stdout"]
+    started = time.monotonic()
+    result = asyncio.run(runner.run("sleep 10"))
+    assert result["timed_out"] is True
+    assert time.monotonic() - started < 3
+    assert runner.stats["running"] == 0
+
+
+def test_stream_yields_incremental_events_and_rejects_bad_input():
+    runner = CommandRunner()
+
+    async def collect(command, cwd="/tmp"):
+        return [e async for e in runner.stream(command, cwd)]
+
+    code = "import sys, time; print('a', flush=True); time.sleep(0.05); print('b', file=sys.stderr, flush=True)"
+    events = asyncio.run(collect(f"{PY} -c \"{code}\""))
+    # 書き込みごとにイベントが出るので、種類の並びと連結した内容で確認する
+    kinds = [e["event"] for e in events]
+    assert kinds[-1] == "exit" and kinds.index("stderr") > kinds.index("stdout")
+    assert "".join(e["data"] for e in events if e["event"] == "stdout") == "a\n"
+    assert events[-1]["exit_code"] == 0
+    assert asyncio.run(collect("no_such_command_xyz"))[0]["event"] == "error"
+    assert asyncio.run(collect("ls", "/no/such/dir"))[0]["event"] == "error"
+    assert asyncio.run(collect("echo 'unterminated"))[0]["event"] == "error"
+
+
+def test_process_pool_is_bounded():
+    runner = CommandRunner(max_processes=1)
+
+    async def scenario():
+        started = time.monotonic()
+        await asyncio.gather(runner.run("sleep 0.2"), runner.run("sleep 0.2"))
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.4
+
+
+def test_multibyte_output_survives_chunk_boundaries_and_truncation():
+    code = "import sys; sys.stdout.buffer.write(('a' + '\\u3042' * 3000).encode())"
+    result = asyncio.run(CommandRunner(chunk_size=4096).run(f"{PY} -c \"{code}\""))
+    assert result["stdout"] == "a" + "あ" * 3000
+    # 上限が文字の途中にかかっても置換文字は入らない
+    result = asyncio.run(CommandRunner(output_limit=1001, chunk_size=7).run(f"{PY} -c \"{code}\""))
+    assert result["stdout"] == "a" + "あ" * 333
+    assert result["truncated"] == ["stdout"]
+
+
+def test_rlimits_apply_to_the_command():
+    runner = CommandRunner(cpu_seconds=3, memory_mb=256)
+    code = "import resource; print(resource.getrlimit(resource.RLIMIT_CPU)[0], resource.getrlimit(resource.RLIMIT_AS)[0])"
+    result = asyncio.run(runner.run(f"{PY} -c \"{code}\""))
+    assert result["stdout"].split() == ["3", str(256 * 1024 * 1024)]
+
+
+def test_allowed_programs_cannot_be_bypassed_with_paths(tmp_path):
+    # 許可された名前と同じファイル名の別プログラム
+    fake = tmp_path / "ls"
+    fake.write_text("#!/bin/sh\necho pwned\n")
+    fake.chmod(0o755)
+    runner = CommandRunner(allowed_programs=["ls"])
+    for command in ("./ls", f"{fake}", "../ls"):
+        result = asyncio.run(runner.run(command, str(tmp_path)))
+        assert "not allowed" in result["error"], command
+    assert "not allowed" in asyncio.run(runner.run("cat /etc/hostname"))["error"]
+    result = asyncio.run(runner.run("ls", str(tmp_path)))
+    assert result["exit_code"] == 0 and result["stdout"] == "ls\n"
+
+
+def test_run_command_task_requires_confirmation(command_agent):
+    agent = command_agent.LinuxCommandAIAgent(endpoint="http://command:5000", runner=CommandRunner())
+    assert "confirmation" in asyncio.run(agent.handle_run_command({"command": "echo hi"}))["error"]
+    assert "confirmation" in asyncio.run(agent.handle_run_command({"command": "echo hi", "confirmed": "yes"}))["error"]
+    assert asyncio.run(agent.handle_run_command({"command": "echo hi", "confirmed": True}))["stdout"] == "hi\n"
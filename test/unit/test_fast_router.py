@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from fast_router import FastRouter, task_phrases
+
+METRICS = {
+    "name": "LinuxMetricsAIAgent",
+    "capabilities": ["get_cpu_metrics", "get_memory_metrics", "get_per_core_cpu", "get_metric_history",
+                     "get_top_processes"],
+    "tasks": [
+        {"type": "get_cpu_metrics", "parameters": {}, "keywords": ["CPU"]},
+        {"type": "get_memory_metrics", "parameters": {}, "keywords": ["メモリ", "memory"]},
+        {"type": "get_per_core_cpu", "parameters": {}, "keywords": ["コア別", "CPU per core"]},
+        {"type": "get_metric_history", "parameters": {"metric": "str"}, "keywords": ["履歴"]},
+        {"type": "get_top_processes", "parameters": {"sort_by": "str (optional)", "limit": "int (optional)"},
+         "keywords": ["top", "processes"]},
+    ],
+}
+COMMAND = {
+    "name": "LinuxCommandAIAgent",
+    "capabilities": ["run_command"],
+    "tasks": [{"type": "run_command", "parameters": {"command": "str"}}],
+}
+
+
+def routed_task(router, text):
+    plan = router.route(text)
+    return plan["task"] if plan else None
+
+
+def test_task_phrases_from_type_and_keywords():
+    assert task_phrases({"type": "get_cpu_metrics", "keywords": ["ＣＰＵ 負荷"]}) == ["cpumetrics", "cpu", "cpu負荷"]
+
+
+def test_routes_unambiguous_requests():
+    router = FastRouter()
+    router.ensure([METRICS, COMMAND], "v1")
+    assert router.route("CPU使用率は？") == {"agent": "LinuxMetricsAIAgent", "task": "get_cpu_metrics", "parameters": {}}
+    assert routed_task(router, "メモリ使用量") == "get_memory_metrics"
+    assert routed_task(router, "show me memory usage") == "get_memory_metrics"
+    assert routed_task(router, "cpu per core") == "get_per_core_cpu"
+
+
+def test_falls_back_when_not_confident():
+    router = FastRouter()
+    router.ensure([METRICS, COMMAND], "v1")
+    assert routed_task(router, "メモリとCPU") is None  # 複数タスク
+    assert routed_task(router, "nginxを再起動して") is None  # 一致なし
+    assert routed_task(router, "cpuが急に高くなった原因を調べて") is None  # 余りが多い
+    assert routed_task(router, "履歴") is None  # 必須パラメータのあるタスクは対象外
+    assert routed_task(router, "top 20 processes") is None  # 省略可能なパラメータだけでも値を捨てないよう対象外
+    assert routed_task(router, "run command") is None
+    assert router.stats == {"routed": 0, "no_match": 4, "ambiguous": 1, "low_coverage": 1}
+
+
+def test_rebuilds_only_when_version_changes():
+    router = FastRouter()
+    router.ensure([METRICS], "v1")
+    router.ensure([METRICS], "v1")
+    assert router.builds == 1
+    router.ensure([], "v2")
+    assert router.builds == 2 and routed_task(router, "cpu") is None
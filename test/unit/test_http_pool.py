@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from http_pool import HttpClientPool
+
+
+def test_describe_reports_pool_state_and_tolerates_unknown_transports():
+    pool = HttpClientPool(extra_headers=lambda: {"X-Request-ID": "t1"})
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("X-Request-ID"))
+        return httpx.Response(200)
+
+    pool._clients["http://mock:1"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await pool.get("http://mock:1/x")
+        pool.client_for("http://real:2/")
+        described = pool.describe()
+        await pool.aclose()
+        return described
+
+    hosts = asyncio.run(scenario())["hosts"]
+    assert seen == ["t1"]
+    # 接続プールの内部構造を持たないトランスポートは null になる（例外にしない）
+    assert hosts["http://mock:1"] is None
+    assert hosts["http://real:2"] == {"open": 0, "idle": 0, "active": 0, "waiting": 0}
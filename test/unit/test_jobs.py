@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from jobs import InvalidCallbackUrl, JobManager, JobQueueFull, check_callback_url
+
+
+async def wait_for(predicate, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.001)
+
+
+def test_jobs_move_through_statuses_in_queue_order():
+    release = {}
+
+    async def runner(job):
+        await release[job.task].wait()
+        if job.task == "bad":
+            return {"error": "boom"}
+        return {"result": job.parameters}
+
+    async def scenario():
+        release.update(ok=asyncio.Event(), bad=asyncio.Event())
+        manager = JobManager(runner, workers=1, queue_size=2)
+        first = manager.submit("A", "ok", {"n": 1})
+        second = manager.submit("A", "bad", {})
+        with pytest.raises(JobQueueFull):
+            manager.submit("A", "ok", {})
+        manager.start()
+        await wait_for(lambda: first.status == "in_progress")
+        assert second.status == "queued"
+        release["ok"].set()
+        await wait_for(lambda: second.status == "in_progress")
+        release["bad"].set()
+        await wait_for(lambda: second.status == "failed")
+        await manager.stop()
+        return manager, first, second
+
+    manager, first, second = asyncio.run(scenario())
+    assert first.to_dict()["status"] == "completed" and first.result == {"n": 1}
+    assert second.error == "boom" and second.result == {"error": "boom"}
+    assert manager.stats["completed"] == 1 and manager.stats["failed"] == 1 and manager.stats["rejected"] == 1
+    assert manager.get(first.id) is first
+
+
+def test_stop_marks_running_job_cancelled_and_expire_drops_finished_jobs():
+    async def runner(job):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        manager = JobManager(runner, workers=1, retention=0)
+        job = manager.submit("A", "slow", {})
+        manager.start()
+        await wait_for(lambda: job.status == "in_progress")
+        await manager.stop()
+        return manager, job
+
+    manager, job = asyncio.run(scenario())
+    assert job.status == "failed" and job.error == "cancelled"
+    assert manager.expire() == 1 and manager.get(job.id) is None
+
+
+def test_check_callback_url():
+    allowed = ["hooks.example.com", "*.corp.example"]
+    assert check_callback_url("https://hooks.example.com/done", allowed) is None
+    assert check_callback_url("http://ci.corp.example:8080/x", allowed) is None
+    assert "not allowed" in check_callback_url("http://agent_registry_service:5002/agents", allowed)
+    assert "not allowed" in check_callback_url("http://169.254.169.254/latest", allowed)
+    assert "not allowed" in check_callback_url("http://corp.example.evil.com/", allowed)
+    assert "http(s)" in check_callback_url("file:///etc/passwd", allowed)
+    assert "credentials" in check_callback_url("http://u:p@hooks.example.com/", allowed)
+    assert "not allowed" in check_callback_url("https://hooks.example.com/", [])
+
+
+def run_with_webhook(status):
+    """
+    モックのWebhook受信先（status を返す）に通知させ、(ジョブ, マネージャ, 受信したリクエスト) を返す。
+    """
+    received = []
+
+    def handler(request):
+        received.append(request)
+        return httpx.Response(status)
+
+    async def runner(job):
+        return {"result": "done"}
+
+    async def scenario():
+        manager = JobManager(runner, workers=1, callback_hosts=["hooks.example.com"])
+        manager._callback_client = lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with pytest.raises(InvalidCallbackUrl):
+            manager.submit("A", "t", {}, callback_url="http://agent_registry_service:5002/agents")
+        job = manager.submit("A", "t", {}, callback_url="https://hooks.example.com/done")
+        manager.start()
+        await wait_for(lambda: job.webhook_status is not None)
+        await manager.stop()
+        return job, manager
+
+    job, manager = asyncio.run(scenario())
+    return job, manager, received
+
+
+def test_webhook_delivery_uses_a_plain_client():
+    job, manager, received = run_with_webhook(200)
+    assert job.webhook_status == "sent" and manager.stats["webhooks_sent"] == 1
+    assert str(received[0].url) == "https://hooks.example.com/done"
+    assert "x-request-id" not in received[0].headers
+    assert httpx.Response(200, content=received[0].content).json()["status"] == "completed"
+
+
+def test_webhook_failure_is_recorded():
+    job, manager, received = run_with_webhook(500)
+    assert job.status == "completed"
+    assert job.webhook_status.startswith("failed:") and manager.stats["webhooks_failed"] == 1
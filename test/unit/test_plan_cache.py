@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from plan_cache import PlanCache, normalize_user_input
+
+
+def test_normalize_user_input():
+    assert normalize_user_input("CPU使用率は？") == normalize_user_input("cpu使用率は?")
+    assert normalize_user_input("ＣＰＵ　　メトリクス") == "cpu メトリクス"
+
+
+def test_normalize_user_input_keeps_argument_punctuation():
+    # 文中の記号・空白の違いはパラメータの違いなので、別の計画としてキャッシュする
+    assert normalize_user_input("/tmp/a-b を表示") != normalize_user_input("/tmp/ab を表示")
+    assert normalize_user_input("file_a を開いて") != normalize_user_input("filea を開いて")
+    assert normalize_user_input("ls -l x を実行") != normalize_user_input("ls -lx を実行")
+
+
+def test_plan_cache_hit_and_version_invalidation():
+    cache = PlanCache(max_size=10, ttl=60)
+    plan = {"agent": "LinuxMetricsAIAgent", "task": "get_cpu_metrics", "parameters": {}}
+    cache.set("CPU使用率は？", "v1", plan)
+    cached = cache.get("cpu使用率は?", "v1")
+    assert cached == plan
+    cached["parameters"]["x"] = 1
+    assert cache.get("cpu使用率は?", "v1") == plan
+    # tasksが変わりバージョンが変わると古い計画は破棄される
+    assert cache.get("cpu使用率は?", "v2") is None
+    assert cache.describe()["invalidations"] == 1
@@ -0,0 +1,83 @@
+import asyncio
+
+AGENTS = [{
+    "name": "A", "description": "", "capabilities": [], "endpoint": "http://a:1", "status": "active",
+    "tasks": [{"type": "ok", "parameters": {}}, {"type": "fail", "parameters": {}}],
+}]
+
+
+def step(step_id, task="ok", depends_on=()):
+    return {"id": step_id, "agent": "A", "task": task, "parameters": {}, "depends_on": list(depends_on)}
+
+
+def stub_steps(server, delay=0.0):
+    """
+    _run_step を差し替え、"fail" タスクは失敗させ、同時に実行中のステップ数の最大を記録する。
+    """
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def run_step(agent_info, task_def, parameters):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            state["in_flight"] -= 1
+        if task_def["type"] == "fail":
+            return {"error": "boom"}
+        return {"result": task_def["type"]}
+
+    server._run_step = run_step
+    return state
+
+
+def test_validate_dag_rejects_malformed_plans(super_app):
+    validate = super_app.SuperAgentServer._validate_dag
+    assert validate([step("s1"), step("s2", depends_on=["s1"])]) is None
+    assert "non-empty" in validate([])
+    assert "'id'" in validate([{"agent": "A"}])
+    assert "Duplicate" in validate([step("s1"), step("s1")])
+    assert "unknown steps: ['s9']" in validate([step("s1", depends_on=["s9"])])
+    assert "cycle" in validate([step("s1", depends_on=["s3"]), step("s2", depends_on=["s1"]),
+                                step("s3", depends_on=["s2"])])
+    assert "cycle" in validate([step("s1", depends_on=["s1"])])
+
+
+def test_failure_skips_dependents_but_not_independent_branches(make_server):
+    server = make_server(AGENTS)
+    stub_steps(server)
+    events = []
+
+    async def emit(event, data):
+        events.append((event, data["id"], data.get("status")))
+
+    plan = {"steps": [step("s1", "fail"), step("s2", depends_on=["s1"]), step("s3", depends_on=["s2"]),
+                      step("s4"), step("s5", depends_on=["s4"])]}
+    result = asyncio.run(server.execute_plan(plan, emit))
+    statuses = {i: r["status"] for i, r in result["steps"].items()}
+    assert statuses == {"s1": "ERROR", "s2": "SKIPPED", "s3": "SKIPPED", "s4": "SUCCESS", "s5": "SUCCESS"}
+    assert result["succeeded"] == 2 and result["failed"] == 3
+    assert "s1" in result["steps"]["s2"]["error"] and "s2" in result["steps"]["s3"]["error"]
+    # スキップされたステップは開始されず、依存先は親の終了後に開始される
+    assert ("step_started", "s2", None) not in events
+    assert events.index(("step_finished", "s4", "SUCCESS")) < events.index(("step_started", "s5", None))
+
+
+def test_independent_steps_respect_step_concurrency(monkeypatch, super_app, make_server):
+    monkeypatch.setattr(super_app, "PLAN_STEP_CONCURRENCY", 2)
+    server = make_server(AGENTS)
+    state = stub_steps(server, delay=0.02)
+    plan = {"steps": [step(f"s{i}") for i in range(5)]}
+    result = asyncio.run(server.execute_plan(plan))
+    assert result["succeeded"] == 5
+    assert state["max_in_flight"] == 2
+
+
+def test_invalid_steps_fail_before_any_call(make_server):
+    server = make_server(AGENTS)
+    state = stub_steps(server)
+    result = asyncio.run(server.execute_plan({"steps": [step("s1"), {**step("s2"), "agent": "Missing"}]}))
+    assert result == {"error": "Step 's2': Agent 'Missing' not found"}
+    assert asyncio.run(server.execute_plan({"steps": [step("s1", depends_on=["s1"])]})) == {
+        "error": "Plan steps contain a dependency cycle"}
+    assert state["max_in_flight"] == 0
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+AGENTS = [{
+    "name": "LinuxMetricsAIAgent", "description": "metrics", "capabilities": ["get_cpu_metrics"],
+    "endpoint": "http://m:1", "status": "active",
+    "tasks": [{"type": "get_cpu_metrics", "parameters": {}}],
+}]
+PLAN = '{"agent": "LinuxMetricsAIAgent", "task": "get_cpu_metrics", "parameters": {}}'
+
+
+class StubModel:
+    """
+    genai.GenerativeModel の代役。delay 秒待って PLAN を返し、同時に実行中の呼び出し数の最大を記録する。
+    """
+    delay = 0.0
+    in_flight = 0
+    max_in_flight = 0
+
+    def __init__(self, name):
+        pass
+
+    def start_chat(self, history=None):
+        return self
+
+    async def send_message_async(self, prompt):
+        cls = type(self)
+        cls.in_flight += 1
+        cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            await asyncio.sleep(cls.delay)
+        finally:
+            cls.in_flight -= 1
+        return SimpleNamespace(text=PLAN, usage_metadata=None)
+
+
+def stub_model(monkeypatch, super_app, delay):
+    model = type("Model", (StubModel,), {"delay": delay})
+    monkeypatch.setattr(super_app.genai, "GenerativeModel", model)
+    return model
+
+
+def test_plan_concurrency_is_bounded(monkeypatch, super_app, make_server):
+    monkeypatch.setattr(super_app, "PLAN_CONCURRENCY", 2)
+    model = stub_model(monkeypatch, super_app, 0.02)
+    server = make_server(AGENTS)
+
+    async def scenario():
+        return await asyncio.gather(*(server.generate_plan(f"cpu {i}", AGENTS) for i in range(6)))
+
+    results = asyncio.run(scenario())
+    assert all(err is None and plan["task"] == "get_cpu_metrics" for plan, err in results)
+    assert model.max_in_flight == 2
+    assert server.plan_stats["calls"] == 6
+    assert server.plan_stats["in_flight"] == 0 and server.plan_stats["waiting"] == 0
+
+
+def test_plan_timeout_releases_the_slot(monkeypatch, super_app, make_server):
+    monkeypatch.setattr(super_app, "PLAN_CONCURRENCY", 1)
+    monkeypatch.setattr(super_app, "PLAN_TIMEOUT", 0.05)
+    model = stub_model(monkeypatch, super_app, 1.0)
+    server = make_server(AGENTS)
+
+    async def scenario():
+        first = await server.generate_plan("cpu", AGENTS)
+        model.delay = 0
+        return first, await server.generate_plan("cpu", AGENTS)
+
+    (plan, err), (second, second_err) = asyncio.run(scenario())
+    assert plan is None and "timed out" in err
+    assert server.plan_stats["timeouts"] == 1 and server.plan_stats["in_flight"] == 0
+    # タイムアウトした呼び出しの枠は解放され、次の計画生成は待たされない
+    assert second_err is None and second["agent"] == "LinuxMetricsAIAgent"
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/linux_metrics_ai_agent"))
+
+from proc_collector import ProcCollector, cpu_percentages
+
+MEMINFO = "MemTotal: 1000 kB\nMemFree: 100 kB\nMemAvailable: 400 kB\nSwapTotal: 50 kB\nSwapFree: 20 kB\n"
+
+
+def write(path, text):
+    # 同じinodeに上書きする（開いたままのfdから読み直せることを確認するため）
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_cpu_percentages_from_delta():
+    prev = [100, 0, 100, 700, 100, 0, 0, 0]
+    cur = [150, 0, 150, 750, 150, 0, 0, 0]
+    assert cpu_percentages(prev, cur) == {"cpu_usage": 50.0, "iowait": 25.0, "steal": 0.0}
+
+
+def test_sample_reuses_handles_and_computes_deltas(tmp_path):
+    write(tmp_path / "stat", "cpu  100 0 100 800 0 0 0 0 0 0\ncpu0 100 0 100 800 0 0 0 0 0 0\n")
+    write(tmp_path / "meminfo", MEMINFO)
+    collector = ProcCollector(proc_root=str(tmp_path), disk_paths=[str(tmp_path)])
+    first = collector.sample()
+    assert first["cpu"]["cpu_usage"] == 20.0
+    assert first["memory"]["memory_usage"] == 60.0
+    assert first["memory"]["swap_used_kb"] == 30
+    assert 0 <= first["disk"][str(tmp_path)]["disk_usage"] <= 100
+
+    write(tmp_path / "stat", "cpu  190 0 110 900 0 0 0 0 0 0\ncpu0 190 0 110 900 0 0 0 0 0 0\n")
+    second = collector.sample()
+    assert second["cpu"]["cpu_usage"] == 50.0
+    assert second["cpu_cores"] == [{"core": 0, "cpu_usage": 50.0, "iowait": 0.0, "steal": 0.0}]
+    assert collector.get() is second
+    collector.close()
@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/linux_metrics_ai_agent"))
+
+import process_scanner
+from process_scanner import ProcessScanner, parse_pid_stat
+
+
+def write_pid(root, pid, ticks, starttime=100, comm="worker"):
+    pid_dir = root / str(pid)
+    pid_dir.mkdir(exist_ok=True)
+    (pid_dir / "stat").write_text(
+        f"{pid} ({comm}) S 1 1 1 0 -1 0 0 0 0 0 {ticks} 0 0 0 20 0 3 0 {starttime} 1000 25 " + "0 " * 20)
+    (pid_dir / "cmdline").write_bytes(f"/bin/{comm}\0--pid\0{pid}\0".encode())
+
+
+def test_parse_pid_stat_handles_spaces_and_parens_in_comm():
+    data = b"42 (a (b) c) R 1 1 1 0 -1 0 0 0 0 0 7 3 0 0 20 0 2 0 500 1000 9 0"
+    assert parse_pid_stat(data) == ("a (b) c", "R", 10, 2, 500, 9)
+
+
+def test_scan_computes_deltas_and_tracks_pid_reuse(tmp_path, monkeypatch):
+    (tmp_path / "uptime").write_text("1000.0 0\n")
+    write_pid(tmp_path, 1, ticks=0)
+    write_pid(tmp_path, 2, ticks=0, comm="busy")
+    scanner = ProcessScanner(proc_root=str(tmp_path))
+    clock = iter([10.0, 12.0, 14.0])
+    monkeypatch.setattr(process_scanner.time, "monotonic", lambda: next(clock))
+    scanner.scan()
+
+    # 2秒間に pid 2 が1秒分（CLK_TCK ティック）CPUを使った
+    write_pid(tmp_path, 2, ticks=process_scanner.CLK_TCK, comm="busy")
+    scanner.scan()
+    top = scanner.top("cpu", 1)
+    assert top["total"] == 2
+    assert top["processes"][0]["pid"] == 2
+    assert top["processes"][0]["cpu_percent"] == 50.0
+    assert top["processes"][0]["cmdline"] == "/bin/busy --pid 2"
+
+    # pid 1 が終了し、pid 2 が別プロセスとして再利用された
+    (tmp_path / "1" / "stat").unlink()
+    write_pid(tmp_path, 2, ticks=0, starttime=99000, comm="new")
+    records = scanner.scan()
+    assert [r["name"] for r in records] == ["new"]
+    assert records[0]["rss_kb"] == 25 * process_scanner.PAGE_SIZE_KB
+    assert "error" in scanner.top("io")
+
+
+def test_top_validates_and_clamps_limit(tmp_path):
+    (tmp_path / "uptime").write_text("1000.0 0\n")
+    for pid in range(1, 6):
+        write_pid(tmp_path, pid, ticks=pid)
+    scanner = ProcessScanner(proc_root=str(tmp_path), limit_max=3)
+    scanner.scan()
+    assert "error" in scanner.top("cpu", "ten")
+    assert "error" in scanner.top("cpu", None)
+    assert "error" in scanner.top("cpu", float("inf"))
+    assert len(scanner.top("cpu", "2")["processes"]) == 2
+    assert len(scanner.top("cpu", 10 ** 9)["processes"]) == 3
+    assert len(scanner.top("rss", -5)["processes"]) == 1
+
+
+def test_first_query_waits_for_running_scan(tmp_path, monkeypatch):
+    (tmp_path / "uptime").write_text("1000.0 0\n")
+    write_pid(tmp_path, 1, ticks=1)
+    scanner = ProcessScanner(proc_root=str(tmp_path))
+    scan = scanner._scan
+    active = []
+
+    def slow_scan():
+        active.append(len(active))
+        assert active[-1] == 0, "scans overlapped"
+        time.sleep(0.1)
+        try:
+            return scan()
+        finally:
+            active.clear()
+
+    monkeypatch.setattr(scanner, "_scan", slow_scan)
+    background = threading.Thread(target=scanner.scan)
+    background.start()
+    time.sleep(0.02)
+    top = scanner.top("cpu", 5)
+    background.join()
+    assert top["total"] == 1 and scanner.scans == 1
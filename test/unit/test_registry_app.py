@@ -0,0 +1,88 @@
+import asyncio
+import inspect
+
+import httpx
+
+
+def registration(name, endpoint="http://a:1", **extra):
+    return {"artifactID": f"test.local/{name}", "name": name, "description": "d",
+            "capabilities": ["get_cpu_metrics"], "endpoint": endpoint,
+            "tasks": [{"type": "get_cpu_metrics", "parameters": {}}], **extra}
+
+
+async def request(app, method, path, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://registry") as client:
+        return await client.request(method, path, **kwargs)
+
+
+def test_reads_run_on_the_event_loop(registry_app):
+    # スレッドプールで動くと、イベントループ上の書き込みと agents / index を同時に触ってしまう
+    assert inspect.iscoroutinefunction(registry_app.list_agents)
+    assert inspect.iscoroutinefunction(registry_app.get_agent)
+
+
+def test_reads_stay_consistent_with_concurrent_writes(registry_app):
+    app = registry_app.app
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://registry") as client:
+            async def churn(i):
+                agent = registration(f"Churn{i}")
+                await client.post("/agents", json=agent)
+                await client.delete(f"/agents/{agent['artifactID']}")
+
+            async def read(i):
+                return await client.get("/agents", params={"capability": "get_cpu_metrics", "fields": "name"})
+
+            return await asyncio.gather(*(churn(i) for i in range(30)), *(read(i) for i in range(30)))
+
+    responses = [r for r in asyncio.run(scenario()) if r is not None]
+    assert responses and all(r.status_code == 200 for r in responses)
+
+    async def conditional():
+        await request(app, "POST", "/agents", json=registration("Cond"))
+        first = await request(app, "GET", "/agents/test.local/Cond")
+        again = await request(app, "GET", "/agents/test.local/Cond", headers={"If-None-Match": first.headers["ETag"]})
+        return first, again
+
+    first, again = asyncio.run(conditional())
+    assert first.json()["name"] == "Cond" and again.status_code == 304
+
+
+def test_heartbeat_rejects_malformed_body(registry_app):
+    app = registry_app.app
+
+    async def scenario():
+        await request(app, "POST", "/agents", json=registration("Beat"))
+        path = "/agents/test.local/Beat/heartbeat"
+        return [(await request(app, "POST", path, content=body)).status_code
+                for body in (b"{not json", b"[1]", b'{"endpoint": 1}', b'{"endpoint": "http://a:1"}', b"")]
+
+    assert asyncio.run(scenario()) == [400, 400, 400, 200, 200]
+
+
+def test_sweep_prunes_instances_expired_for_too_long(registry_app, monkeypatch):
+    app = registry_app.app
+    monkeypatch.setattr(registry_app, "LEASE_PRUNE_AFTER", 60)
+
+    async def scenario():
+        await request(app, "POST", "/agents", json=registration("Prune", endpoint="http://p:1"))
+        await request(app, "POST", "/agents", json=registration("Prune", endpoint="http://p:2"))
+        await request(app, "POST", "/agents", json=registration("Solo", endpoint="http://s:1"))
+
+    asyncio.run(scenario())
+    now = registry_app.time.monotonic()
+    # p:1 と s:1 はリース期限から60秒以上、p:2 は期限切れ直後
+    registry_app.leases[("test.local/Prune", "http://p:1")] = now - 120
+    registry_app.leases[("test.local/Prune", "http://p:2")] = now - 1
+    registry_app.leases[("test.local/Solo", "http://s:1")] = now - 120
+    registry_app.leases[("test.local/Gone", "http://g:1")] = now - 120
+
+    registry_app.expire_leases()
+    assert registry_app.prune_leases() == 2
+
+    prune = registry_app.agents["test.local/Prune"]
+    assert [(i["endpoint"], i["status"]) for i in prune["instances"]] == [("http://p:2", "expired")]
+    assert "test.local/Solo" not in registry_app.agents
+    assert not any(agent_id in ("test.local/Solo", "test.local/Gone") for agent_id, _ in registry_app.leases)
+    assert asyncio.run(request(app, "GET", "/agents/test.local/Solo")).status_code == 404
@@ -0,0 +1,32 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/agent_registry_service"))
+
+from change_feed import ChangeFeed
+
+
+def test_since_returns_deltas_and_detects_gap():
+    feed = ChangeFeed(revision=10, history=2)
+    assert feed.since(10) == []
+    assert feed.since(5) is None
+    feed.record("register", "a", {"name": "A"})
+    feed.record("update", "a", {"name": "A2"})
+    feed.record("delete", "a", None)
+    assert [c["op"] for c in feed.since(11)] == ["update", "delete"]
+    # 履歴2件より古いリビジョンからは差分を復元できない
+    assert feed.since(10) is None
+
+
+def test_wait_wakes_on_change_and_times_out():
+    async def scenario():
+        feed = ChangeFeed()
+        assert await feed.wait(0, timeout=0.01) == []
+        waiter = asyncio.ensure_future(feed.wait(0, timeout=5))
+        await asyncio.sleep(0)
+        feed.record("register", "a", {"name": "A"})
+        changes = await waiter
+        assert [c["revision"] for c in changes] == [1]
+
+    asyncio.run(scenario())
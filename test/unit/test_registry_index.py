@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/agent_registry_service"))
+
+from registry_index import RegistryIndex
+
+
+def agent(name, capabilities, tasks):
+    return {"name": name, "capabilities": capabilities, "tasks": [{"type": t} for t in tasks]}
+
+
+def test_query_and_maintenance_on_update_and_delete():
+    index = RegistryIndex()
+    index.add("dom/metrics", agent("Metrics", ["get_cpu_metrics"], ["get_cpu_metrics", "list_metrics"]))
+    index.add("dom/command", agent("Command", ["run_command"], ["run_command"]))
+    assert index.query(task="list_metrics") == {"dom/metrics"}
+    assert index.query(capability="run_command", name="Command") == {"dom/command"}
+    assert index.query() is None
+    # 再登録で古い索引が消える
+    index.add("dom/metrics", agent("Metrics", ["get_cpu_metrics"], ["get_cpu_metrics"]))
+    assert index.query(task="list_metrics") == set()
+    index.remove("dom/command")
+    assert index.query(name="Command") == set()
+    assert index.sorted_ids == ["dom/metrics"]
+
+
+def test_page_with_cursor():
+    index = RegistryIndex()
+    for i in range(5):
+        index.add(f"a{i}", agent(f"A{i}", ["x"], []))
+    page, last = index.page(None, None, 2)
+    assert page == ["a0", "a1"] and last == "a1"
+    page, last = index.page(None, last, 2)
+    assert page == ["a2", "a3"] and last == "a3"
+    page, last = index.page(index.query(capability="x"), "a3", 2)
+    assert page == ["a4"] and last is None
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from http_pool import HttpClientPool
+from registry_snapshot import RegistrySnapshot
+
+REGISTRY = "http://registry:5002"
+
+
+class FakeRegistry:
+    """
+    ETag（リビジョン）付きで /agents を返し、If-None-Match が一致すれば 304 を返すレジストリの代役。
+    """
+    def __init__(self, agents):
+        self.agents = agents
+        self.revision = 1
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        etag = f'"{self.revision}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, json=self.agents, headers={"ETag": etag})
+
+    def update(self, agents):
+        self.agents = agents
+        self.revision += 1
+
+
+def make_snapshot(registry):
+    http = HttpClientPool()
+    http._clients[REGISTRY] = httpx.AsyncClient(transport=httpx.MockTransport(registry.handler))
+    return RegistrySnapshot(REGISTRY, http)
+
+
+def agent(name, description="d", status="active", endpoint="http://a:1"):
+    return {"artifactID": f"x/{name}", "name": name, "description": description, "capabilities": [],
+            "tasks": [{"type": "t"}], "endpoint": endpoint, "status": status}
+
+
+def test_refresh_uses_etag_and_skips_unchanged_registry():
+    registry = FakeRegistry([agent("A")])
+    snapshot = make_snapshot(registry)
+
+    async def scenario():
+        assert await snapshot.refresh() is True
+        assert await snapshot.refresh() is False
+        await snapshot.http.aclose()
+
+    asyncio.run(scenario())
+    assert "If-None-Match" not in registry.requests[0].headers
+    assert registry.requests[1].headers["If-None-Match"] == '"1"'
+    assert snapshot.version == '"1"'
+    assert snapshot.find_task("A", "t") == {"type": "t"}
+    assert snapshot.stats["not_modified"] == 1 and snapshot.stats["changes"] == 1
+
+
+def test_profile_version_ignores_liveness_fields_but_tracks_profiles():
+    registry = FakeRegistry([agent("A"), agent("B")])
+    snapshot = make_snapshot(registry)
+
+    async def scenario():
+        await snapshot.refresh()
+        first = snapshot.profile_version
+        # endpoint だけが変わった場合はバージョンは変わるが、計画に影響しないので profile_version は同じ
+        registry.update([agent("A", endpoint="http://a:2"), agent("B")])
+        assert await snapshot.refresh() is True
+        same = snapshot.profile_version
+        # リース切れのエージェントは計画の候補から外れるので profile_version が変わる
+        registry.update([agent("A"), agent("B", status="expired")])
+        await snapshot.refresh()
+        expired = snapshot.profile_version
+        registry.update([agent("A", description="changed"), agent("B", status="expired")])
+        await snapshot.refresh()
+        await snapshot.http.aclose()
+        return first, same, expired, snapshot.profile_version
+
+    first, same, expired, changed = asyncio.run(scenario())
+    assert snapshot.version == '"4"'
+    assert first == same
+    assert len({first, expired, changed}) == 3
+    assert [a["name"] for a in snapshot.live_agents] == ["A"]
@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/agent_registry_service"))
+
+from storage import JournalStore, SqliteStore, migrate_legacy_file
+
+
+def test_journal_store_recovers_and_ignores_torn_tail(tmp_path):
+    store = JournalStore(str(tmp_path), compact_min_entries=4)
+    store.load()
+    for i in range(5):
+        store.put(f"a{i}", {"name": f"A{i}"})
+    store.delete("a0")
+    store.close()
+    # 書き込み途中でクラッシュした末尾行を模擬
+    with open(tmp_path / "agents.journal", "ab") as f:
+        f.write(b'{"op":"put","id":"broken"')
+    reopened = JournalStore(str(tmp_path), compact_min_entries=4)
+    assert sorted(reopened.load()) == ["a1", "a2", "a3", "a4"]
+    reopened.put("a5", {"name": "A5"})
+    reopened.close()
+    assert sorted(JournalStore(str(tmp_path)).load()) == ["a1", "a2", "a3", "a4", "a5"]
+
+
+def test_sqlite_store_roundtrip(tmp_path):
+    store = SqliteStore(str(tmp_path / "agents.db"))
+    store.put("a", {"name": "A"})
+    store.put("b", {"name": "B"})
+    store.delete("a")
+    store.close()
+    assert SqliteStore(str(tmp_path / "agents.db")).load() == {"b": {"name": "B"}}
+
+
+def test_legacy_migration_assigns_increasing_revisions(tmp_path):
+    legacy = tmp_path / "agents.json"
+    legacy.write_text(json.dumps({"x/A": {"name": "A"}, "x/B": {"name": "B"}}))
+    store = SqliteStore(str(tmp_path / "agents.db"))
+    agents = migrate_legacy_file(store, store.load(), str(legacy))
+    assert sorted(agents) == ["x/A", "x/B"]
+    assert store.revision == 2
+    store.close()
+    reopened = SqliteStore(str(tmp_path / "agents.db"))
+    assert reopened.load() == agents and reopened.revision == 2
+    reopened.close()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+AGENTS = [{
+    "name": "A", "description": "", "capabilities": [], "endpoint": "http://a:1", "status": "active",
+    "tasks": [{"type": "ok", "parameters": {}}, {"type": "slow", "parameters": {}}],
+}]
+
+
+def install_server(monkeypatch, super_app, make_server, plan):
+    """
+    計画生成とAIAgent呼び出しを差し替えたサーバをモジュールの super_agent に据える。
+    "slow" タスクはキャンセルされるまで待ち、開始・キャンセルを state に記録する。
+    """
+    monkeypatch.setattr(super_app, "FAST_ROUTER_ENABLED", False)
+    monkeypatch.setattr(super_app, "DISCONNECT_POLL_INTERVAL", 0.01)
+    server = make_server(AGENTS)
+    state = {"started": None, "cancelled": None}
+
+    async def generate_plan(user_input, agents):
+        return plan, None
+
+    async def run_step(agent_info, task_def, parameters):
+        if task_def["type"] != "slow":
+            return {"result": {"task": task_def["type"]}}
+        state["started"].set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"].set()
+            raise
+        return {"result": None}
+
+    server.generate_plan = generate_plan
+    server._run_step = run_step
+    monkeypatch.setattr(super_app, "super_agent", server)
+    return state
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_emits_events_in_order(monkeypatch, super_app, make_server):
+    plan = {"steps": [{"id": "s1", "agent": "A", "task": "ok"}, {"id": "s2", "agent": "A", "task": "ok",
+                                                                  "depends_on": ["s1"]}]}
+    install_server(monkeypatch, super_app, make_server, plan)
+    resp = TestClient(super_app.app).post("/request/stream", json={"user_input": "x"})
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(resp.text)
+    assert [e for e, _ in events] == ["accepted", "registry", "plan", "step_started", "step_finished",
+                                      "step_started", "step_finished", "result"]
+    assert events[2][1] == {"plan": plan, "cached": False, "route": "llm"}
+    assert [d["id"] for e, d in events if e.startswith("step_")] == ["s1", "s1", "s2", "s2"]
+    assert events[-1][1]["status"] == "SUCCESS"
+
+
+async def call_until_disconnect(app, path, state):
+    """
+    ASGIアプリを直接呼び、"slow" ステップが始まった時点でクライアント切断（http.disconnect）を送る。
+    """
+    state["started"], state["cancelled"] = asyncio.Event(), asyncio.Event()
+    disconnected = asyncio.Event()
+    pending = [{"type": "http.request", "body": json.dumps({"user_input": "x"}).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+             "client": ("test", 1), "server": ("test", 80)}
+    call = asyncio.create_task(app(scope, receive, send))
+    await asyncio.wait_for(state["started"].wait(), 2)
+    disconnected.set()
+    await asyncio.wait_for(call, 2)
+    await asyncio.wait_for(state["cancelled"].wait(), 2)
+    return b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+
+
+def test_disconnect_cancels_streaming_request(monkeypatch, super_app, make_server):
+    state = install_server(monkeypatch, super_app, make_server, {"agent": "A", "task": "slow", "parameters": {}})
+    body = asyncio.run(call_until_disconnect(super_app.app, "/request/stream", state))
+    events = [e for e, _ in parse_sse(body.decode())]
+    assert events == ["accepted", "registry", "plan", "step_started"]
+
+
+def test_disconnect_cancels_plain_request(monkeypatch, super_app, make_server):
+    state = install_server(monkeypatch, super_app, make_server, {"agent": "A", "task": "slow", "parameters": {}})
+    body = asyncio.run(call_until_disconnect(super_app.app, "/request", state))
+    assert json.loads(body)["status"] == "CANCELLED"
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import random
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from balancer import LoadBalancer
+from coalescer import CallCoalescer
+from resilience import AgentCaller, CircuitBreaker
+
+
+AGENT = {
+    "name": "LinuxMetricsAIAgent",
+    "endpoint": "http://a:5004",
+    "instances": [
+        {"endpoint": "http://a:5004", "status": "active"},
+        {"endpoint": "http://b:5004", "status": "active"},
+    ],
+}
+TASK = {"type": "get_cpu_metrics", "parameters": {}, "idempotent": True}
+
+
+class FakeHttp:
+    """
+    endpointごとに (遅延秒, HTTPステータス or 例外) を返す HttpClientPool の代役。
+    """
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+
+    def timeout_for(self, agent_info, task_def=None):
+        return None
+
+    async def post(self, url, json=None, timeout=None):
+        endpoint = url.rsplit("/run", 1)[0]
+        self.calls.append(endpoint)
+        delay, outcome = self.behaviour[endpoint]
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={"from": endpoint})
+
+
+def make_caller(behaviour, **kwargs):
+    http = FakeHttp(behaviour)
+    caller = AgentCaller(http, LoadBalancer(rng=random.Random(0)), backoff_base=0, rng=random.Random(0), **kwargs)
+    return caller, http
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_idempotent_task_retries_on_other_replica():
+    caller, http = make_caller({"http://a:5004": (0, httpx.ConnectError("down")), "http://b:5004": (0, 200)})
+    caller.balancer.observe("http://a:5004", 0.01)
+    caller.balancer.observe("http://b:5004", 1.0)
+    outcome = asyncio.run(caller.call(AGENT, TASK, {}))
+    assert outcome == {"result": {"from": "http://b:5004"}}
+    assert http.calls == ["http://a:5004", "http://b:5004"]
+    assert caller.stats["retries"] == 1
+
+
+def test_non_idempotent_task_is_not_retried_and_breaker_fails_fast():
+    single = {"name": "X", "endpoint": "http://a:5004"}
+    caller, http = make_caller({"http://a:5004": (0, 503)}, failure_threshold=2, reset_timeout=60)
+    task = {"type": "run_command", "parameters": {}}
+    for _ in range(2):
+        assert "error" in asyncio.run(caller.call(single, task, {}))
+    assert len(http.calls) == 2
+    outcome = asyncio.run(caller.call(single, task, {}))
+    assert "Circuit open" in outcome["error"]
+    assert len(http.calls) == 2
+    assert caller.describe()["breakers"]["http://a:5004"]["state"] == "open"
+
+
+def test_hedged_request_wins_on_fast_replica():
+    caller, http = make_caller({"http://a:5004": (0.5, 200), "http://b:5004": (0, 200)},
+                               hedge=True, hedge_min_samples=1)
+    caller._latency("LinuxMetricsAIAgent.get_cpu_metrics").add(0.01)
+    caller.balancer.observe("http://b:5004", 1.0)
+    outcome = asyncio.run(caller.call(AGENT, TASK, {}))
+    assert outcome == {"result": {"from": "http://b:5004"}}
+    assert caller.stats["hedges"] == 1 and caller.stats["hedge_wins"] == 1
+
+
+def test_unexpected_error_releases_half_open_trial():
+    single = {"name": "X", "endpoint": "http://a:5004"}
+    caller, http = make_caller({"http://a:5004": (0, KeyError("type"))}, failure_threshold=1, reset_timeout=0)
+    breaker = caller.breaker("http://a:5004")
+    breaker.record_failure()
+    task = {"type": "run_command", "parameters": {}}
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            asyncio.run(caller.call(single, task, {}))
+        assert breaker.state == "half_open" and breaker.available()
+    assert len(http.calls) == 2
+
+
+class BatchHttp(FakeHttp):
+    """
+    /run/batch を status で応答し、200 なら parameters の fail が真の要素だけエラーにする。
+    """
+    def __init__(self, status):
+        super().__init__({})
+        self.status = status
+
+    async def post(self, url, json=None, timeout=None):
+        self.calls.append(url)
+        if self.status != 200:
+            return httpx.Response(self.status)
+        return httpx.Response(200, json={"results": [
+            {"error": "boom"} if t["parameters"].get("fail") else {"result": t["parameters"]["n"]}
+            for t in json["tasks"]]})
+
+
+def make_coalescing_caller(status, **kwargs):
+    http = BatchHttp(status)
+    caller = AgentCaller(http, LoadBalancer(rng=random.Random(0)), backoff_base=0, rng=random.Random(0),
+                         coalescer=CallCoalescer(http, window=0.01), **kwargs)
+    return caller, http
+
+
+async def call_many(caller, agent, task, parameters):
+    return await asyncio.gather(*(caller.call(agent, task, p) for p in parameters))
+
+
+def test_batch_failure_counts_once_against_the_breaker():
+    single = {"name": "X", "endpoint": "http://a:5004"}
+    caller, http = make_coalescing_caller(503, failure_threshold=3)
+    task = {"type": "run_command", "parameters": {}}
+    outcomes = asyncio.run(call_many(caller, single, task, [{"n": i} for i in range(3)]))
+    assert all("error" in o for o in outcomes)
+    assert http.calls == ["http://a:5004/run/batch"]
+    breaker = caller.breaker("http://a:5004")
+    assert breaker.failures == 1 and breaker.state == "closed"
+
+
+def test_item_error_is_neither_retried_nor_counted():
+    single = {"name": "X", "endpoint": "http://a:5004"}
+    caller, http = make_coalescing_caller(200, failure_threshold=1)
+    outcomes = asyncio.run(call_many(caller, single, TASK, [{"n": 0}, {"n": 1, "fail": True}]))
+    assert outcomes[0] == {"result": 0}
+    assert "boom" in outcomes[1]["error"]
+    assert len(http.calls) == 1 and caller.stats["retries"] == 0
+    assert all(b.state == "closed" and b.failures == 0 for b in caller.breakers.values())
+
+
+def test_batch_client_error_does_not_trip_the_breaker():
+    single = {"name": "X", "endpoint": "http://a:5004"}
+    caller, http = make_coalescing_caller(422, failure_threshold=1)
+    outcomes = asyncio.run(call_many(caller, single, TASK, [{"n": 0}, {"n": 1}]))
+    assert all("HTTP 422" in o["error"] for o in outcomes)
+    assert len(http.calls) == 1 and caller.stats["retries"] == 0
+    assert caller.breaker("http://a:5004").state == "closed"
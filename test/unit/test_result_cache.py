@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/super_agent_server"))
+
+from result_cache import ResultCache, canonical_parameters
+
+CACHED = {"type": "get_cpu_metrics", "idempotent": True, "cache_ttl": 5}
+
+
+def make_call(counter, outcome=None, delay=0.0):
+    async def call():
+        counter.append(1)
+        await asyncio.sleep(delay)
+        return outcome if outcome is not None else {"result": {"n": len(counter)}}
+    return call
+
+
+def test_canonical_parameters_ignores_order_and_none():
+    assert canonical_parameters({"b": 1, "a": 2, "c": None}) == canonical_parameters({"a": 2, "b": 1})
+
+
+def test_hits_within_ttl_and_bypasses_uncacheable_tasks():
+    cache = ResultCache()
+    calls = []
+
+    async def scenario():
+        first = await cache.get_or_call("M", CACHED, {"x": 1}, make_call(calls))
+        first["result"]["n"] = 99  # 返り値を書き換えてもキャッシュに影響しない
+        second = await cache.get_or_call("M", CACHED, {"x": 1}, make_call(calls))
+        await cache.get_or_call("M", CACHED, {"x": 2}, make_call(calls))
+        await cache.get_or_call("M", {"type": "run", "idempotent": False, "cache_ttl": 5}, {}, make_call(calls))
+        await cache.get_or_call("M", {"type": "run", "idempotent": True}, {}, make_call(calls))
+        return second
+
+    assert asyncio.run(scenario()) == {"result": {"n": 1}}
+    assert len(calls) == 4
+    stats = cache.describe()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["bypassed"] == 2
+
+
+def test_concurrent_identical_calls_share_one_request_and_errors_are_not_cached():
+    cache = ResultCache()
+    calls = []
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_call("M", CACHED, {}, make_call(calls, delay=0.05))
+                                          for _ in range(10)))
+        failing = []
+        for _ in range(2):
+            await cache.get_or_call("M", {**CACHED, "type": "other"}, {}, make_call(failing, {"error": "boom"}))
+        return results, failing
+
+    results, failing = asyncio.run(scenario())
+    assert len(calls) == 1 and all(r == {"result": {"n": 1}} for r in results)
+    assert len(failing) == 2
+    stats = cache.describe()
+    assert stats["joined"] == 9 and stats["not_stored"] == 2 and stats["in_flight"] == 0
+
+
+def test_ttl_is_capped_and_size_is_bounded():
+    cache = ResultCache(max_size=2, max_ttl=0.05)
+    assert cache.ttl_of({**CACHED, "cache_ttl": 600}) == 0.05
+    calls = []
+
+    async def scenario():
+        for x in range(3):
+            await cache.get_or_call("M", CACHED, {"x": x}, make_call(calls))
+        await asyncio.sleep(0.06)
+        await cache.get_or_call("M", CACHED, {"x": 2}, make_call(calls))
+
+    asyncio.run(scenario())
+    assert len(calls) == 4
+    stats = cache.describe()
+    assert stats["size"] <= 2 and stats["evictions"] == 1 and stats["expirations"] == 1
+
+
+def test_error_bodies_returned_with_http_200_are_not_cached():
+    cache = ResultCache()
+    calls = []
+    failed = {"result": {"error": "Unknown metric: x"}}
+
+    async def scenario():
+        for _ in range(2):
+            assert await cache.get_or_call("M", CACHED, {"x": 1}, make_call(calls, failed)) == failed
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert cache.stats["stored"] == 0 and cache.stats["not_stored"] == 2
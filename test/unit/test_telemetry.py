@@ -0,0 +1,81 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/common"))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from telemetry import Histogram, _Metric, Telemetry, TelemetryMiddleware, trace_headers
+
+
+def make_app():
+    telemetry = Telemetry("svc", slow_request_ms=0)
+    app = FastAPI()
+    app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        async with telemetry.stage("lookup", item=item_id):
+            await asyncio.sleep(0)
+        return trace_headers()
+
+    @app.get("/boom")
+    def boom():
+        with telemetry.stage("explode"):
+            raise ValueError("boom")
+
+    return app, telemetry
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("latency_seconds", "help", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, stage="x")
+    lines = h.lines()
+    assert 'latency_seconds_bucket{stage="x",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="x",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="x",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="x"} 3' in lines
+
+
+def test_metric_without_lines_cannot_be_created():
+    class NoLines(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        NoLines("x", "help")
+
+def test_trace_id_is_propagated_and_spans_are_kept():
+    app, telemetry = make_app()
+    client = TestClient(app, raise_server_exceptions=False)
+    resp = client.get("/items/42", headers={"X-Request-ID": "trace-1"})
+    assert resp.json() == {"X-Request-ID": "trace-1"}
+    assert resp.headers["x-request-id"] == "trace-1"
+    assert client.get("/items/1").headers["x-request-id"] != "trace-1"  # 無ければ採番する
+    spans = client.get("/traces/trace-1").json()["spans"]
+    assert [s["stage"] for s in spans] == ["lookup", "http GET /items/{item_id}"]
+    assert spans[0]["item"] == "42"
+    assert client.get("/traces/unknown").status_code == 404
+
+
+def test_metrics_endpoint_reports_stages_errors_and_callbacks():
+    app, telemetry = make_app()
+    telemetry.callback("cache_events_total", "help", lambda: {"hits": 3, "misses": 1}, kind="counter", label="event")
+    client = TestClient(app, raise_server_exceptions=False)
+    client.get("/items/1")
+    assert client.get("/boom").status_code == 500
+    resp = client.get("/metrics")
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    assert "# TYPE stage_duration_seconds histogram" in text
+    assert 'stage_duration_seconds_count{stage="lookup",service="svc"} 1' in text
+    assert 'stage_errors_total{error="ValueError",stage="explode",service="svc"} 1' in text
+    # ルートはテンプレートで集計する
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200",service="svc"} 1' in text
+    assert 'http_requests_total{method="GET",route="/boom",status="500",service="svc"} 1' in text
+    assert 'http_requests_in_flight{service="svc"} 0' in text
+    assert 'cache_events_total{event="hits",service="svc"} 3' in text
@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src/linux_metrics_ai_agent"))
+
+from timeseries import MetricHistory, MetricSeries, RollupRing, parse_time
+
+
+def test_ring_overwrites_oldest_and_keeps_fixed_size():
+    ring = RollupRing(capacity=3)
+    size = ring.nbytes()
+    for t in range(5):
+        ring.add(float(t), float(t))
+    assert ring.size == 3 and ring.oldest() == 2.0
+    assert ring.bisect_left(3.0) == 1
+    assert ring.nbytes() == size
+
+
+def test_rollup_bucket_min_max_avg():
+    ring = RollupRing(capacity=10, bucket=10)
+    for t, v in ((100, 1.0), (105, 5.0), (109, 3.0), (110, 7.0)):
+        ring.add(float(t), v)
+    assert ring.size == 2
+    p = ring._pos(0)
+    assert (ring.ts[p], ring.min[p], ring.max[p], ring.sum[p] / ring.count[p]) == (100.0, 1.0, 5.0, 3.0)
+
+
+def test_query_uses_coarse_tier_for_long_ranges():
+    series = MetricSeries(raw_capacity=60, tiers=((10, 100), (60, 100)))
+    for t in range(0, 600):
+        series.add(float(t), float(t % 60))
+    # 生データは直近60秒分しか残らないので、10分間の問い合わせは集約段から返す
+    result = series.query(0.0, 599.0, 60)
+    assert result["resolution"] == 60
+    assert len(result["points"]) == 10
+    assert result["points"][0] == {"timestamp": 0.0, "min": 0.0, "max": 59.0, "avg": 29.5}
+    assert series.query(590.0, 599.0, 1)["resolution"] == 0
+
+
+def test_history_records_samples_and_parses_relative_times():
+    history = MetricHistory()
+    sample = {"timestamp": 1000.0, "cpu": {"cpu_usage": 10.0, "iowait": 1.0},
+              "memory": {"memory_usage": 50.0, "swap_used_kb": 0}, "disk": {"/": {"disk_usage": 20.0}}}
+    history.record(sample)
+    assert "disk_usage:/" in history.describe()["metrics"]
+    assert "error" in history.query("unknown")
+    assert parse_time("-1h", 10000.0) == 6400.0
+    assert parse_time(-60, 10000.0) == 9940.0
+    assert parse_time("5000", 10000.0) == 5000.0
+
+
+def test_query_returns_error_for_unparseable_parameters():
+    history = MetricHistory()
+    history.record({"timestamp": 1000.0, "cpu": {"cpu_usage": 10.0, "iowait": 1.0},
+                    "memory": {"memory_usage": 50.0, "swap_used_kb": 0}, "disk": {}})
+    for kwargs in ({"start": "yesterday"}, {"end": "-1x"}, {"start": "nan"}, {"step": "5 minutes"},
+                   {"step": "inf"}, {"step": [60]}):
+        assert "error" in history.query("cpu_usage", **kwargs), kwargs
+    assert history.query("cpu_usage", start=1, end=2000, step="60")["step"] == 60.0